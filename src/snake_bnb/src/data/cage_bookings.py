@@ -0,0 +1,34 @@
+import mongoengine
+
+
+class CageBooking(mongoengine.Document):
+    """
+        A booking stored in its own collection rather than embedded in Cage.bookings.
+        Used when MongoConfig.separate_bookings is set (see data.mongo_setup).
+    """
+    cage_id = mongoengine.ObjectIdField(required=True)
+
+    guest_owner_id = mongoengine.ObjectIdField()
+    guest_snake_id = mongoengine.ObjectIdField()
+
+    booked_date = mongoengine.DateTimeField()
+    check_in_date = mongoengine.DateTimeField(required=True)
+    check_out_date = mongoengine.DateTimeField(required=True)
+
+    review = mongoengine.StringField()
+    rating = mongoengine.IntField(default=0)
+
+    meta = {
+        'db_alias': 'core',
+        'collection': 'bookings',
+        'auto_create_index': False,
+        'indexes': [
+            ('cage_id', 'check_in_date', 'check_out_date'),
+            'guest_owner_id',
+        ]
+    }
+
+    @property
+    def duration_in_days(self):
+        dt = self.check_out_date - self.check_in_date
+        return dt.days
@@ -16,7 +16,28 @@ class Cage(mongoengine.Document):
 
     bookings = mongoengine.EmbeddedDocumentListField(Booking)
 
+    # Free-day bitmap kept when MongoConfig.day_calendar is on (see services.day_calendar).
+    calendar_start = mongoengine.DateTimeField()
+    free_days = mongoengine.BinaryField()
+
+    # Stamped by every availability change so other processes know to re-read the
+    # cage (see services.availability.ChangeTracker).
+    availability_updated = mongoengine.DateTimeField()
+    availability_version = mongoengine.IntField(default=0)
+
+    # Held while a merge rewrites the cage's bookings collection records
+    # (services.data_service._cage_lease).
+    merge_lease = mongoengine.ObjectIdField()
+    merge_lease_expires = mongoengine.DateTimeField()
+
     meta = {
         'db_alias': 'core',
-        'collection': 'cages'
+        'collection': 'cages',
+        'auto_create_index': False,
+        'indexes': [
+            ('bookings.check_in_date', 'bookings.check_out_date'),
+            'bookings.guest_owner_id',
+            ('price', '-square_meters'),
+            'availability_updated',
+        ]
     }
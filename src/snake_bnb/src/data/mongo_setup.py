@@ -1,5 +1,207 @@
+import dataclasses
+import os
+from typing import List, Optional
+
 import mongoengine
+from pymongo import ReadPreference
+
+from data.cage_bookings import CageBooking
+from data.cages import Cage
+from data.owner_summaries import OwnerSummary
+from data.owners import Owner
+from data.snakes import Snake
+from infrastructure import command_stats
+
+CORE_ALIAS = 'core'
+SEARCH_ALIAS = 'search'
+
+# When True, bookings live in the top-level 'bookings' collection (data.cage_bookings)
+# instead of being embedded in each cage document.
+use_bookings_collection = False
+
+# When True, each cage also stores a per-day free bitmap (services.day_calendar)
+# that availability searches use to find candidate cages.
+use_day_calendar = False
+
+# When True, cage searches and listings fetch RawBSONDocuments so each cage's
+# embedded bookings stay undecoded until read (see data.views.CageView).
+use_lazy_bookings = False
+
+# When True, data_service keeps a per-owner dashboard summary (services.owner_summary)
+# current with each write.
+use_owner_summaries = False
+
+# When True, services.data_service keeps everything in services.memory_backend
+# and no connection is registered (MongoConfig.backend = 'memory').
+use_memory_backend = False
+
+# Alias that availability searches read through; global_init points it at
+# SEARCH_ALIAS when MongoConfig.search_read_preference is set.
+search_alias = CORE_ALIAS
+
+_read_preferences = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+@dataclasses.dataclass
+class MongoConfig:
+    """
+        Client settings for the 'core' alias. Anything left as None uses the pymongo default.
+        MongoConfig.from_env() reads the same settings from SNAKE_BNB_* environment variables.
+    """
+    # 'mongo', or 'memory' for the in-process store used offline (nothing is persisted).
+    backend: str = 'mongo'
+
+    name: str = 'snake_bnb'
+    host: str = 'localhost'
+    port: int = 27017
+
+    max_pool_size: Optional[int] = None
+    min_pool_size: Optional[int] = None
+    max_idle_time_ms: Optional[int] = None
+    connect_timeout_ms: Optional[int] = None
+    socket_timeout_ms: Optional[int] = None
+    server_selection_timeout_ms: Optional[int] = None
+    compressors: Optional[List[str]] = None
+
+    read_preference: str = 'primary'
+    write_concern: Optional[str] = None
+    journal: Optional[bool] = None
+    wtimeout_ms: Optional[int] = None
+
+    # Registers the 'search' alias with this read preference (e.g. 'secondaryPreferred')
+    # so availability searches can be served by secondaries.
+    search_read_preference: Optional[str] = None
+
+    separate_bookings: bool = False
+    day_calendar: bool = False
+    lazy_bookings: bool = False
+    owner_summaries: bool = False
+    create_indexes: bool = True
+
+    # Attribute every command to the data_service function that issued it
+    # (see infrastructure.command_stats).
+    instrument: bool = False
+
+    @classmethod
+    def from_env(cls, environ=None) -> 'MongoConfig':
+        env = os.environ if environ is None else environ
+        defaults = cls()
+
+        def text(key, default):
+            return env.get('SNAKE_BNB_' + key) or default
+
+        def number(key, default):
+            value = env.get('SNAKE_BNB_' + key)
+            return int(value) if value else default
+
+        def flag(key, default):
+            value = env.get('SNAKE_BNB_' + key)
+            if not value:
+                return default
+            return value.strip().lower() in ('1', 'true', 'yes', 'y')
+
+        compressors = text('COMPRESSORS', None)
+
+        return cls(
+            backend=text('BACKEND', defaults.backend),
+            name=text('DB', defaults.name),
+            host=text('MONGO_HOST', defaults.host),
+            port=number('MONGO_PORT', defaults.port),
+            max_pool_size=number('MAX_POOL_SIZE', None),
+            min_pool_size=number('MIN_POOL_SIZE', None),
+            max_idle_time_ms=number('MAX_IDLE_TIME_MS', None),
+            connect_timeout_ms=number('CONNECT_TIMEOUT_MS', None),
+            socket_timeout_ms=number('SOCKET_TIMEOUT_MS', None),
+            server_selection_timeout_ms=number('SERVER_SELECTION_TIMEOUT_MS', None),
+            compressors=compressors.split(',') if compressors else None,
+            read_preference=text('READ_PREFERENCE', defaults.read_preference),
+            write_concern=text('WRITE_CONCERN', None),
+            journal=flag('JOURNAL', None),
+            wtimeout_ms=number('WTIMEOUT_MS', None),
+            search_read_preference=text('SEARCH_READ_PREFERENCE', None),
+            separate_bookings=flag('SEPARATE_BOOKINGS', defaults.separate_bookings),
+            day_calendar=flag('DAY_CALENDAR', defaults.day_calendar),
+            lazy_bookings=flag('LAZY_BOOKINGS', defaults.lazy_bookings),
+            owner_summaries=flag('OWNER_SUMMARIES', defaults.owner_summaries),
+            create_indexes=flag('CREATE_INDEXES', defaults.create_indexes),
+            instrument=flag('INSTRUMENT', defaults.instrument),
+        )
+
+    def client_settings(self) -> dict:
+        settings = dict(
+            maxPoolSize=self.max_pool_size,
+            minPoolSize=self.min_pool_size,
+            maxIdleTimeMS=self.max_idle_time_ms,
+            connectTimeoutMS=self.connect_timeout_ms,
+            socketTimeoutMS=self.socket_timeout_ms,
+            serverSelectionTimeoutMS=self.server_selection_timeout_ms,
+            compressors=self.compressors,
+            w=int(self.write_concern) if self.write_concern and self.write_concern.isdigit() else self.write_concern,
+            journal=self.journal,
+            wTimeoutMS=self.wtimeout_ms,
+        )
+
+        return {k: v for k, v in settings.items() if v is not None}
+
+
+def global_init(config: Optional[MongoConfig] = None):
+    global use_bookings_collection, use_day_calendar, use_lazy_bookings, use_owner_summaries, \
+        use_memory_backend, search_alias
+
+    config = config or MongoConfig.from_env()
+    if config.backend not in ('mongo', 'memory'):
+        raise ValueError("Unknown backend: {}".format(config.backend))
+
+    use_memory_backend = config.backend == 'memory'
+    if use_memory_backend:
+        return
+
+    use_bookings_collection = config.separate_bookings
+    use_day_calendar = config.day_calendar
+    use_lazy_bookings = config.lazy_bookings
+    use_owner_summaries = config.owner_summaries
+
+    if config.instrument:
+        command_stats.enable()
+
+    register_alias(CORE_ALIAS, config)
+    search_alias = CORE_ALIAS
+    if config.search_read_preference:
+        register_alias(SEARCH_ALIAS, dataclasses.replace(config, read_preference=config.search_read_preference))
+        search_alias = SEARCH_ALIAS
+
+    if config.create_indexes:
+        ensure_indexes()
+
+
+def register_alias(alias: str, config: MongoConfig):
+    """
+        Register an additional connection alias, e.g. a reporting database or a
+        secondary-preferred alias for read-heavy traffic.
+    """
+    if config.read_preference not in _read_preferences:
+        raise ValueError("Unknown read preference: {}".format(config.read_preference))
+
+    mongoengine.register_connection(
+        alias=alias,
+        name=config.name,
+        host=config.host,
+        port=config.port,
+        read_preference=_read_preferences[config.read_preference],
+        **config.client_settings()
+    )
 
 
-def global_init():
-    mongoengine.register_connection(alias='core', name='snake_bnb')
+def ensure_indexes():
+    """
+        Create the indexes declared in each model's meta. Safe to call repeatedly;
+        existing indexes are left alone.
+    """
+    for model in (Owner, Cage, Snake, CageBooking, OwnerSummary):
+        model.ensure_indexes()
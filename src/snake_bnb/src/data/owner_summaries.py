@@ -0,0 +1,50 @@
+import mongoengine
+
+
+class SummaryBooking(mongoengine.EmbeddedDocument):
+    cage_id = mongoengine.ObjectIdField()
+    cage_name = mongoengine.StringField()
+    guest_owner_id = mongoengine.ObjectIdField()
+    snake_id = mongoengine.ObjectIdField()
+    snake_name = mongoengine.StringField()
+
+    booked_date = mongoengine.DateTimeField()
+    check_in_date = mongoengine.DateTimeField(required=True)
+    check_out_date = mongoengine.DateTimeField(required=True)
+
+    @property
+    def duration_in_days(self):
+        dt = self.check_out_date - self.check_in_date
+        return dt.days
+
+
+class OwnerSummary(mongoengine.Document):
+    """
+        What an owner's dashboard shows, keyed by the owner's id. Kept current by
+        services.data_service when MongoConfig.owner_summaries is set (see
+        services.owner_summary).
+    """
+    id = mongoengine.ObjectIdField(primary_key=True)
+
+    # The host's cages, so a booking can update the host's summary by cage id.
+    cage_ids = mongoengine.ListField()
+
+    cage_count = mongoengine.IntField(default=0)
+    snake_count = mongoengine.IntField(default=0)
+
+    nights_available = mongoengine.IntField(default=0)
+    nights_hosted = mongoengine.IntField(default=0)
+    nights_booked = mongoengine.IntField(default=0)
+
+    # The latest bookings of the host's cages and of the guest's snakes, by check-in date.
+    hosted_bookings = mongoengine.EmbeddedDocumentListField(SummaryBooking)
+    guest_bookings = mongoengine.EmbeddedDocumentListField(SummaryBooking)
+
+    meta = {
+        'db_alias': 'core',
+        'collection': 'owner_summaries',
+        'auto_create_index': False,
+        'indexes': [
+            'cage_ids',
+        ]
+    }
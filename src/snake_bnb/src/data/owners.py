@@ -12,5 +12,9 @@ class Owner(mongoengine.Document):
 
     meta = {
         'db_alias': 'core',
-        'collection': 'owners'
+        'collection': 'owners',
+        'auto_create_index': False,
+        'indexes': [
+            {'fields': ['email'], 'unique': True},
+        ]
     }
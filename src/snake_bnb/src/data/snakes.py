@@ -12,5 +12,6 @@ class Snake(mongoengine.Document):
 
     meta = {
         'db_alias': 'core',
-        'collection': 'snakes'
+        'collection': 'snakes',
+        'auto_create_index': False
     }
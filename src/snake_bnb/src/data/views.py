@@ -0,0 +1,118 @@
+"""
+Read-only views of the documents in data.*, for the read paths of the services.
+
+Hydrating a mongoengine document runs every field through its descriptor, sets
+up change tracking and builds an EmbeddedDocument per booking. For listings and
+searches that return thousands of cages that dominates the time and memory of
+the call. These classes copy the raw pymongo dict straight into __slots__, with
+the models' attribute names and defaults, so code reading .name, .bookings or
+.duration_in_days works on either. Fields left out by a projection are None.
+
+A cage's bookings are decoded on first access, not when the view is built, so
+searches that only read name and price never pay for the array. Built from a
+bson.raw_bson.RawBSONDocument (MongoConfig.lazy_bookings) the array stays
+undecoded BSON until then.
+
+Views are never saved; the write paths keep using the documents.
+"""
+import datetime
+from typing import List, Optional
+
+import bson
+
+
+class BookingView:
+    __slots__ = ('guest_owner_id', 'guest_snake_id', 'booked_date', 'check_in_date', 'check_out_date',
+                 'review', 'rating', 'cage', 'snake')
+
+    def __init__(self, doc: dict):
+        get = doc.get
+        self.guest_owner_id: Optional[bson.ObjectId] = get('guest_owner_id')
+        self.guest_snake_id: Optional[bson.ObjectId] = get('guest_snake_id')
+        self.booked_date: Optional[datetime.datetime] = get('booked_date')
+        self.check_in_date: datetime.datetime = get('check_in_date')
+        self.check_out_date: datetime.datetime = get('check_out_date')
+        self.review: Optional[str] = get('review')
+        self.rating: int = get('rating', 0)
+
+        # Set by data_service.booking_from_row for a guest's bookings.
+        self.cage: Optional[CageView] = None
+        self.snake: Optional[SnakeView] = None
+
+    @property
+    def duration_in_days(self):
+        dt = self.check_out_date - self.check_in_date
+        return dt.days
+
+    def __repr__(self):
+        return '<BookingView: {} to {}>'.format(self.check_in_date, self.check_out_date)
+
+
+class CageView:
+    __slots__ = ('id', 'registered_date', 'name', 'price', 'square_meters', 'is_carpeted', 'has_toys',
+                 'allow_dangerous_snakes', 'calendar_start', 'free_days', '_bookings', '_raw_bookings')
+
+    def __init__(self, doc: dict):
+        get = doc.get
+        self.id: bson.ObjectId = get('_id')
+        self.registered_date: Optional[datetime.datetime] = get('registered_date')
+        self.name: str = get('name')
+        self.price: float = get('price')
+        self.square_meters: float = get('square_meters')
+        self.is_carpeted: bool = get('is_carpeted')
+        self.has_toys: bool = get('has_toys')
+        self.allow_dangerous_snakes: bool = get('allow_dangerous_snakes', False)
+        self.calendar_start: Optional[datetime.datetime] = get('calendar_start')
+        self.free_days: Optional[bytes] = get('free_days')
+
+        self._bookings: Optional[List[BookingView]] = None
+        self._raw_bookings = get('bookings', ())
+
+    @property
+    def bookings(self) -> List[BookingView]:
+        if self._bookings is None:
+            self._bookings = [BookingView(b) for b in self._raw_bookings]
+            self._raw_bookings = ()
+        return self._bookings
+
+    @bookings.setter
+    def bookings(self, value: List[BookingView]):
+        self._bookings = value
+        self._raw_bookings = ()
+
+    def __repr__(self):
+        return '<CageView: {}>'.format(self.name)
+
+
+class SnakeView:
+    __slots__ = ('id', 'registered_date', 'species', 'length', 'name', 'is_venomous')
+
+    def __init__(self, doc: dict):
+        get = doc.get
+        self.id: bson.ObjectId = get('_id')
+        self.registered_date: Optional[datetime.datetime] = get('registered_date')
+        self.species: str = get('species')
+        self.length: float = get('length')
+        self.name: str = get('name')
+        self.is_venomous: bool = get('is_venomous')
+
+    def __repr__(self):
+        return '<SnakeView: {}>'.format(self.name)
+
+
+class OwnerView:
+    __slots__ = ('id', 'registered_date', 'name', 'email', 'snake_ids', 'cage_ids')
+
+    def __init__(self, doc: dict):
+        get = doc.get
+        self.id: bson.ObjectId = get('_id')
+        self.registered_date: Optional[datetime.datetime] = get('registered_date')
+        self.name: str = get('name')
+        self.email: str = get('email')
+
+        # Assignable, like Owner's, so data_service._add_to_owner can refresh them in place.
+        self.snake_ids: List[bson.ObjectId] = get('snake_ids', [])
+        self.cage_ids: List[bson.ObjectId] = get('cage_ids', [])
+
+    def __repr__(self):
+        return '<OwnerView: {}>'.format(self.email)
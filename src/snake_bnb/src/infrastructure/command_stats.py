@@ -0,0 +1,224 @@
+import bisect
+import collections
+import contextvars
+import dataclasses
+import functools
+import inspect
+import json
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, TextIO
+
+import bson
+from pymongo import monitoring
+
+# Upper bounds of the latency histogram buckets in milliseconds; the last bucket is open.
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+
+
+class _Call:
+    __slots__ = ('name', 'counted')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counted = False
+
+
+# The outermost tracked service call running in this thread or task.
+_current_call: contextvars.ContextVar[Optional[_Call]] = contextvars.ContextVar('command_stats_call', default=None)
+
+
+@dataclasses.dataclass
+class FunctionStats:
+    calls: int = 0
+    commands: int = 0
+    failures: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    docs_returned: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    histogram: List[int] = dataclasses.field(default_factory=lambda: [0] * (len(BUCKETS_MS) + 1))
+    by_command: Dict[str, int] = dataclasses.field(default_factory=collections.Counter)
+
+    def percentile_ms(self, pct: int) -> float:
+        """
+            Upper bound of the bucket holding the percentile, capped at max_ms.
+        """
+        target = self.commands * pct / 100
+        seen = 0
+        for idx, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return min(BUCKETS_MS[idx], self.max_ms) if idx < len(BUCKETS_MS) else self.max_ms
+        return 0.0
+
+
+class CommandStats(monitoring.CommandListener):
+    """
+        pymongo command listener that attributes every command to the
+        data_service function that issued it (see track_calls), and keeps
+        latency histograms plus document and byte counts per function.
+        Commands issued outside the services are grouped under '<other>'.
+    """
+
+    def __init__(self):
+        self.functions: Dict[str, FunctionStats] = collections.defaultdict(FunctionStats)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        call = _current_call.get()
+        name = call.name if call else '<other>'
+        sent = len(bson.encode(event.command))
+
+        with self._lock:
+            stats = self.functions[name]
+            if call and not call.counted:
+                stats.calls += 1
+                call.counted = True
+
+            stats.commands += 1
+            stats.by_command[event.command_name] += 1
+            stats.bytes_sent += sent
+            self._pending[(event.connection_id, event.request_id)] = name
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event, None)
+
+    def _finish(self, event, reply: Optional[dict]):
+        ms = event.duration_micros / 1000
+        received = len(bson.encode(reply)) if reply else 0
+
+        with self._lock:
+            name = self._pending.pop((event.connection_id, event.request_id), '<other>')
+            stats = self.functions[name]
+            stats.total_ms += ms
+            stats.max_ms = max(stats.max_ms, ms)
+            stats.histogram[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+            stats.bytes_received += received
+            if reply is None:
+                stats.failures += 1
+            else:
+                stats.docs_returned += _docs_in(reply)
+
+    def reset(self):
+        with self._lock:
+            self.functions.clear()
+            self._pending.clear()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                'buckets_ms': list(BUCKETS_MS),
+                'functions': {
+                    name: dict(dataclasses.asdict(s), by_command=dict(s.by_command))
+                    for name, s in sorted(self.functions.items())
+                },
+            }
+
+    def print_summary(self, out: TextIO = sys.stdout):
+        with self._lock:
+            rows = sorted(self.functions.items(), key=lambda item: -item[1].total_ms)
+
+        print('{:<28}{:>7}{:>7}{:>10}{:>10}{:>10}{:>10}{:>8}{:>10}{:>10}'.format(
+            'function', 'calls', 'cmds', 'cmds/call', 'mean ms', 'p95 ms', 'max ms',
+            'docs', 'KB out', 'KB in'), file=out)
+        for name, s in rows:
+            print('{:<28}{:>7}{:>7}{:>10.1f}{:>10.2f}{:>10.2f}{:>10.2f}{:>8}{:>10.1f}{:>10.1f}'.format(
+                name, s.calls, s.commands, s.commands / s.calls if s.calls else 0,
+                s.total_ms / s.commands if s.commands else 0, s.percentile_ms(95), s.max_ms,
+                s.docs_returned, s.bytes_sent / 1024, s.bytes_received / 1024), file=out)
+            print('    ' + ', '.join('{} x{}'.format(c, n) for c, n in sorted(s.by_command.items())), file=out)
+
+    def dump_json(self, path: str):
+        with open(path, 'w', encoding='utf-8') as fout:
+            json.dump(self.summary(), fout, indent=2)
+
+
+stats: Optional[CommandStats] = None
+
+
+def enable() -> CommandStats:
+    """
+        Register the listener with pymongo. Only clients created afterwards report
+        to it, so call this before the first query. Safe to call repeatedly.
+    """
+    global stats
+    if stats is None:
+        stats = CommandStats()
+        monitoring.register(stats)
+
+    return stats
+
+
+def track_calls(namespace: dict):
+    """
+        Wrap the public functions defined in a service module so the commands
+        they issue are attributed to them. Call it at the end of the module with
+        globals(). Only the outermost tracked call is counted; while stats are
+        off the wrappers just pass through.
+    """
+    module = namespace['__name__']
+    for name, obj in list(namespace.items()):
+        if not name.startswith('_') and inspect.isfunction(obj) and obj.__module__ == module:
+            namespace[name] = _tracked(obj)
+
+
+def _tracked(func: Callable) -> Callable:
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def tracked_async(*args, **kwargs):
+            if stats is None or _current_call.get() is not None:
+                return await func(*args, **kwargs)
+
+            token = _current_call.set(_Call(func.__name__))
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _current_call.reset(token)
+
+        return tracked_async
+
+    @functools.wraps(func)
+    def tracked(*args, **kwargs):
+        if stats is None or _current_call.get() is not None:
+            return func(*args, **kwargs)
+
+        call = _Call(func.__name__)
+        token = _current_call.set(call)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            _current_call.reset(token)
+
+        # Lazy results issue their commands while the caller iterates them.
+        return _tracked_iter(call, result) if inspect.isgenerator(result) else result
+
+    return tracked
+
+
+def _tracked_iter(call: _Call, items):
+    while True:
+        token = _current_call.set(call)
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        finally:
+            _current_call.reset(token)
+        yield item
+
+
+def _docs_in(reply: dict) -> int:
+    cursor = reply.get('cursor')
+    if cursor:
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    if 'value' in reply:
+        return 1 if reply['value'] else 0
+    if 'values' in reply:
+        return len(reply['values'])
+    return reply.get('n', 0)
@@ -0,0 +1,37 @@
+import datetime
+import functools
+from typing import Union
+
+from dateutil import parser
+
+DateInput = Union[str, datetime.date, datetime.datetime]
+
+
+def parse_date(value: DateInput) -> datetime.datetime:
+    """
+        Parse a date typed or imported as text. Strict yyyy-mm-dd takes the fast
+        date.fromisoformat path; anything else falls back to dateutil's parser.
+        Dates become midnight datetimes, datetimes are returned unchanged.
+    """
+    if isinstance(value, datetime.datetime):
+        return value
+    if isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    if not isinstance(value, str):
+        raise TypeError('Not a date: {!r}'.format(value))
+
+    return _parse_text(value.strip())
+
+
+# Bulk loads repeat the same few thousand dates on many rows; parsed datetimes are immutable.
+@functools.lru_cache(maxsize=4096)
+def _parse_text(text: str) -> datetime.datetime:
+    if len(text) == 10 and text[4] == '-' and text[7] == '-':
+        try:
+            d = datetime.date.fromisoformat(text)
+            return datetime.datetime(d.year, d.month, d.day)
+        except ValueError:
+            pass
+
+    return parser.parse(text)
+
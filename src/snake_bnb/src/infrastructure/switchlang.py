@@ -1,5 +1,6 @@
+import types
 import uuid
-from typing import Callable, Any, Optional
+from typing import Callable, Any, Optional, Tuple
 
 
 class switch:
@@ -106,3 +107,107 @@ def closed_range(start: int, stop: int, step=1) -> range:
         raise ValueError("Start must be less than stop.")
 
     return range(start, stop + step, step)
+
+
+class Dispatcher:
+    """
+        A switch built once and reused: cases are compiled into a frozen key -> handlers
+        map on the first dispatch (or freeze()), so each dispatch is a single dict lookup.
+        Keys, default and fallthrough work as in switch:
+
+        actions = (Dispatcher()
+                   .case('a', function)
+                   .case(['b', 'c'], function, fallthrough=True)
+                   .case(range(1, 5), function)
+                   .default(function)
+                   .freeze())
+
+        result = actions(value)
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._keys = set()
+        self._default = None
+        self._table = None
+        self._default_handlers = None
+
+    def case(self, key, func: Callable[[], Any], fallthrough: Optional[bool] = False) -> 'Dispatcher':
+        """
+            Add a case. A list or range key adds each item; fallthrough also runs the
+            next case's function (and so on while those fall through too).
+        """
+        if self._table is not None:
+            raise ValueError("Cannot add cases to a frozen Dispatcher.")
+        if not func:
+            raise ValueError("Action for case cannot be None.")
+        if not callable(func):
+            raise ValueError("Func must be callable.")
+
+        keys = list(key) if isinstance(key, list) or isinstance(key, range) else [key]
+        for k in keys:
+            if k in self._keys:
+                raise ValueError("Duplicate case: {}".format(k))
+            self._keys.add(k)
+
+        self._entries.append((keys, func, bool(fallthrough)))
+        return self
+
+    def default(self, func: Callable[[], Any]) -> 'Dispatcher':
+        """
+            Run func when no case matches. Like switch, cases falling through into it run it as well.
+        """
+        if self._default is not None:
+            raise ValueError("Duplicate default case.")
+
+        self.case([], func)
+        self._default = len(self._entries) - 1
+        return self
+
+    def freeze(self) -> 'Dispatcher':
+        if self._table is not None:
+            return self
+
+        table = {}
+        for idx, (keys, _, _) in enumerate(self._entries):
+            handlers = self._chain(idx)
+            for k in keys:
+                table[k] = handlers
+
+        self._table = types.MappingProxyType(table)
+        if self._default is not None:
+            self._default_handlers = self._chain(self._default)
+
+        return self
+
+    def __call__(self, value):
+        handlers = self.handlers(value)
+        if not handlers:
+            raise Exception("Value does not match any case and there "
+                            "is no default case: value {}".format(value))
+
+        result = None
+        for func in handlers:
+            result = func()
+
+        return result
+
+    def handlers(self, value) -> Tuple[Callable[[], Any], ...]:
+        """
+            The functions dispatching value runs, in order; () if it matches no case and there is no default.
+        """
+        if self._table is None:
+            self.freeze()
+
+        return self._table.get(value, self._default_handlers) or ()
+
+    def keys(self) -> frozenset:
+        return frozenset(self._keys)
+
+    def _chain(self, idx: int) -> Tuple[Callable[[], Any], ...]:
+        handlers = [self._entries[idx][1]]
+        while self._entries[idx][2] and idx + 1 < len(self._entries):
+            idx += 1
+            handlers.append(self._entries[idx][1])
+
+        return tuple(handlers)
@@ -2,6 +2,7 @@ from colorama import Fore
 import program_guests
 import program_hosts
 import data.mongo_setup as mongo_setup
+from infrastructure import command_stats
 
 
 def main():
@@ -16,7 +17,11 @@ def main():
             else:
                 program_hosts.run()
     except KeyboardInterrupt:
-        return
+        pass
+
+    if command_stats.stats:
+        print()
+        command_stats.stats.print_summary()
 
 
 def print_header():
@@ -0,0 +1,180 @@
+"""
+Replay scripted sessions through the host and guest actions without prompts.
+
+    python program_batch.py trace.jsonl --workers 8
+    python program_batch.py signup.txt --repeat 1000 --workers 16
+
+A JSON-lines trace has one action per line:
+
+    {"session": "alice", "mode": "host", "action": "c", "answers": ["Alice", "alice@example.com"]}
+
+A text script is a single session with one action per line, the answers to its
+prompts separated by '|' (blank lines and lines starting with # are skipped):
+
+    host c | Alice | alice{session}@example.com
+    host r | 2.5 | y | y | n | Cozy den | 12
+
+{session} in an answer is replaced by the session name, so --repeat can run
+many copies of a script as distinct users. Sessions run in parallel worker
+processes, each with its own state.active_account; output is discarded unless
+--verbose. Per-action timings are printed at the end.
+"""
+import argparse
+import builtins
+import collections
+import contextlib
+import io
+import json
+import multiprocessing
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import data.mongo_setup as mongo_setup
+import infrastructure.state as state
+import program_guests
+import program_hosts
+
+Step = Tuple[str, str, List[str]]
+
+_handlers = {
+    'host': program_hosts.handle_action,
+    'guest': program_guests.handle_action,
+}
+
+
+class OutOfAnswers(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay scripted Snake BnB sessions.')
+    parser.add_argument('file', help='JSON-lines trace (.jsonl) or text script.')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--repeat', type=int, default=1, help='Run this many copies of every session.')
+    parser.add_argument('--verbose', action='store_true', help='Print what the actions print.')
+    args = parser.parse_args()
+
+    with open(args.file, encoding='utf-8') as fin:
+        if args.file.endswith(('.jsonl', '.json')):
+            sessions = read_trace(fin)
+        else:
+            sessions = {'script': read_script(fin)}
+
+    jobs = [
+        ('{}-{}'.format(name, n) if args.repeat > 1 else name, steps, args.verbose)
+        for n in range(args.repeat)
+        for name, steps in sessions.items()
+    ]
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.workers, initializer=mongo_setup.global_init) as pool:
+        results = [r for session in pool.imap_unordered(run_session, jobs) for r in session]
+    elapsed = time.perf_counter() - started
+
+    print_timings(results, len(jobs), elapsed)
+    if any(error for *_, error in results):
+        sys.exit(1)
+
+
+def read_trace(lines) -> Dict[str, List[Step]]:
+    sessions = collections.OrderedDict()
+    for line in lines:
+        if not line.strip():
+            continue
+
+        record = json.loads(line)
+        step = (record['mode'], record['action'], [str(a) for a in record.get('answers', [])])
+        sessions.setdefault(str(record.get('session', 'trace')), []).append(step)
+
+    return sessions
+
+
+def read_script(lines) -> List[Step]:
+    steps = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        command, *answers = [part.strip() for part in line.split('|')]
+        mode, _, action = command.partition(' ')
+        steps.append((mode, action.strip(), answers))
+
+    return steps
+
+
+def run_session(job) -> List[Tuple[str, str, float, str]]:
+    """
+        Run one session's steps in this worker. Returns (mode, action, seconds, error)
+        per step; error is '' when the step succeeded.
+    """
+    name, steps, verbose = job
+    state.active_account = None
+    answers = collections.deque()
+
+    def scripted_input(prompt=''):
+        if not answers:
+            raise OutOfAnswers('No answer left for prompt {!r}'.format(prompt.strip()))
+        return answers.popleft()
+
+    results = []
+    original_input = builtins.input
+    builtins.input = scripted_input
+    try:
+        out = sys.stdout if verbose else io.StringIO()
+        with contextlib.redirect_stdout(out):
+            for mode, action, step_answers in steps:
+                answers.clear()
+                answers.extend(a.replace('{session}', name) for a in step_answers)
+
+                error = ''
+                t0 = time.perf_counter()
+                try:
+                    _handlers[mode](action.lower())
+                except KeyboardInterrupt:
+                    # [x]it ends the session.
+                    results.append((mode, action, time.perf_counter() - t0, ''))
+                    break
+                except Exception as x:
+                    error = '{}: {}'.format(type(x).__name__, x)
+                results.append((mode, action, time.perf_counter() - t0, error))
+
+                if not verbose:
+                    out.seek(0)
+                    out.truncate()
+    finally:
+        builtins.input = original_input
+
+    return results
+
+
+def print_timings(results, session_count: int, elapsed: float):
+    by_action = collections.defaultdict(list)
+    errors = collections.Counter()
+    for mode, action, seconds, error in results:
+        by_action[(mode, action)].append(seconds)
+        if error:
+            errors[(mode, action)] += 1
+
+    print('{:,} sessions, {:,} actions in {:.1f}s ({:,.0f} actions/sec).'.format(
+        session_count, len(results), elapsed, len(results) / elapsed if elapsed else 0))
+    print()
+    print('{:<16}{:>8}{:>8}{:>10}{:>10}{:>10}{:>10}'.format(
+        'action', 'count', 'errors', 'mean ms', 'p50 ms', 'p95 ms', 'max ms'))
+    for (mode, action), times in sorted(by_action.items()):
+        times.sort()
+        print('{:<16}{:>8}{:>8}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}'.format(
+            '{} {}'.format(mode, action), len(times), errors[(mode, action)],
+            1000 * sum(times) / len(times), 1000 * times[len(times) // 2],
+            1000 * times[min(len(times) - 1, int(len(times) * 0.95))], 1000 * times[-1]))
+
+    failed = [(m, a, e) for m, a, _, e in results if e]
+    for mode, action, error in failed[:20]:
+        print('  {} {}: {}'.format(mode, action, error))
+    if len(failed) > 20:
+        print('  ... and {:,} more errors.'.format(len(failed) - 20))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 import datetime
-from dateutil import parser
 
-from infrastructure.switchlang import switch
+from infrastructure.dates import parse_date
+from infrastructure.switchlang import Dispatcher
 import program_hosts as hosts
 import services.data_service as svc
+from services import owner_summary
 from program_hosts import success_msg, error_msg
 import infrastructure.state as state
 
+CAGES_PER_PAGE = 10
+AVAILABLE_CAGE_FIELDS = ('name', 'price', 'square_meters', 'is_carpeted', 'has_toys')
+
 
 def run():
     print(' ****************** Welcome guest **************** ')
@@ -16,32 +20,25 @@ def run():
 
     while True:
         action = hosts.get_action()
-
-        with switch(action) as s:
-            s.case('c', hosts.create_account)
-            s.case('l', hosts.log_into_account)
-
-            s.case('a', add_a_snake)
-            s.case('y', view_your_snakes)
-            s.case('b', book_a_cage)
-            s.case('v', view_bookings)
-            s.case('m', lambda: 'change_mode')
-
-            s.case('?', show_commands)
-            s.case('', lambda: None)
-            s.case(['x', 'bye', 'exit', 'exit()'], hosts.exit_app)
-
-            s.default(hosts.unknown_command)
-
-        state.reload_account()
+        result = handle_action(action)
 
         if action:
             print()
 
-        if s.result == 'change_mode':
+        if result == 'change_mode':
             return
 
 
+def handle_action(action: str):
+    """
+        Run the guest action for the typed command; returns 'change_mode' for [m].
+    """
+    result = actions(action)
+    state.reload_account()
+
+    return result
+
+
 def show_commands():
     print('What action would you like to take:')
     print('[C]reate an account')
@@ -50,6 +47,7 @@ def show_commands():
     print('[A]dd a snake')
     print('View [y]our snakes')
     print('[V]iew your bookings')
+    print('[D]ashboard')
     print('[M]ain menu')
     print('e[X]it app')
     print('[?] Help (this info)')
@@ -72,7 +70,6 @@ def add_a_snake():
     is_venomous = input("Is your snake venomous [y]es, [n]o? ").lower().startswith('y')
 
     snake = svc.add_snake(state.active_account, name, length, species, is_venomous)
-    state.reload_account()
     success_msg('Created {} with id {}'.format(snake.name, snake.id))
 
 
@@ -99,7 +96,7 @@ def book_a_cage():
         error_msg("You must log in first to book a cage")
         return
 
-    snakes = svc.get_snakes_for_user(state.active_account.id)
+    snakes = svc.get_snakes_for_user(state.active_account.id, fields=('name', 'length', 'is_venomous'))
     if not snakes:
         error_msg('You must first [a]dd a snake before you can book a cage.')
         return
@@ -110,10 +107,10 @@ def book_a_cage():
         error_msg('cancelled')
         return
 
-    checkin = parser.parse(
+    checkin = parse_date(
         start_text
     )
-    checkout = parser.parse(
+    checkout = parse_date(
         input("Check-out date [yyyy-mm-dd]: ")
     )
     if checkin >= checkout:
@@ -131,42 +128,108 @@ def book_a_cage():
 
     snake = snakes[int(input('Which snake do you want to book (number)')) - 1]
 
-    cages = svc.get_available_cages(checkin, checkout, snake)
-
-    print("There are {} cages available in that time.".format(len(cages)))
-    for idx, c in enumerate(cages):
-        print(" {}. {} with {}m carpeted: {}, has toys: {}.".format(
-            idx + 1,
-            c.name,
-            c.square_meters,
-            'yes' if c.is_carpeted else 'no',
-            'yes' if c.has_toys else 'no'))
-
-    if not cages:
-        error_msg("Sorry, no cages are available for that date.")
+    cage = choose_available_cage(checkin, checkout, snake)
+    if not cage:
         return
 
-    cage = cages[int(input('Which cage do you want to book (number)')) - 1]
-    svc.book_cage(state.active_account, snake, cage, checkin, checkout)
+    try:
+        svc.book_cage(state.active_account, snake, cage, checkin, checkout)
+    except svc.CageAlreadyBookedError as x:
+        error_msg('Sorry, someone booked that cage first. {}'.format(x))
+        return
 
     success_msg('Successfully booked {} for {} at ${}/night.'.format(cage.name, snake.name, cage.price))
 
 
+def choose_available_cage(checkin, checkout, snake):
+    """
+        Show available cages a page at a time; more are only fetched when asked for.
+    """
+    cages = []
+    after = None
+
+    while True:
+        page = svc.get_available_cages_page(checkin, checkout, snake, after=after,
+                                            page_size=CAGES_PER_PAGE, fields=AVAILABLE_CAGE_FIELDS)
+        if not cages and page.next_key:
+            print("Here are the first {} cages available in that time.".format(len(page.items)))
+        elif not cages:
+            print("There are {} cages available in that time.".format(len(page.items)))
+
+        for c in page.items:
+            cages.append(c)
+            print(" {}. {} with {}m carpeted: {}, has toys: {}.".format(
+                len(cages),
+                c.name,
+                c.square_meters,
+                'yes' if c.is_carpeted else 'no',
+                'yes' if c.has_toys else 'no'))
+
+        if not cages:
+            error_msg("Sorry, no cages are available for that date.")
+            return None
+
+        if not page.next_key:
+            return cages[int(input('Which cage do you want to book (number)')) - 1]
+
+        choice = input('Which cage do you want to book (number, or [m]ore)').strip().lower()
+        if choice != 'm':
+            return cages[int(choice) - 1]
+
+        after = page.next_key
+
+
 def view_bookings():
     print(' ****************** Your bookings **************** ')
     if not state.active_account:
         error_msg("You must log in first to register a cage")
         return
 
-    snakes = {s.id: s for s in svc.get_snakes_for_user(state.active_account.id)}
     bookings = svc.get_bookings_for_user(state.active_account.email)
 
     print("You have {} bookings.".format(len(bookings)))
     for b in bookings:
         # noinspection PyUnresolvedReferences
         print(' * Snake: {} is booked at {} from {} for {} days.'.format(
-            snakes.get(b.guest_snake_id).name,
+            b.snake.name if b.snake else '(removed)',
             b.cage.name,
             datetime.date(b.check_in_date.year, b.check_in_date.month, b.check_in_date.day),
             (b.check_out_date - b.check_in_date).days
         ))
+
+
+def dashboard():
+    print(' ****************** Your dashboard **************** ')
+    if not state.active_account:
+        error_msg("You must log in first to see your dashboard")
+        return
+
+    summary = svc.get_owner_summary(state.active_account)
+    upcoming = owner_summary.upcoming(summary.guest_bookings)
+
+    print('{} snakes, {} nights booked.'.format(summary.snake_count, summary.nights_booked))
+    print('You have {} upcoming bookings.'.format(len(upcoming)))
+    for b in upcoming:
+        print(' * Snake: {} is booked at {} from {} for {} days.'.format(
+            b.snake_name or '(removed)',
+            b.cage_name,
+            datetime.date(b.check_in_date.year, b.check_in_date.month, b.check_in_date.day),
+            b.duration_in_days
+        ))
+
+
+# Built once at import; handle_action() is a single lookup per command.
+actions = (Dispatcher()
+           .case('c', hosts.create_account)
+           .case('l', hosts.log_into_account)
+           .case('a', add_a_snake)
+           .case('y', view_your_snakes)
+           .case('b', book_a_cage)
+           .case('v', view_bookings)
+           .case('d', dashboard)
+           .case('m', lambda: 'change_mode')
+           .case('?', show_commands)
+           .case('', lambda: None)
+           .case(['x', 'bye', 'exit', 'exit()'], hosts.exit_app)
+           .default(hosts.unknown_command)
+           .freeze())
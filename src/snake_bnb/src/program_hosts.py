@@ -1,10 +1,11 @@
 import datetime
 from colorama import Fore
-from dateutil import parser
 
-from infrastructure.switchlang import switch
+from infrastructure.dates import parse_date
+from infrastructure.switchlang import Dispatcher
 import infrastructure.state as state
 import services.data_service as svc
+from services import owner_summary
 
 
 def run():
@@ -15,28 +16,22 @@ def run():
 
     while True:
         action = get_action()
-
-        with switch(action) as s:
-            s.case('c', create_account)
-            s.case('a', create_account)
-            s.case('l', log_into_account)
-            s.case('y', list_cages)
-            s.case('r', register_cage)
-            s.case('u', update_availability)
-            s.case('v', view_bookings)
-            s.case('m', lambda: 'change_mode')
-            s.case(['x', 'bye', 'exit', 'exit()'], exit_app)
-            s.case('?', show_commands)
-            s.case('', lambda: None)
-            s.default(unknown_command)
+        result = handle_action(action)
 
         if action:
             print()
 
-        if s.result == 'change_mode':
+        if result == 'change_mode':
             return
 
 
+def handle_action(action: str):
+    """
+        Run the host action for the typed command; returns 'change_mode' for [m].
+    """
+    return actions(action)
+
+
 def show_commands():
     print('What action would you like to take:')
     print('[C]reate an [a]ccount')
@@ -45,6 +40,7 @@ def show_commands():
     print('[R]egister a cage')
     print('[U]pdate cage availability')
     print('[V]iew your bookings')
+    print('[D]ashboard')
     print('Change [M]ode (guest or host)')
     print('e[X]it app')
     print('[?] Help (this info)')
@@ -104,7 +100,6 @@ def register_cage():
         allow_dangerous, has_toys, carpeted, meters, price
     )
 
-    state.reload_account()
     success_msg(f'Register new cage with id {cage.id}.')
 
 
@@ -116,7 +111,10 @@ def list_cages(suppress_header=False):
         error_msg('You must login first to register a cage.')
         return
 
-    cages = svc.find_cages_for_user(state.active_account)
+    cages = svc.find_cages_for_user(state.active_account, fields=(
+        'name', 'square_meters',
+        'bookings.check_in_date', 'bookings.check_out_date', 'bookings.booked_date'
+    ))
     print(f"You have {len(cages)} cages.")
     for idx, c in enumerate(cages):
         print(f' {idx + 1}. {c.name} is {c.square_meters} meters.')
@@ -145,12 +143,12 @@ def update_availability():
 
     cage_number = int(cage_number)
 
-    cages = svc.find_cages_for_user(state.active_account)
+    cages = svc.find_cages_for_user(state.active_account, fields=('name',))
     selected_cage = cages[cage_number - 1]
 
     success_msg("Selected cage {}".format(selected_cage.name))
 
-    start_date = parser.parse(
+    start_date = parse_date(
         input("Enter available date [yyyy-mm-dd]: ")
     )
     days = int(input("How many days is this block of time? "))
@@ -171,7 +169,9 @@ def view_bookings():
         error_msg("You must log in first to register a cage")
         return
 
-    cages = svc.find_cages_for_user(state.active_account)
+    cages = svc.find_cages_for_user(state.active_account, fields=(
+        'name', 'bookings.booked_date', 'bookings.check_in_date', 'bookings.check_out_date'
+    ))
 
     bookings = [
         (c, b)
@@ -190,6 +190,27 @@ def view_bookings():
         ))
 
 
+def dashboard():
+    print(' ****************** Your dashboard **************** ')
+
+    if not state.active_account:
+        error_msg("You must log in first to see your dashboard")
+        return
+
+    summary = svc.get_owner_summary(state.active_account)
+    upcoming = owner_summary.upcoming(summary.hosted_bookings)
+
+    print(f'{summary.cage_count} cages, {summary.nights_available} nights available, '
+          f'{summary.nights_hosted} nights booked by guests.')
+    print(f'You have {len(upcoming)} upcoming bookings.')
+    for b in upcoming:
+        print(' * Cage: {}, from {} for {} days.'.format(
+            b.cage_name,
+            datetime.date(b.check_in_date.year, b.check_in_date.month, b.check_in_date.day),
+            b.duration_in_days
+        ))
+
+
 def exit_app():
     print()
     print('bye')
@@ -215,3 +236,20 @@ def success_msg(text):
 
 def error_msg(text):
     print(Fore.LIGHTRED_EX + text + Fore.WHITE)
+
+
+# Built once at import; handle_action() is a single lookup per command.
+actions = (Dispatcher()
+           .case(['c', 'a'], create_account)
+           .case('l', log_into_account)
+           .case('y', list_cages)
+           .case('r', register_cage)
+           .case('u', update_availability)
+           .case('v', view_bookings)
+           .case('d', dashboard)
+           .case('m', lambda: 'change_mode')
+           .case(['x', 'bye', 'exit', 'exit()'], exit_app)
+           .case('?', show_commands)
+           .case('', lambda: None)
+           .default(unknown_command)
+           .freeze())
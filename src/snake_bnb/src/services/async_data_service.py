@@ -0,0 +1,463 @@
+"""
+asyncio version of services.data_service on pymongo's AsyncMongoClient.
+
+Call init() once per event loop (e.g. at web-app startup), then await the same
+functions data_service offers. Reads return the same data.views as data_service,
+writes the usual Owner / Cage / Snake documents. The availability index and
+booking storage mode are shared with data_service.
+"""
+import asyncio
+import datetime
+from typing import List, Optional
+
+import bson
+from bson.raw_bson import RawBSONDocument
+from pymongo import AsyncMongoClient, ReturnDocument
+
+from data.bookings import Booking
+from data.cage_bookings import CageBooking
+from data.cages import Cage
+import data.mongo_setup as mongo_setup
+from data.owner_summaries import OwnerSummary
+from data.owners import Owner
+from data.snakes import Snake
+from data.views import BookingView, CageView, OwnerView, SnakeView
+from infrastructure import command_stats
+from services import availability, day_calendar, owner_summary
+from services.data_service import (AVAILABLE_CAGES_ORDER, CageAlreadyBookedError, booking_from_row,
+                                   embedded_claim, embedded_merge, embedded_merged, guest_bookings_pipeline,
+                                   lease_update)
+
+_db = None
+_search_db = None
+_index_lock: Optional[asyncio.Lock] = None
+
+
+def init(config: Optional[mongo_setup.MongoConfig] = None):
+    global _db, _search_db, _index_lock
+
+    config = config or mongo_setup.MongoConfig.from_env()
+    if config.backend != 'mongo':
+        raise ValueError("The async service only supports the mongo backend, not {!r}.".format(config.backend))
+
+    mongo_setup.use_bookings_collection = config.separate_bookings
+    mongo_setup.use_day_calendar = config.day_calendar
+    mongo_setup.use_lazy_bookings = config.lazy_bookings
+    mongo_setup.use_owner_summaries = config.owner_summaries
+    if config.instrument:
+        command_stats.enable()
+
+    _db = _client(config)[config.name]
+    _search_db = _db
+    if config.search_read_preference:
+        _search_db = _client(config, config.search_read_preference)[config.name]
+
+    _index_lock = asyncio.Lock()
+
+
+def _client(config: mongo_setup.MongoConfig, read_preference: Optional[str] = None) -> AsyncMongoClient:
+    return AsyncMongoClient(
+        host=config.host,
+        port=config.port,
+        readPreference=read_preference or config.read_preference,
+        **config.client_settings()
+    )
+
+
+def _collection(model, db=None):
+    return (db if db is not None else _db)[model._get_collection_name()]
+
+
+def _cage_reads(db=None):
+    """
+        The cages collection for searches and listings; with MongoConfig.lazy_bookings
+        it returns RawBSONDocuments, as data_service._find_cages does.
+    """
+    collection = _collection(Cage, db)
+    if mongo_setup.use_lazy_bookings and not mongo_setup.use_bookings_collection:
+        collection = collection.with_options(
+            codec_options=collection.codec_options.with_options(document_class=RawBSONDocument))
+    return collection
+
+
+async def create_account(name: str, email: str) -> Owner:
+    owner = Owner()
+    owner.name = name
+    owner.email = email
+
+    owner.validate()
+    result = await _collection(Owner).insert_one(owner.to_mongo())
+    owner.id = result.inserted_id
+
+    return owner
+
+
+async def find_account_by_email(email: str) -> OwnerView:
+    doc = await _collection(Owner).find_one({'email': email})
+    return OwnerView(doc) if doc else None
+
+
+async def register_cage(active_account: Owner,
+                        name, allow_dangerous, has_toys,
+                        carpeted, meters, price) -> Cage:
+    cage = Cage()
+
+    cage.name = name
+    cage.square_meters = meters
+    cage.is_carpeted = carpeted
+    cage.has_toys = has_toys
+    cage.allow_dangerous_snakes = allow_dangerous
+    cage.price = price
+    if mongo_setup.use_day_calendar:
+        day_calendar.start_empty(cage)
+
+    cage.validate()
+    result = await _collection(Cage).insert_one(cage.to_mongo())
+    cage.id = result.inserted_id
+
+    await _add_to_owner(active_account, {'cage_ids': cage.id})
+    if mongo_setup.use_owner_summaries:
+        await _write_summaries(owner_summary.cage_registered(active_account.id, [cage.id]))
+
+    return cage
+
+
+async def find_cages_for_user(account: Owner) -> List[CageView]:
+    docs = await _cage_reads().find({'_id': {'$in': account.cage_ids}}).to_list(None)
+    cages = [CageView(d) for d in docs]
+
+    if mongo_setup.use_bookings_collection:
+        by_cage = {c.id: c for c in cages}
+        for c in cages:
+            c.bookings = []
+
+        records = _collection(CageBooking) \
+            .find({'cage_id': {'$in': list(by_cage)}}) \
+            .sort('check_in_date', 1)
+        async for r in records:
+            by_cage[r.pop('cage_id')].bookings.append(_booking_from_record(r))
+
+    return cages
+
+
+async def add_available_date(cage: Cage,
+                             start_date: datetime.datetime, days: int) -> Cage:
+    """
+        Async counterpart of data_service.add_available_date, merging touching free blocks.
+    """
+    blocks = [(start_date, start_date + datetime.timedelta(days=days))]
+
+    if mongo_setup.use_bookings_collection:
+        merged, absorbed = await _merge_block_records(cage.id, blocks)
+        cage_doc = await _collection(Cage).find_one_and_update(
+            {'_id': cage.id}, availability.STAMP, return_document=ReturnDocument.AFTER)
+    else:
+        before = await _collection(Cage).find_one_and_update(*embedded_merge(cage.id, blocks))
+        result = embedded_merged(before, blocks)
+        if result is None:
+            raise ValueError('Unknown cage: {}'.format(cage.id))
+        merged, absorbed, cage_doc = result
+
+    for b in absorbed:
+        availability.index.remove(cage.id, b['check_in_date'], b['check_out_date'])
+    for check_in, check_out in merged:
+        availability.index.add(cage.id, check_in, check_out)
+    if mongo_setup.use_day_calendar:
+        await _refresh_calendar(cage.id)
+    if mongo_setup.use_owner_summaries:
+        added = sum(owner_summary.nights(i, o) for i, o in merged) - sum(
+            owner_summary.nights(b['check_in_date'], b['check_out_date']) for b in absorbed)
+        await _write_summaries(owner_summary.availability_added(cage.id, added))
+
+    return Cage._from_son(cage_doc)
+
+
+async def _merge_block_records(cage_id: bson.ObjectId, blocks: list):
+    """
+        Async counterpart of data_service._merge_block_records.
+    """
+    collection = _collection(CageBooking)
+    token = bson.ObjectId()
+    while not (await _collection(Cage).update_one(*lease_update(cage_id, token))).matched_count:
+        if not await _collection(Cage).count_documents({'_id': cage_id}, limit=1):
+            raise ValueError('Unknown cage: {}'.format(cage_id))
+        await asyncio.sleep(0.01)
+
+    try:
+        touching = await collection.find({
+            'cage_id': cage_id,
+            'guest_snake_id': None,
+            'check_in_date': {'$lte': max(o for _, o in blocks)},
+            'check_out_date': {'$gte': min(i for i, _ in blocks)}
+        }).to_list(None)
+        _, absorbed = availability.coalesce_all(touching, blocks)
+
+        deleted, taken = [], []
+        for b in absorbed:
+            if (await collection.delete_one({'_id': b['_id'], 'guest_snake_id': None})).deleted_count:
+                deleted.append(b)
+            else:
+                taken.append((b['check_in_date'], b['check_out_date']))
+
+        merged, absorbed = availability.coalesce_all(deleted, availability.subtract(blocks, taken))
+        docs = [b for b in deleted if not any(b is a for a in absorbed)]
+        docs += [_block_doc(i, o, cage_id=cage_id) for i, o in merged]
+        if docs:
+            await collection.insert_many(docs)
+    finally:
+        await _collection(Cage).update_one({'_id': cage_id, 'merge_lease': token},
+                                           {'$unset': {'merge_lease': '', 'merge_lease_expires': ''}})
+
+    return merged, absorbed
+
+
+def _block_doc(check_in: datetime.datetime, check_out: datetime.datetime, **extra) -> dict:
+    booking = Booking(check_in_date=check_in, check_out_date=check_out)
+    booking.validate()
+    return dict(booking.to_mongo().to_dict(), **extra)
+
+
+async def add_snake(account, name, length, species, is_venomous) -> Snake:
+    snake = Snake()
+    snake.name = name
+    snake.length = length
+    snake.species = species
+    snake.is_venomous = is_venomous
+
+    snake.validate()
+    result = await _collection(Snake).insert_one(snake.to_mongo())
+    snake.id = result.inserted_id
+
+    await _add_to_owner(account, {'snake_ids': snake.id})
+    if mongo_setup.use_owner_summaries:
+        await _write_summaries(owner_summary.snake_added(account.id))
+
+    return snake
+
+
+async def _add_to_owner(account: Owner, values: dict):
+    owner = await _collection(Owner).find_one_and_update(
+        {'_id': account.id},
+        {'$addToSet': values},
+        projection={'cage_ids': 1, 'snake_ids': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if owner:
+        account.cage_ids = owner.get('cage_ids', [])
+        account.snake_ids = owner.get('snake_ids', [])
+
+
+async def get_snakes_for_user(user_id: bson.ObjectId) -> List[SnakeView]:
+    owner = await _collection(Owner).find_one({'_id': user_id}, {'snake_ids': 1})
+    docs = await _collection(Snake).find({'_id': {'$in': owner.get('snake_ids', [])}}).to_list(None)
+
+    return [SnakeView(d) for d in docs]
+
+
+async def get_available_cages(checkin: datetime.datetime,
+                              checkout: datetime.datetime, snake: Snake) -> List[CageView]:
+    min_size = snake.length / 4
+
+    cage_ids = None
+    if mongo_setup.use_day_calendar:
+        await _sync_calendars()
+        cage_ids = day_calendar.calendars.find_cage_ids(checkin, checkout)
+
+    if cage_ids is None:
+        await _sync_index()
+        cage_ids = availability.index.find_cage_ids(checkin, checkout)
+
+    cage_ids = list(cage_ids)
+    if not cage_ids:
+        return []
+
+    free_block = {
+        'check_in_date': {'$lte': checkin},
+        'check_out_date': {'$gte': checkout},
+        'guest_snake_id': None
+    }
+
+    if mongo_setup.use_bookings_collection:
+        cage_ids = await _collection(CageBooking, _search_db).distinct(
+            'cage_id', dict(free_block, cage_id={'$in': cage_ids}))
+        query = {'_id': {'$in': cage_ids}, 'square_meters': {'$gte': min_size}}
+    else:
+        query = {
+            '_id': {'$in': cage_ids},
+            'square_meters': {'$gte': min_size},
+            'bookings': {'$elemMatch': free_block}
+        }
+
+    if snake.is_venomous:
+        query['allow_dangerous_snakes'] = True
+
+    docs = _cage_reads(_search_db).find(query).sort(AVAILABLE_CAGES_ORDER)
+
+    return [CageView(d) async for d in docs]
+
+
+async def book_cage(account, snake, cage, checkin, checkout):
+    """
+        Async counterpart of data_service.book_cage: one conditional update that
+        raises CageAlreadyBookedError if the block was taken first.
+    """
+    booked_date = datetime.datetime.now()
+    if mongo_setup.use_bookings_collection:
+        original = await _collection(CageBooking).find_one_and_update(
+            {
+                'cage_id': cage.id,
+                'check_in_date': {'$lte': checkin},
+                'check_out_date': {'$gte': checkout},
+                'guest_snake_id': None
+            },
+            {'$set': {
+                'guest_owner_id': account.id,
+                'guest_snake_id': snake.id,
+                'check_in_date': checkin,
+                'check_out_date': checkout,
+                'booked_date': booked_date
+            }}
+        )
+    else:
+        before = await _collection(Cage).find_one_and_update(
+            *embedded_claim(cage.id, account.id, snake.id, checkin, checkout, booked_date))
+        original = before['bookings'][0] if before else None
+
+    availability.index.remove(cage.id, checkin, checkout)
+
+    if not original:
+        raise CageAlreadyBookedError(
+            "Cage {} is no longer available from {} to {}.".format(cage.name, checkin, checkout))
+
+    leftovers = availability.split(original['check_in_date'], original['check_out_date'], checkin, checkout)
+    if mongo_setup.use_bookings_collection:
+        if leftovers:
+            await _collection(CageBooking).insert_many([_block_doc(i, o, cage_id=cage.id) for i, o in leftovers])
+        await _collection(Cage).update_one({'_id': cage.id}, availability.STAMP)
+
+    for check_in, check_out in leftovers:
+        availability.index.add(cage.id, check_in, check_out)
+    if mongo_setup.use_day_calendar:
+        await _refresh_calendar(cage.id)
+    if mongo_setup.use_owner_summaries:
+        await _write_summaries(owner_summary.cage_booked(
+            account.id, snake, cage, checkin, checkout, booked_date))
+
+
+async def get_bookings_for_user(email: str) -> List[BookingView]:
+    account = await find_account_by_email(email)
+
+    model = CageBooking if mongo_setup.use_bookings_collection else Cage
+    rows = await _collection(model).aggregate(guest_bookings_pipeline(account.id))
+
+    return [booking_from_row(r) async for r in rows]
+
+
+async def get_owner_summary(account: Owner) -> OwnerSummary:
+    """
+        Async counterpart of data_service.get_owner_summary.
+    """
+    if mongo_setup.use_owner_summaries:
+        doc = await _collection(OwnerSummary).find_one({'_id': account.id})
+        if doc:
+            return OwnerSummary._from_son(doc)
+
+    cages = await find_cages_for_user(account)
+    return owner_summary.summarize(account.id, len(account.snake_ids), cages,
+                                   await get_bookings_for_user(account.email))
+
+
+async def _sync_index():
+    """
+        Async counterpart of availability.sync.
+    """
+    async with _index_lock:
+        if not availability.index.loaded:
+            query, projection, sort = availability.newest_stamp_query()
+            newest = await _collection(Cage).find_one(query, projection, sort=sort)
+            availability.tracker.reset(newest['availability_updated'] if newest else None)
+            availability.index.load(await _free_blocks())
+            return
+
+        stamps = await _collection(Cage).find(
+            availability.tracker.window(),
+            {'availability_updated': 1, 'availability_version': 1}
+        ).to_list(None)
+        changed = availability.tracker.changed(stamps)
+        if changed:
+            availability.refresh_cages(changed, await _free_blocks(changed))
+
+
+async def _free_blocks(cage_ids: Optional[List[bson.ObjectId]] = None):
+    """
+        The free blocks of the given cages, or of every cage.
+    """
+    if mongo_setup.use_bookings_collection:
+        query = {'guest_snake_id': None}
+        if cage_ids is not None:
+            query['cage_id'] = {'$in': cage_ids}
+        records = await _collection(CageBooking).find(
+            query, {'cage_id': 1, 'check_in_date': 1, 'check_out_date': 1, 'guest_snake_id': 1}
+        ).to_list(None)
+        return availability.blocks_from_records(records)
+
+    query = {'bookings.guest_snake_id': None} if cage_ids is None else {'_id': {'$in': cage_ids}}
+    cages = await _collection(Cage).find(
+        query, {'bookings.check_in_date': 1, 'bookings.check_out_date': 1, 'bookings.guest_snake_id': 1}
+    ).to_list(None)
+    return availability.blocks_from_cages(cages)
+
+
+async def _sync_calendars():
+    """
+        Async counterpart of day_calendar.sync.
+    """
+    async with _index_lock:
+        projection = {'calendar_start': 1, 'free_days': 1}
+        if not day_calendar.calendars.loaded:
+            query, stamp_projection, sort = availability.newest_stamp_query()
+            newest = await _collection(Cage).find_one(query, stamp_projection, sort=sort)
+            day_calendar.tracker.reset(newest['availability_updated'] if newest else None)
+            cages = await _collection(Cage).find({}, projection).to_list(None)
+            day_calendar.calendars.load(day_calendar.stored(cages), day_calendar.today())
+            return
+
+        stamps = await _collection(Cage).find(
+            day_calendar.tracker.window(),
+            {'availability_updated': 1, 'availability_version': 1}
+        ).to_list(None)
+        changed = day_calendar.tracker.changed(stamps)
+        if changed:
+            cages = await _collection(Cage).find({'_id': {'$in': changed}}, projection).to_list(None)
+            day_calendar.calendars.update(day_calendar.stored(cages))
+
+
+async def _refresh_calendar(cage_id: bson.ObjectId):
+    """
+        Async counterpart of day_calendar.refresh.
+    """
+    if mongo_setup.use_bookings_collection:
+        records = await _collection(CageBooking).find(
+            {'cage_id': cage_id, 'guest_snake_id': None},
+            {'check_in_date': 1, 'check_out_date': 1}
+        ).to_list(None)
+    else:
+        cage = await _collection(Cage).find_one({'_id': cage_id}, {'bookings': 1})
+        records = [b for b in (cage or {}).get('bookings', []) if b.get('guest_snake_id') is None]
+
+    start = day_calendar.today()
+    bits = day_calendar.bitmap_from_blocks([(r['check_in_date'], r['check_out_date']) for r in records], start)
+    await _collection(Cage).update_one({'_id': cage_id}, day_calendar.stored_update(start, bits))
+    day_calendar.calendars.set(cage_id, start, bits)
+
+
+async def _write_summaries(ops):
+    if ops:
+        await _collection(OwnerSummary).bulk_write(ops, ordered=False)
+
+
+def _booking_from_record(record: dict) -> BookingView:
+    return BookingView(record)
+
+
+command_stats.track_calls(globals())
@@ -0,0 +1,473 @@
+import datetime
+import random
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import bson
+
+from data.cage_bookings import CageBooking
+from data.cages import Cage
+import data.mongo_setup as mongo_setup
+
+Block = Tuple[datetime.datetime, datetime.datetime, bson.ObjectId]
+
+# Update operators every availability write adds for its cage, so other processes
+# can tell which cages to re-read (see ChangeTracker).
+STAMP = {'$inc': {'availability_version': 1}, '$currentDate': {'availability_updated': True}}
+
+# The same as the last stage of an update pipeline.
+STAMP_STAGE = {'$set': {
+    'availability_version': {'$add': [{'$ifNull': ['$availability_version', 0]}, 1]},
+    'availability_updated': '$$NOW',
+}}
+
+# How far back each poll looks again: a write commits a little after the server
+# stamps it, and stamps from different servers drift.
+SYNC_OVERLAP = datetime.timedelta(seconds=5)
+
+
+class _Node:
+    __slots__ = ('key', 'end', 'cage_id', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, start: datetime.datetime, end: datetime.datetime, cage_id: bson.ObjectId, seq: int):
+        self.key = (start, seq)
+        self.end = end
+        self.cage_id = cage_id
+        self.priority = random.random()
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+        self.max_end = end
+
+    @property
+    def start(self) -> datetime.datetime:
+        return self.key[0]
+
+
+class AvailabilityIndex:
+    """
+        Interval index over the free (unbooked) availability blocks of every cage.
+
+        Blocks are nodes of a treap (a randomized balanced search tree) ordered by
+        check-in date, each also holding the latest check-out date below it. Only
+        subtrees that can hold a block covering the stay are visited, so
+        find_cage_ids is O(log n) per cage found, and add / remove rebalance one
+        path in O(log n) instead of walking every cage and every booking.
+    """
+
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        self._by_cage: Dict[bson.ObjectId, List[_Node]] = {}
+        self._seq = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(nodes) for nodes in self._by_cage.values())
+
+    def load(self, blocks: Iterable[Block]):
+        with self._lock:
+            nodes = sorted((self._node(*b) for b in blocks), key=lambda n: n.key)
+            self._by_cage = {}
+            for n in nodes:
+                self._by_cage.setdefault(n.cage_id, []).append(n)
+
+            self._root = _build(nodes)
+            self._loaded = True
+
+    def clear(self):
+        with self._lock:
+            self._root = None
+            self._by_cage = {}
+            self._loaded = False
+
+    def add(self, cage_id: bson.ObjectId, check_in: datetime.datetime, check_out: datetime.datetime):
+        with self._lock:
+            node = self._node(check_in, check_out, cage_id)
+            self._by_cage.setdefault(cage_id, []).append(node)
+            self._root = _insert(self._root, node)
+
+    def remove(self, cage_id: bson.ObjectId, check_in: datetime.datetime, check_out: datetime.datetime) -> bool:
+        """
+            Remove the earliest free block of the cage covering [check_in, check_out].
+        :return: True if a block was removed.
+        """
+        with self._lock:
+            covering = [n for n in self._by_cage.get(cage_id, ()) if n.start <= check_in and n.end >= check_out]
+            if not covering:
+                return False
+
+            self._drop(min(covering, key=lambda n: n.key))
+            return True
+
+    def replace_cage(self, cage_id: bson.ObjectId, blocks: Iterable[Tuple[datetime.datetime, datetime.datetime]]):
+        """
+            Swap the cage's free blocks for the given ones, e.g. as just read from the database.
+        """
+        with self._lock:
+            for node in list(self._by_cage.get(cage_id, ())):
+                self._drop(node)
+            for check_in, check_out in blocks:
+                self.add(cage_id, check_in, check_out)
+
+    def blocks(self, cage_id: bson.ObjectId) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        with self._lock:
+            return sorted((n.start, n.end) for n in self._by_cage.get(cage_id, ()))
+
+    def find_cage_ids(self, checkin: datetime.datetime, checkout: datetime.datetime) -> Set[bson.ObjectId]:
+        with self._lock:
+            cage_ids = set()
+            stack = [self._root]
+            while stack:
+                node = stack.pop()
+                if node is None or node.max_end < checkout:
+                    continue
+
+                # Everything on the left starts no later than this block.
+                stack.append(node.left)
+                if node.start <= checkin:
+                    if node.end >= checkout:
+                        cage_ids.add(node.cage_id)
+                    stack.append(node.right)
+
+            return cage_ids
+
+    def _node(self, check_in: datetime.datetime, check_out: datetime.datetime, cage_id: bson.ObjectId) -> _Node:
+        self._seq += 1
+        return _Node(check_in, check_out, cage_id, self._seq)
+
+    def _drop(self, node: _Node):
+        nodes = self._by_cage[node.cage_id]
+        nodes.remove(node)
+        if not nodes:
+            del self._by_cage[node.cage_id]
+        self._root = _delete(self._root, node.key)
+
+
+def _update(node: _Node):
+    m = node.end
+    if node.left is not None and node.left.max_end > m:
+        m = node.left.max_end
+    if node.right is not None and node.right.max_end > m:
+        m = node.right.max_end
+    node.max_end = m
+
+
+def _split(node: Optional[_Node], key) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """
+        The nodes with keys before key, and the rest.
+    """
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        _update(node)
+        return node, right
+
+    left, node.left = _split(node.left, key)
+    _update(node)
+    return left, node
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _insert(root: Optional[_Node], node: _Node) -> _Node:
+    if root is None:
+        return node
+    if node.priority > root.priority:
+        node.left, node.right = _split(root, node.key)
+        _update(node)
+        return node
+
+    if node.key < root.key:
+        root.left = _insert(root.left, node)
+    else:
+        root.right = _insert(root.right, node)
+    _update(root)
+    return root
+
+
+def _delete(root: Optional[_Node], key) -> Optional[_Node]:
+    if root is None:
+        return None
+    if root.key == key:
+        return _merge(root.left, root.right)
+
+    if key < root.key:
+        root.left = _delete(root.left, key)
+    else:
+        root.right = _delete(root.right, key)
+    _update(root)
+    return root
+
+
+def _build(nodes: List[_Node]) -> Optional[_Node]:
+    """
+        Treap of nodes already sorted by key, in O(n) along the right spine. A node
+        is popped off the spine only once its subtree is final.
+    """
+    spine: List[_Node] = []
+    for node in nodes:
+        last = None
+        while spine and spine[-1].priority < node.priority:
+            last = spine.pop()
+            _update(last)
+        node.left = last
+        if spine:
+            spine[-1].right = node
+        spine.append(node)
+
+    root = spine[0] if spine else None
+    while spine:
+        _update(spine.pop())
+    return root
+
+
+class ChangeTracker:
+    """
+        Tells which cages' availability changed since the last poll, from the
+        stamps (STAMP) every availability write leaves on the cage: the server time
+        in availability_updated and a counter in availability_version. Each poll
+        reads the stamps from SYNC_OVERLAP before the newest one it has seen, and
+        reports the cages whose counter it has not seen yet.
+    """
+
+    def __init__(self):
+        self.since: Optional[datetime.datetime] = None
+        self._seen: Dict[bson.ObjectId, Tuple[int, datetime.datetime]] = {}
+
+    def reset(self, newest: Optional[datetime.datetime]):
+        """
+            Start over from the newest stamp, read just before a full load.
+        """
+        self.since = newest
+        self._seen = {}
+
+    def window(self) -> dict:
+        if self.since is None:
+            return {'availability_updated': {'$exists': True}}
+        return {'availability_updated': {'$gte': self.since - SYNC_OVERLAP}}
+
+    def changed(self, stamps: Iterable[dict]) -> List[bson.ObjectId]:
+        """
+            stamps are the cages matching window(), with _id, availability_updated and availability_version.
+        """
+        changed = []
+        for doc in stamps:
+            cage_id = doc['_id']
+            stamp = doc['availability_updated']
+            version = doc.get('availability_version', 0)
+
+            seen = self._seen.get(cage_id)
+            if seen is None or seen[0] != version:
+                changed.append(cage_id)
+            self._seen[cage_id] = (version, stamp)
+            if self.since is None or stamp > self.since:
+                self.since = stamp
+
+        if self.since is not None:
+            floor = self.since - SYNC_OVERLAP
+            self._seen = {k: v for k, v in self._seen.items() if v[1] >= floor}
+
+        return changed
+
+
+index = AvailabilityIndex()
+tracker = ChangeTracker()
+_sync_lock = threading.Lock()
+
+
+def ensure_loaded():
+    """
+        Load the index on first use: one full read of the free blocks.
+    """
+    with _sync_lock:
+        if not index.loaded:
+            _load()
+
+
+def sync():
+    """
+        Load the index on first use, then re-read the cages whose availability
+        changed since the last call, whichever process changed them.
+    """
+    with _sync_lock:
+        if not index.loaded:
+            _load()
+            return
+
+        stamps = Cage.objects(__raw__=tracker.window()) \
+            .only('id', 'availability_updated', 'availability_version') \
+            .as_pymongo()
+        changed = tracker.changed(stamps)
+        if changed:
+            refresh_cages(changed, free_blocks_of(changed))
+
+
+def refresh_cages(cage_ids: List[bson.ObjectId], blocks: Iterable[Block]):
+    """
+        Replace the index entries of the cages with their free blocks as read
+        from the database; cages without any are left with none.
+    """
+    by_cage = {cage_id: [] for cage_id in cage_ids}
+    for check_in, check_out, cage_id in blocks:
+        by_cage[cage_id].append((check_in, check_out))
+
+    for cage_id, cage_blocks in by_cage.items():
+        index.replace_cage(cage_id, cage_blocks)
+
+
+def newest_stamp_query() -> Tuple[dict, dict, list]:
+    """
+        filter, projection and sort finding the most recently changed cage.
+    """
+    return {'availability_updated': {'$exists': True}}, {'availability_updated': 1}, [('availability_updated', -1)]
+
+
+def _load():
+    query, projection, sort = newest_stamp_query()
+    newest = Cage._get_collection().find_one(query, projection, sort=sort)
+    tracker.reset(newest['availability_updated'] if newest else None)
+
+    if mongo_setup.use_bookings_collection:
+        records = CageBooking.objects(guest_snake_id=None) \
+            .only('cage_id', 'check_in_date', 'check_out_date') \
+            .as_pymongo()
+
+        index.load(blocks_from_records(records))
+        return
+
+    cages = Cage.objects(bookings__guest_snake_id=None) \
+        .only('id', 'bookings.check_in_date', 'bookings.check_out_date', 'bookings.guest_snake_id') \
+        .as_pymongo()
+
+    index.load(blocks_from_cages(cages))
+
+
+def free_blocks_of(cage_ids: List[bson.ObjectId]) -> Iterable[Block]:
+    """
+        The free blocks of the given cages, as stored.
+    """
+    if mongo_setup.use_bookings_collection:
+        records = CageBooking.objects(cage_id__in=cage_ids, guest_snake_id=None) \
+            .only('cage_id', 'check_in_date', 'check_out_date') \
+            .as_pymongo()
+        return blocks_from_records(records)
+
+    cages = Cage.objects(id__in=cage_ids) \
+        .only('id', 'bookings.check_in_date', 'bookings.check_out_date', 'bookings.guest_snake_id') \
+        .as_pymongo()
+    return blocks_from_cages(cages)
+
+
+def blocks_from_cages(cages: Iterable[dict]) -> Iterable[Block]:
+    """
+        Free blocks from raw cage documents with embedded bookings.
+    """
+    return (
+        (b['check_in_date'], b['check_out_date'], c['_id'])
+        for c in cages
+        for b in c.get('bookings', [])
+        if b.get('guest_snake_id') is None
+    )
+
+
+def blocks_from_records(records: Iterable[dict]) -> Iterable[Block]:
+    """
+        Free blocks from raw documents of the bookings collection.
+    """
+    return (
+        (r['check_in_date'], r['check_out_date'], r['cage_id'])
+        for r in records
+        if r.get('guest_snake_id') is None
+    )
+
+
+def coalesce(free_blocks: Sequence[dict], check_in: datetime.datetime,
+             check_out: datetime.datetime) -> Tuple[datetime.datetime, datetime.datetime, List[dict]]:
+    """
+        Merge the new free block [check_in, check_out] with the free blocks (raw
+        booking dicts) it overlaps or touches, directly or through each other.
+    :return: the merged block's check-in and check-out, and the blocks it absorbs.
+    """
+    absorbed = []
+    remaining = sorted(free_blocks, key=lambda b: b['check_in_date'])
+
+    merged = True
+    while merged:
+        merged = False
+        for b in remaining:
+            if b['check_in_date'] <= check_out and b['check_out_date'] >= check_in:
+                check_in = min(check_in, b['check_in_date'])
+                check_out = max(check_out, b['check_out_date'])
+                absorbed.append(b)
+                remaining.remove(b)
+                merged = True
+                break
+
+    return check_in, check_out, absorbed
+
+
+def coalesce_all(free_blocks: Sequence[dict],
+                 blocks: Iterable[Tuple[datetime.datetime, datetime.datetime]]) -> Tuple[List[Tuple[datetime.datetime, datetime.datetime]], List[dict]]:
+    """
+        coalesce for several new blocks: each is merged with the free blocks and
+        the new blocks before it.
+    :return: the merged new blocks, and the free blocks they absorb.
+    """
+    free = list(free_blocks)
+    for check_in, check_out in blocks:
+        check_in, check_out, absorbed = coalesce(free, check_in, check_out)
+        free = [b for b in free if not any(b is a for a in absorbed)]
+        free.append({'check_in_date': check_in, 'check_out_date': check_out})
+
+    kept = {id(b) for b in free}
+    existing = {id(b) for b in free_blocks}
+    merged = sorted((b['check_in_date'], b['check_out_date']) for b in free if id(b) not in existing)
+    return merged, [b for b in free_blocks if id(b) not in kept]
+
+
+def subtract(blocks: Iterable[Tuple[datetime.datetime, datetime.datetime]],
+             taken: Iterable[Tuple[datetime.datetime, datetime.datetime]]) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """
+        The parts of the blocks outside every taken block.
+    """
+    pieces = sorted(blocks)
+    for taken_in, taken_out in taken:
+        pieces = [
+            piece
+            for block_in, block_out in pieces
+            for piece in ([(block_in, block_out)] if taken_out <= block_in or block_out <= taken_in
+                          else split(block_in, block_out, max(block_in, taken_in), min(block_out, taken_out)))
+        ]
+    return pieces
+
+
+def split(block_in: datetime.datetime, block_out: datetime.datetime,
+          checkin: datetime.datetime, checkout: datetime.datetime) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+    """
+        The free pieces left of block [block_in, block_out] around a stay [checkin, checkout].
+    """
+    pieces = []
+    if block_in < checkin:
+        pieces.append((block_in, checkin))
+    if checkout < block_out:
+        pieces.append((checkout, block_out))
+    return pieces
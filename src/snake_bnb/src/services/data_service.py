@@ -1,13 +1,45 @@
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, TextIO, Tuple
 
+import collections
+import contextlib
+import csv
+import dataclasses
 import datetime
+import json
+import time
 
 import bson
+from bson.raw_bson import RawBSONDocument
+import mongoengine
+import pymongo
+import pymongo.errors
+from tqdm import tqdm
 
 from data.bookings import Booking
+from data.cage_bookings import CageBooking
 from data.cages import Cage
+import data.mongo_setup as mongo_setup
+from data.owner_summaries import OwnerSummary
 from data.owners import Owner
 from data.snakes import Snake
+from data.views import BookingView, CageView, OwnerView, SnakeView
+from infrastructure import command_stats, dates
+from infrastructure.lru_cache import LruTtlCache
+from services import availability, day_calendar, memory_backend, owner_summary
+from services.repository import Page, Repository
+
+# Every function below reads and writes through _repository(): MongoRepository,
+# or memory_backend.repository with MongoConfig.backend = 'memory'.
+
+# Owners by ('email', email) and ('id', id). Writes made through this module refresh
+# the entries; changes made elsewhere show up once the entry expires.
+owner_cache = LruTtlCache(max_size=10_000, ttl_seconds=60)
+
+# (price, square_meters, allow_dangerous_snakes) by cage id, for ordering and
+# filtering search candidates in-process (see _search_keys). They are set when
+# a cage is registered and never change, so entries only go stale if the data is
+# reloaded under the same ids; clear it with availability.index then.
+cage_search_fields = {}
 
 
 def create_account(name: str, email: str) -> Owner:
@@ -15,13 +47,24 @@ def create_account(name: str, email: str) -> Owner:
     owner.name = name
     owner.email = email
 
-    owner.save()
+    return _repository().add_owner(owner)
 
-    return owner
+
+def find_account_by_email(email: str) -> OwnerView:
+    return _repository().owner_by_email(email)
+
+
+def find_account_by_id(owner_id: bson.ObjectId) -> OwnerView:
+    return _repository().owner_by_id(owner_id)
 
 
-def find_account_by_email(email: str) -> Owner:
-    owner = Owner.objects(email=email).first()
+def _cache_owner(doc: dict) -> OwnerView:
+    """
+        Cache an owner document; the cache only ever holds OwnerViews.
+    """
+    owner = OwnerView(doc)
+    owner_cache.put(('email', owner.email), owner)
+    owner_cache.put(('id', owner.id), owner)
     return owner
 
 
@@ -36,34 +79,314 @@ def register_cage(active_account: Owner,
     cage.has_toys = has_toys
     cage.allow_dangerous_snakes = allow_dangerous
     cage.price = price
+    if mongo_setup.use_day_calendar:
+        day_calendar.start_empty(cage)
 
-    cage.save()
+    repository = _repository()
+    repository.add_cage(cage)
 
-    account = find_account_by_email(active_account.email)
-    account.cage_ids.append(cage.id)
-    account.save()
+    _add_to_owner(active_account, add_to_set__cage_ids=cage.id)
+    if mongo_setup.use_owner_summaries:
+        repository.write_summary(owner_summary.cage_registered(active_account.id, [cage.id]))
 
     return cage
 
 
-def find_cages_for_user(account: Owner) -> List[Cage]:
-    query = Cage.objects(id__in=account.cage_ids)
-    cages = list(query)
+def find_cages_for_user(account: Owner, fields: Sequence[str] = None,
+                        as_pymongo: bool = False) -> List[CageView]:
+    """
+        The host's cages as read-only data.views. fields limits what is loaded (e.g.
+        ('name', 'square_meters') or 'bookings.check_in_date'); as_pymongo returns the raw dicts.
+    """
+    return list(iter_cages_for_user(account, fields, as_pymongo))
+
+
+def iter_cages_for_user(account: Owner, fields: Sequence[str] = None,
+                        as_pymongo: bool = False) -> Iterator[CageView]:
+    return _repository().iter_cages(account.cage_ids, fields, as_pymongo)
+
+
+def _page(items: list, page_size: int, key) -> Page:
+    # items holds up to page_size + 1 results; the extra one only says there is a next page.
+    if len(items) <= page_size:
+        return Page(items)
+
+    items = items[:page_size]
+    return Page(items, key(items[-1]))
+
+
+def _with_bookings(query, fields, chunk_size: int = 100):
+    if not (mongo_setup.use_bookings_collection and _wants_bookings(fields)):
+        yield from query
+        return
+
+    chunk = []
+    for cage in query:
+        chunk.append(cage)
+        if len(chunk) >= chunk_size:
+            _attach_bookings(chunk, fields)
+            yield from chunk
+            chunk = []
+
+    _attach_bookings(chunk, fields)
+    yield from chunk
+
+
+def _views(docs: Iterable[dict], view, as_pymongo: bool):
+    # Raw dicts are decoded into read-only data.views unless the caller asked for the dicts.
+    return docs if as_pymongo else (view(d) for d in docs)
+
+
+def _lean(query, fields: Optional[Sequence[str]], as_pymongo: bool):
+    if fields:
+        query = query.only(*fields)
+    if as_pymongo:
+        query = query.as_pymongo()
+    return query
+
+
+def _find_cages(query: dict, sort: List[tuple], fields: Optional[Sequence[str]], as_pymongo: bool,
+                limit: int = 0, alias: str = mongo_setup.CORE_ALIAS) -> Iterator[dict]:
+    """
+        Raw cage dicts from a pymongo find, with fields as the projection. With
+        MongoConfig.lazy_bookings they are RawBSONDocuments, so CageView leaves each
+        bookings array undecoded until it is read. Not when bookings live in their
+        own collection: those are attached to plain dicts.
+    """
+    collection = mongoengine.get_db(alias)[Cage._get_collection_name()]
+    if mongo_setup.use_lazy_bookings and not as_pymongo and not mongo_setup.use_bookings_collection:
+        collection = collection.with_options(
+            codec_options=collection.codec_options.with_options(document_class=RawBSONDocument))
+
+    projection = {('_id' if f == 'id' else f): 1 for f in fields} if fields else None
+    return collection.find(query, projection, sort=sort, limit=limit)
+
+
+def _wants_bookings(fields: Optional[Sequence[str]]) -> bool:
+    return not fields or any(f == 'bookings' or f.startswith('bookings.') for f in fields)
+
 
-    return cages
+def _attach_bookings(cages: List[dict], fields: Optional[Sequence[str]] = None):
+    # Present collection-stored bookings as the raw cages' 'bookings' so callers see
+    # the same shape in both storage modes.
+    if not cages:
+        return
+
+    booking_fields = [f[len('bookings.'):] for f in fields or [] if f.startswith('bookings.')]
+
+    by_cage = {}
+    for c in cages:
+        c['bookings'] = []
+        by_cage[c['_id']] = c['bookings']
+
+    records = CageBooking.objects(cage_id__in=list(by_cage)).order_by('check_in_date')
+    if booking_fields:
+        records = records.only('cage_id', *booking_fields)
+
+    for r in records.as_pymongo():
+        bookings = by_cage[r.pop('cage_id')]
+        r.pop('_id', None)
+        bookings.append(r)
 
 
 def add_available_date(cage: Cage,
                        start_date: datetime.datetime, days: int) -> Cage:
-    booking = Booking()
-    booking.check_in_date = start_date
-    booking.check_out_date = start_date + datetime.timedelta(days=days)
+    """
+        Make [start_date, start_date + days] available. Free blocks it overlaps or
+        touches are merged into one, so the cage's list of blocks stays minimal and
+        sorted by check-in date.
+    """
+    check_in = start_date
+    check_out = start_date + datetime.timedelta(days=days)
 
-    cage = Cage.objects(id=cage.id).first()
-    cage.bookings.append(booking)
-    cage.save()
+    return _repository().add_block(cage.id, check_in, check_out)
+
+
+def _merged(cage_id: bson.ObjectId, merged: list, absorbed: List[dict]) -> list:
+    """
+        Apply a merge of new free blocks to the availability index.
+    :return: the owner summary updates for it.
+    """
+    for b in absorbed:
+        availability.index.remove(cage_id, b['check_in_date'], b['check_out_date'])
+    for check_in, check_out in merged:
+        availability.index.add(cage_id, check_in, check_out)
+
+    if not mongo_setup.use_owner_summaries:
+        return []
+    added = sum(owner_summary.nights(i, o) for i, o in merged) - sum(
+        owner_summary.nights(b['check_in_date'], b['check_out_date']) for b in absorbed)
+    return owner_summary.availability_added(cage_id, added)
+
+
+def _merge_block_records(cage_id: bson.ObjectId, blocks: list):
+    """
+        Merge new free blocks into the cage's booking records. The records they
+        absorb are deleted first, each only if still free, so a block booked in
+        the meantime is never covered by the merged one; while they are gone the
+        days briefly look unavailable. Merges of one cage run one at a time
+        (see _cage_lease), so they never write overlapping blocks.
+    :return: the merged new blocks, and the records they absorbed.
+    """
+    collection = CageBooking._get_collection()
+    with _cage_lease(cage_id):
+        touching = list(CageBooking.objects(
+            cage_id=cage_id,
+            guest_snake_id=None,
+            check_in_date__lte=max(o for _, o in blocks),
+            check_out_date__gte=min(i for i, _ in blocks)
+        ).as_pymongo())
+        _, absorbed = availability.coalesce_all(touching, blocks)
+
+        deleted, taken = [], []
+        for b in absorbed:
+            if collection.delete_one({'_id': b['_id'], 'guest_snake_id': None}).deleted_count:
+                deleted.append(b)
+            else:
+                taken.append((b['check_in_date'], b['check_out_date']))
+
+        merged, absorbed = availability.coalesce_all(deleted, availability.subtract(blocks, taken))
+        docs = [b for b in deleted if not any(b is a for a in absorbed)]
+        docs += [CageBooking(cage_id=cage_id, check_in_date=i, check_out_date=o).to_mongo().to_dict()
+                 for i, o in merged]
+        if docs:
+            collection.insert_many(docs)
+
+    return merged, absorbed
+
+
+# How long a merge may hold a cage before other writers take the cage over.
+LEASE_SECONDS = 30
+
+
+@contextlib.contextmanager
+def _cage_lease(cage_id: bson.ObjectId):
+    """
+        Hold the cage for one collection-mode merge: a lease on the cage document
+        that other merges wait for, taken over once it expires.
+    """
+    collection = Cage._get_collection()
+    token = bson.ObjectId()
+    while not collection.update_one(*lease_update(cage_id, token)).matched_count:
+        if not collection.count_documents({'_id': cage_id}, limit=1):
+            raise ValueError('Unknown cage: {}'.format(cage_id))
+        time.sleep(0.01)
+
+    try:
+        yield
+    finally:
+        collection.update_one({'_id': cage_id, 'merge_lease': token},
+                              {'$unset': {'merge_lease': '', 'merge_lease_expires': ''}})
+
+
+def lease_update(cage_id: bson.ObjectId, token: bson.ObjectId) -> Tuple[dict, dict]:
+    """
+        Filter and update taking the merge lease of a cage that is free or expired.
+    """
+    now = datetime.datetime.utcnow()
+    return (
+        {'_id': cage_id, '$or': [{'merge_lease': None}, {'merge_lease_expires': {'$lt': now}}]},
+        {'$set': {'merge_lease': token, 'merge_lease_expires': now + datetime.timedelta(seconds=LEASE_SECONDS)}}
+    )
+
+
+def _stamp(cage_id: bson.ObjectId) -> Optional[dict]:
+    """
+        Mark the cage's availability as changed for the other processes'
+        availability indexes (see availability.ChangeTracker); returns the cage.
+    """
+    return Cage._get_collection().find_one_and_update(
+        {'_id': cage_id}, availability.STAMP, return_document=pymongo.ReturnDocument.AFTER)
+
+
+def _merge_embedded_blocks(cage_id: bson.ObjectId, blocks: list):
+    """
+        Merge new free blocks into the cage's embedded bookings in one update (see
+        embedded_merge).
+    :return: the merged new blocks, the free blocks they absorbed, and the cage
+        with its free blocks after the merge; None if there is no such cage.
+    """
+    before = Cage._get_collection().find_one_and_update(*embedded_merge(cage_id, blocks))
+    return embedded_merged(before, blocks)
 
-    return cage
+
+def embedded_merge(cage_id: bson.ObjectId, blocks: list) -> Tuple[dict, list, dict]:
+    """
+        The update merging new free blocks into a cage's embedded bookings on the
+        server, the same as availability.coalesce_all: each new block takes in
+        the free blocks it overlaps or touches, directly or through each other,
+        and the array stays sorted by check-in date.
+    :return: the filter, the update pipeline, and a projection of the cage with
+        only its free blocks, for find_one_and_update to return as they were.
+    """
+    pipeline = []
+    for check_in, check_out in blocks:
+        span = {'check_in_date': check_in, 'check_out_date': check_out}
+        pipeline += [
+            # Sorted by check-in, one pass each way reaches every block chained to the new one.
+            {'$set': {'_merged': _grow_span('$bookings', span)}},
+            {'$set': {'_merged': _grow_span({'$reverseArray': '$bookings'}, '$_merged')}},
+            {'$set': {'bookings': {'$concatArrays': [
+                _kept_blocks({'$lte': ['$$b.check_in_date', '$_merged.check_in_date']}),
+                [{'$mergeObjects': ['$_merged', {'rating': 0}]}],
+                _kept_blocks({'$gt': ['$$b.check_in_date', '$_merged.check_in_date']}),
+            ]}}},
+        ]
+    pipeline += [{'$unset': '_merged'}, availability.STAMP_STAGE]
+
+    projection = {f.db_field: 1 for name, f in Cage._fields.items() if name not in ('id', 'bookings')}
+    projection['bookings'] = {'$filter': {'input': '$bookings', 'as': 'b', 'cond': _is_free('$$b')}}
+    return {'_id': cage_id}, pipeline, projection
+
+
+def embedded_merged(before: Optional[dict], blocks: list):
+    """
+        The outcome of an embedded_merge update, from the cage it returned.
+    :return: the merged new blocks, the free blocks they absorbed, and the cage
+        with its free blocks after the merge; None if there was no such cage.
+    """
+    if before is None:
+        return None
+
+    free = before.get('bookings') or []
+    merged, absorbed = availability.coalesce_all(free, blocks)
+    kept = [b for b in free if not any(b is a for a in absorbed)]
+    added = [Booking(check_in_date=i, check_out_date=o).to_mongo().to_dict() for i, o in merged]
+    before['bookings'] = sorted(kept + added, key=lambda b: b['check_in_date'])
+    return merged, absorbed, before
+
+
+def _is_free(booking: str) -> dict:
+    return {'$eq': [{'$ifNull': [booking + '.guest_snake_id', None]}, None]}
+
+
+def _touches(booking: str, span: str) -> dict:
+    return {'$and': [
+        _is_free(booking),
+        {'$lte': [booking + '.check_in_date', span + '.check_out_date']},
+        {'$gte': [booking + '.check_out_date', span + '.check_in_date']},
+    ]}
+
+
+def _grow_span(bookings, span) -> dict:
+    return {'$reduce': {
+        'input': {'$ifNull': [bookings, []]},
+        'initialValue': span,
+        'in': {'$cond': [
+            _touches('$$this', '$$value'),
+            {'check_in_date': {'$min': ['$$this.check_in_date', '$$value.check_in_date']},
+             'check_out_date': {'$max': ['$$this.check_out_date', '$$value.check_out_date']}},
+            '$$value',
+        ]},
+    }}
+
+
+def _kept_blocks(position: dict) -> dict:
+    return {'$filter': {
+        'input': {'$ifNull': ['$bookings', []]},
+        'as': 'b',
+        'cond': {'$and': [position, {'$not': [_touches('$$b', '$_merged')]}]},
+    }}
 
 
 def add_snake(account, name, length, species, is_venomous) -> Snake:
@@ -72,78 +395,783 @@ def add_snake(account, name, length, species, is_venomous) -> Snake:
     snake.length = length
     snake.species = species
     snake.is_venomous = is_venomous
-    snake.save()
 
-    owner = find_account_by_email(account.email)
-    owner.snake_ids.append(snake.id)
-    owner.save()
+    repository = _repository()
+    repository.add_snake(snake)
+
+    _add_to_owner(account, add_to_set__snake_ids=snake.id)
+    if mongo_setup.use_owner_summaries:
+        repository.write_summary(owner_summary.snake_added(account.id))
 
     return snake
 
 
-def get_snakes_for_user(user_id: bson.ObjectId) -> List[Snake]:
-    owner = Owner.objects(id=user_id).first()
-    snakes = Snake.objects(id__in=owner.snake_ids).all()
+def _add_to_owner(account: Owner, **update):
+    """
+        Atomically $addToSet onto the owner (a list value adds each item) and refresh the caller's Owner in place
+        from the updated owner the repository returns, so no reload is needed afterwards.
+    """
+    owner = _repository().add_to_owner(account.id, **update)
+    if owner and owner is not account:
+        account.cage_ids = owner.cage_ids
+        account.snake_ids = owner.snake_ids
+
 
-    return list(snakes)
+def get_snakes_for_user(user_id: bson.ObjectId, fields: Sequence[str] = None,
+                        as_pymongo: bool = False) -> List[SnakeView]:
+    owner = find_account_by_id(user_id)
+    return _repository().snakes(owner.snake_ids, fields, as_pymongo)
 
 
 def get_available_cages(checkin: datetime.datetime,
-                        checkout: datetime.datetime, snake: Snake) -> List[Cage]:
+                        checkout: datetime.datetime, snake: Snake,
+                        fields: Sequence[str] = None, as_pymongo: bool = False) -> List[CageView]:
+    """
+        Cages with a free block covering [checkin, checkout] that suit the snake,
+        cheapest and then largest first. fields / as_pymongo as in find_cages_for_user.
+    """
+    return list(iter_available_cages(checkin, checkout, snake, fields, as_pymongo))
+
+
+def iter_available_cages(checkin: datetime.datetime,
+                         checkout: datetime.datetime, snake: Snake,
+                         fields: Sequence[str] = None, as_pymongo: bool = False) -> Iterator[CageView]:
+    return _repository().iter_available_cages(checkin, checkout, snake, fields, as_pymongo)
+
+
+def get_available_cages_page(checkin: datetime.datetime,
+                             checkout: datetime.datetime, snake: Snake,
+                             after: Optional[tuple] = None, page_size: int = 25,
+                             fields: Sequence[str] = None, as_pymongo: bool = False) -> Page:
+    return _repository().available_cages_page(checkin, checkout, snake, after, page_size, fields, as_pymongo)
+
+
+# Cheapest, then largest first; the id keeps the order total for keyset pagination.
+AVAILABLE_CAGES_ORDER = [('price', pymongo.ASCENDING), ('square_meters', pymongo.DESCENDING),
+                         ('_id', pymongo.ASCENDING)]
+
+
+def _candidate_cage_ids(checkin: datetime.datetime, checkout: datetime.datetime) -> Set[bson.ObjectId]:
+    cage_ids = None
+    if mongo_setup.use_day_calendar:
+        day_calendar.sync()
+        cage_ids = day_calendar.calendars.find_cage_ids(checkin, checkout)
+
+    # Stays outside the calendar's horizon, cages without one, or no calendar: use the interval index.
+    if cage_ids is None:
+        availability.sync()
+        cage_ids = availability.index.find_cage_ids(checkin, checkout)
+
+    return cage_ids
+
+
+def _available_cages_query(checkin: datetime.datetime, checkout: datetime.datetime, snake: Snake,
+                           cage_ids: Optional[Iterable[bson.ObjectId]] = None) -> Optional[dict]:
+    """
+        The cages filter of a search, for AVAILABLE_CAGES_ORDER on the search alias;
+        None when no cage is free for the stay. cage_ids limits it to those candidates.
+    """
     min_size = snake.length / 4
 
-    query = Cage.objects() \
-        .filter(square_meters__gte=min_size) \
-        .filter(bookings__check_in_date__lte=checkin) \
-        .filter(bookings__check_out_date__gte=checkout)
+    if cage_ids is None:
+        cage_ids = _candidate_cage_ids(checkin, checkout)
+    if not cage_ids:
+        return None
+
+    # The index catches up with other processes' writes on every search, but a
+    # booking can still land in between, so the free block is re-checked here.
+    if mongo_setup.use_bookings_collection:
+        cage_ids = CageBooking.objects(
+            cage_id__in=list(cage_ids),
+            check_in_date__lte=checkin,
+            check_out_date__gte=checkout,
+            guest_snake_id=None
+        ).using(mongo_setup.search_alias).distinct('cage_id')
+
+    query = {'_id': {'$in': list(cage_ids)}, 'square_meters': {'$gte': min_size}}
+    if not mongo_setup.use_bookings_collection:
+        query['bookings'] = {'$elemMatch': {
+            'check_in_date': {'$lte': checkin},
+            'check_out_date': {'$gte': checkout},
+            'guest_snake_id': None
+        }}
 
     if snake.is_venomous:
-        query = query.filter(allow_dangerous_snakes=True)
+        query['allow_dangerous_snakes'] = True
 
-    cages = query.order_by('price', '-square_meters')
+    return query
 
-    final_cages = []
-    for c in cages:
-        for b in c.bookings:
-            if b.check_in_date <= checkin and b.check_out_date >= checkout and b.guest_snake_id is None:
-                final_cages.append(c)
 
-    return final_cages
+def _search_keys(cage_ids: Iterable[bson.ObjectId], snake: Snake, after: Optional[tuple]) -> List[tuple]:
+    """
+        The (price, -square_meters, id) keys of the candidate cages that suit the
+        snake, in AVAILABLE_CAGES_ORDER and past the page key after= when given.
+        Fields of cages not seen before are read once into cage_search_fields.
+    """
+    missing = [i for i in cage_ids if i not in cage_search_fields]
+    if missing:
+        collection = mongoengine.get_db(mongo_setup.search_alias)[Cage._get_collection_name()]
+        projection = {'price': 1, 'square_meters': 1, 'allow_dangerous_snakes': 1}
+        for c in collection.find({'_id': {'$in': missing}}, projection):
+            cage_search_fields[c['_id']] = (c['price'], c['square_meters'], c.get('allow_dangerous_snakes', False))
+
+    min_size = snake.length / 4
+    start = (after[0], -after[1], after[2]) if after else None
+
+    keys = []
+    for cage_id in cage_ids:
+        fields = cage_search_fields.get(cage_id)
+        if fields is None:
+            continue
+        price, square_meters, allow_dangerous = fields
+        if square_meters < min_size or (snake.is_venomous and not allow_dangerous):
+            continue
+        key = (price, -square_meters, cage_id)
+        if start is None or key > start:
+            keys.append(key)
+
+    keys.sort()
+    return keys
+
+
+class CageAlreadyBookedError(Exception):
+    pass
 
 
 def book_cage(account, snake, cage, checkin, checkout):
-    booking: Optional[Booking] = None
+    """
+        Claim a free block of the cage covering [checkin, checkout] with a single
+        conditional update. The free days before and after the stay are added back
+        as their own blocks. Raises CageAlreadyBookedError if no free block is left,
+        e.g. because another guest booked it first.
+    """
+    if not _repository().claim(account, snake, cage, checkin, checkout):
+        raise CageAlreadyBookedError(
+            "Cage {} is no longer available from {} to {}.".format(cage.name, checkin, checkout))
+
+
+def _claim_block_record(account, snake, cage, checkin, checkout, booked_date) -> Optional[tuple]:
+    """
+        :return: the claimed block's original (check-in, check-out), or None.
+    """
+    original = CageBooking.objects(
+        cage_id=cage.id,
+        check_in_date__lte=checkin,
+        check_out_date__gte=checkout,
+        guest_snake_id=None
+    ).modify(
+        set__guest_owner_id=account.id,
+        set__guest_snake_id=snake.id,
+        set__check_in_date=checkin,
+        set__check_out_date=checkout,
+        set__booked_date=booked_date
+    )
+    if not original:
+        return None
+
+    leftovers = availability.split(original.check_in_date, original.check_out_date, checkin, checkout)
+    if leftovers:
+        CageBooking.objects.insert([
+            CageBooking(cage_id=cage.id, check_in_date=check_in, check_out_date=check_out)
+            for check_in, check_out in leftovers
+        ], load_bulk=False)
+    _stamp(cage.id)
 
-    for b in cage.bookings:
-        if b.check_in_date <= checkin and b.check_out_date >= checkout and b.guest_snake_id is None:
-            booking = b
-            break
+    return original.check_in_date, original.check_out_date
 
-    booking.guest_owner_id = account.id
-    booking.guest_snake_id = snake.id
-    booking.check_in_date = checkin
-    booking.check_out_date = checkout
-    booking.booked_date = datetime.datetime.now()
 
-    cage.save()
+def _claim_embedded_block(account, snake, cage, checkin, checkout, booked_date) -> Optional[tuple]:
+    """
+        Book the stay and add back the free days around it in one update (see embedded_claim).
+    :return: the claimed block's original (check-in, check-out), or None.
+    """
+    before = Cage._get_collection().find_one_and_update(
+        *embedded_claim(cage.id, account.id, snake.id, checkin, checkout, booked_date))
+    if not before:
+        return None
 
+    original = before['bookings'][0]
+    return original['check_in_date'], original['check_out_date']
 
-def get_bookings_for_user(email: str) -> List[Booking]:
+
+def embedded_claim(cage_id: bson.ObjectId, guest_id: bson.ObjectId, snake_id: bson.ObjectId,
+                   checkin: datetime.datetime, checkout: datetime.datetime,
+                   booked_date: datetime.datetime) -> Tuple[dict, list, dict]:
+    """
+        The update booking [checkin, checkout] in a cage's embedded bookings: it
+        matches only while a free block covers the stay, and on the server the
+        first such block becomes the stay, with the days around it added back as
+        free blocks in its place.
+    :return: the filter, the update pipeline, and a projection returning just
+        the claimed block as it was.
+    """
+    covering = {'guest_snake_id': None, 'check_in_date': {'$lte': checkin}, 'check_out_date': {'$gte': checkout}}
+    covers = {'$and': [
+        _is_free('$$b'),
+        {'$lte': ['$$b.check_in_date', checkin]},
+        {'$gte': ['$$b.check_out_date', checkout]},
+    ]}
+
+    def items(start, end):
+        return {'$map': {'input': {'$range': [start, end]}, 'as': 'i', 'in': {'$arrayElemAt': ['$bookings', '$$i']}}}
+
+    pipeline = [
+        {'$set': {'_claimed': {'$indexOfArray': [
+            {'$map': {'input': '$bookings', 'as': 'b', 'in': covers}}, True]}}},
+        {'$set': {'bookings': {'$let': {
+            'vars': {'block': {'$arrayElemAt': ['$bookings', '$_claimed']}},
+            'in': {'$concatArrays': [
+                items(0, '$_claimed'),
+                {'$cond': [{'$lt': ['$$block.check_in_date', checkin]},
+                           [{'check_in_date': '$$block.check_in_date', 'check_out_date': checkin, 'rating': 0}],
+                           []]},
+                [{'$mergeObjects': ['$$block', {
+                    'guest_owner_id': guest_id,
+                    'guest_snake_id': snake_id,
+                    'check_in_date': checkin,
+                    'check_out_date': checkout,
+                    'booked_date': booked_date,
+                }]}],
+                {'$cond': [{'$gt': ['$$block.check_out_date', checkout]},
+                           [{'check_in_date': checkout, 'check_out_date': '$$block.check_out_date', 'rating': 0}],
+                           []]},
+                items({'$add': ['$_claimed', 1]}, {'$size': '$bookings'}),
+            ]},
+        }}}},
+        {'$unset': '_claimed'},
+        availability.STAMP_STAGE,
+    ]
+    return {'_id': cage_id, 'bookings': {'$elemMatch': covering}}, pipeline, {'bookings': {'$elemMatch': covering}}
+
+
+def get_bookings_for_user(email: str) -> List[BookingView]:
+    return list(iter_bookings_for_user(email))
+
+
+def iter_bookings_for_user(email: str) -> Iterator[BookingView]:
+    """
+        The guest's bookings, streamed from a single aggregation. Each booking has
+        .cage and .snake documents carrying just their names.
+    """
     account = find_account_by_email(email)
+    return _repository().iter_guest_bookings(account.id)
+
 
-    booked_cages = Cage.objects() \
-        .filter(bookings__guest_owner_id=account.id) \
-        .only('bookings', 'name')
+def guest_bookings_pipeline(owner_id: bson.ObjectId) -> List[dict]:
+    """
+        Aggregation returning the guest's bookings flattened to one row each, joined
+        with the cage and snake names: {booking, cage_id, cage_name, snake_name}.
+        Rows are ordered by booking id, or by cage id and check-in date for
+        embedded bookings (a cage's stays never overlap, and unlike the array
+        position the check-in date survives rewrites of the array).
 
-    def map_cage_to_booking(cage, booking):
-        booking.cage = cage
-        return booking
+        Runs on the cages collection, or on the bookings collection when bookings
+        are stored separately.
+    """
+    if mongo_setup.use_bookings_collection:
+        return [
+            {'$match': {'guest_owner_id': owner_id}},
+            {'$sort': {'_id': 1}},
+            {'$project': {'_id': 0, 'booking': '$$ROOT'}},
+            _lookup_name('cages', '$booking.cage_id', 'cage'),
+            _lookup_name('snakes', '$booking.guest_snake_id', 'snake'),
+            {'$project': {
+                'booking': 1,
+                'cage_id': '$booking.cage_id',
+                'cage_name': {'$arrayElemAt': ['$cage.name', 0]},
+                'snake_name': {'$arrayElemAt': ['$snake.name', 0]},
+            }},
+        ]
 
-    bookings = [
-        map_cage_to_booking(cage, booking)
-        for cage in booked_cages
-        for booking in cage.bookings
-        if booking.guest_owner_id == account.id
+    return [
+        {'$match': {'bookings.guest_owner_id': owner_id}},
+        {'$unwind': '$bookings'},
+        {'$match': {'bookings.guest_owner_id': owner_id}},
+        {'$sort': {'_id': 1, 'bookings.check_in_date': 1}},
+        _lookup_name('snakes', '$bookings.guest_snake_id', 'snake'),
+        {'$project': {
+            '_id': 0,
+            'booking': '$bookings',
+            'cage_id': '$_id',
+            'cage_name': '$name',
+            'snake_name': {'$arrayElemAt': ['$snake.name', 0]},
+        }},
     ]
 
-    return bookings
+
+def _lookup_name(collection: str, local_field: str, as_field: str) -> dict:
+    return {'$lookup': {
+        'from': collection,
+        'localField': local_field.lstrip('$'),
+        'foreignField': '_id',
+        'as': as_field,
+    }}
+
+
+def _aggregate_bookings(pipeline: List[dict]):
+    model = CageBooking if mongo_setup.use_bookings_collection else Cage
+    return model._get_collection().aggregate(pipeline)
+
+
+def booking_from_row(row: dict) -> BookingView:
+    booking = BookingView(row['booking'])
+
+    booking.cage = CageView({'_id': row['cage_id'], 'name': row.get('cage_name')})
+    if row.get('snake_name') is not None:
+        booking.snake = SnakeView({'_id': booking.guest_snake_id, 'name': row['snake_name']})
+
+    return booking
+
+
+# ---------------------------------------------------------------------------
+# Dashboard summary
+# ---------------------------------------------------------------------------
+
+def get_owner_summary(account: Owner) -> OwnerSummary:
+    """
+        The owner's dashboard: one point read when MongoConfig.owner_summaries is
+        on, otherwise (or before tools.rebuild_summaries has run) computed from
+        their cages and bookings.
+    """
+    if mongo_setup.use_owner_summaries:
+        summary = _repository().stored_summary(account.id)
+        if summary:
+            return summary
+
+    return compute_owner_summary(account)
+
+
+def compute_owner_summary(account: Owner) -> OwnerSummary:
+    cages = find_cages_for_user(account, fields=(
+        'name', 'bookings.guest_owner_id', 'bookings.guest_snake_id', 'bookings.booked_date',
+        'bookings.check_in_date', 'bookings.check_out_date'
+    ))
+    return owner_summary.summarize(account.id, len(account.snake_ids), cages,
+                                   iter_bookings_for_user(account.email))
+
+
+def rebuild_owner_summaries(batch_size: int = 1000) -> int:
+    """
+        Recompute and overwrite every owner's summary, e.g. after turning the option
+        on for existing data. Returns the number of owners.
+    """
+    count = 0
+    batch = []
+    for doc in Owner.objects().as_pymongo().batch_size(batch_size):
+        batch.append(owner_summary.replace(compute_owner_summary(OwnerView(doc))))
+        count += 1
+        if len(batch) >= batch_size:
+            OwnerSummary._get_collection().bulk_write(batch, ordered=False)
+            batch = []
+
+    if batch:
+        OwnerSummary._get_collection().bulk_write(batch, ordered=False)
+    return count
+
+
+# ---------------------------------------------------------------------------
+# Bulk import
+# ---------------------------------------------------------------------------
+
+@dataclasses.dataclass
+class BulkResult:
+    """
+        Outcome of a bulk import. errors holds (row number, message) for every row
+        that was rejected; the rest of the batch is still written.
+    """
+    inserted: int = 0
+    errors: List[Tuple[int, str]] = dataclasses.field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return (self.inserted + len(self.errors)) / self.seconds if self.seconds else 0.0
+
+
+def bulk_register_cages(account: Owner, rows: Iterable[dict],
+                        batch_size: int = 1000, progress: bool = True) -> BulkResult:
+    """
+        Register many cages for one host. Each row has the Cage field names
+        (name, price, square_meters, is_carpeted, has_toys, allow_dangerous_snakes).
+    """
+    def write(batch):
+        if mongo_setup.use_day_calendar:
+            for _, cage in batch:
+                day_calendar.start_empty(cage)
+        ids = _insert_documents(Cage, batch, result)
+        if ids:
+            _add_to_owner(account, add_to_set__cage_ids=ids)
+            if mongo_setup.use_owner_summaries:
+                _repository().write_summary(owner_summary.cage_registered(account.id, ids))
+
+    result = BulkResult()
+    _run_batches(Cage, rows, batch_size, progress, result, write)
+    return result
+
+
+def bulk_add_snakes(account: Owner, rows: Iterable[dict],
+                    batch_size: int = 1000, progress: bool = True) -> BulkResult:
+    """
+        Add many snakes for one owner. Each row has the Snake field names
+        (name, species, length, is_venomous).
+    """
+    def write(batch):
+        ids = _insert_documents(Snake, batch, result)
+        if ids:
+            _add_to_owner(account, add_to_set__snake_ids=ids)
+            if mongo_setup.use_owner_summaries:
+                _repository().write_summary(owner_summary.snake_added(account.id, len(ids)))
+
+    result = BulkResult()
+    _run_batches(Snake, rows, batch_size, progress, result, write)
+    return result
+
+
+def bulk_add_available_dates(rows: Iterable[dict],
+                             batch_size: int = 1000, progress: bool = True) -> BulkResult:
+    """
+        Add many availability blocks. Each row has cage_id, check_in_date and either
+        check_out_date or days. Blocks for unknown cages are reported as errors.
+    """
+    def write(batch):
+        inserted, errors = _repository().add_blocks(batch)
+        result.inserted += inserted
+        result.errors.extend(errors)
+
+    result = BulkResult()
+    _run_batches(CageBooking, rows, batch_size, progress, result, write, prepare=_block_row)
+    return result
+
+
+def _write_error(x: pymongo.errors.OperationFailure) -> str:
+    if isinstance(x, pymongo.errors.BulkWriteError):
+        errors = x.details.get('writeErrors') or [{}]
+        return errors[0].get('errmsg', str(x))
+    return (x.details or {}).get('errmsg', str(x))
+
+
+def read_rows(stream: TextIO, fmt: str = 'csv') -> Iterator[dict]:
+    """
+        Rows for the bulk_* functions from a CSV (with header) or JSON-lines stream.
+    """
+    if fmt == 'csv':
+        return csv.DictReader(stream)
+    if fmt in ('jsonl', 'json-lines'):
+        return (json.loads(line) for line in stream if line.strip())
+
+    raise ValueError("Unknown bulk format: {}".format(fmt))
+
+
+def _block_row(row: dict) -> dict:
+    row = dict(row)
+    days = row.pop('days', None)
+    if not row.get('check_out_date') and days not in (None, ''):
+        check_in = _to_datetime(row['check_in_date'])
+        row['check_in_date'] = check_in
+        row['check_out_date'] = check_in + datetime.timedelta(days=int(days))
+
+    check_in, check_out = row.get('check_in_date'), row.get('check_out_date')
+    if check_in and check_out and _to_datetime(check_out) <= _to_datetime(check_in):
+        raise ValueError('check_out_date must be after check_in_date.')
+    return row
+
+
+def _run_batches(model, rows, batch_size, progress, result, write, prepare=None):
+    started = time.perf_counter()
+
+    batch = []
+    for row_number, row in enumerate(tqdm(rows, unit='row', disable=not progress), start=1):
+        try:
+            if prepare:
+                row = prepare(row)
+            batch.append((row_number, _build_document(model, row)))
+        except (ValueError, TypeError, KeyError, OverflowError,
+                bson.errors.InvalidId, mongoengine.ValidationError) as x:
+            result.errors.append((row_number, str(x)))
+
+        if len(batch) >= batch_size:
+            write(batch)
+            batch = []
+
+    if batch:
+        write(batch)
+
+    result.errors.sort()
+    result.seconds = time.perf_counter() - started
+
+
+def _build_document(model, row: dict):
+    doc = model()
+    for key, value in row.items():
+        if key is None:
+            raise ValueError('Row has more values than columns.')
+
+        field = model._fields.get(key)
+        if field is None or key == 'id':
+            raise ValueError('Unknown field: {}'.format(key))
+        setattr(doc, key, _coerce(field, value))
+
+    doc.validate()
+    return doc
+
+
+_TRUE = ('1', 'true', 'yes', 'y')
+_FALSE = ('0', 'false', 'no', 'n')
+
+
+def _coerce(field, value):
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            # A blank cell is a missing value: required fields are reported, defaults apply.
+            return None
+        if isinstance(field, mongoengine.BooleanField):
+            if value.lower() in _TRUE:
+                return True
+            if value.lower() in _FALSE:
+                return False
+            raise ValueError('Not a true/false value for {}: {}'.format(field.name, value))
+        if isinstance(field, mongoengine.DateTimeField):
+            return _to_datetime(value)
+        if isinstance(field, mongoengine.ObjectIdField):
+            return bson.ObjectId(value)
+
+    return field.to_python(value)
+
+
+def _to_datetime(value) -> datetime.datetime:
+    return dates.parse_date(value)
+
+
+def _insert_documents(model, batch, result: BulkResult) -> List[bson.ObjectId]:
+    """
+        Insert validated documents; rows the storage rejects are added to
+        result.errors. Returns the ids that were written.
+    """
+    if not batch:
+        return []
+
+    ids, errors = _repository().insert_documents(model, batch)
+    result.errors.extend(errors)
+    result.inserted += len(ids)
+    return ids
+
+
+# ---------------------------------------------------------------------------
+# MongoDB storage
+# ---------------------------------------------------------------------------
+
+class MongoRepository:
+    """
+        The repository over the models in data/. Writes also keep the
+        availability index, the day calendars and the owner summaries current.
+    """
+
+    def add_owner(self, owner: Owner) -> Owner:
+        owner.save()
+        _cache_owner(owner.to_mongo())
+        return owner
+
+    def owner_by_email(self, email: str) -> Optional[OwnerView]:
+        owner = owner_cache.get(('email', email))
+        if owner:
+            return owner
+
+        doc = Owner.objects(email=email).as_pymongo().first()
+        return _cache_owner(doc) if doc else None
+
+    def owner_by_id(self, owner_id: bson.ObjectId) -> Optional[OwnerView]:
+        owner = owner_cache.get(('id', owner_id))
+        if owner:
+            return owner
+
+        doc = Owner.objects(id=owner_id).as_pymongo().first()
+        return _cache_owner(doc) if doc else None
+
+    def add_to_owner(self, owner_id: bson.ObjectId, **update) -> Optional[Owner]:
+        owner = Owner.objects(id=owner_id).modify(new=True, **update)
+        if owner:
+            _cache_owner(owner.to_mongo())
+        return owner
+
+    def add_snake(self, snake: Snake) -> Snake:
+        return snake.save()
+
+    def add_cage(self, cage: Cage) -> Cage:
+        return cage.save()
+
+    def snakes(self, snake_ids, fields=None, as_pymongo=False) -> List[SnakeView]:
+        snakes = _lean(Snake.objects(id__in=snake_ids), fields, True)
+        return list(_views(snakes, SnakeView, as_pymongo))
+
+    def iter_cages(self, cage_ids, fields=None, as_pymongo=False) -> Iterator[CageView]:
+        cages = _find_cages({'_id': {'$in': list(cage_ids)}}, [('_id', pymongo.ASCENDING)], fields, as_pymongo)
+        return _views(_with_bookings(cages, fields), CageView, as_pymongo)
+
+    def add_block(self, cage_id, check_in, check_out) -> Cage:
+        if mongo_setup.use_bookings_collection:
+            merged, absorbed = _merge_block_records(cage_id, [(check_in, check_out)])
+            cage = Cage._from_son(_stamp(cage_id))
+        else:
+            result = _merge_embedded_blocks(cage_id, [(check_in, check_out)])
+            if result is None:
+                raise ValueError('Unknown cage: {}'.format(cage_id))
+            merged, absorbed, doc = result
+            cage = Cage._from_son(doc)
+
+        owner_summary.write(_merged(cage.id, merged, absorbed))
+        if mongo_setup.use_day_calendar:
+            day_calendar.refresh(cage.id, None if mongo_setup.use_bookings_collection else cage.bookings)
+
+        return cage
+
+    def iter_available_cages(self, checkin, checkout, snake, fields=None, as_pymongo=False) -> Iterator[CageView]:
+        query = _available_cages_query(checkin, checkout, snake)
+        if query is None:
+            return iter(())
+
+        cages = _find_cages(query, AVAILABLE_CAGES_ORDER, fields, as_pymongo, alias=mongo_setup.search_alias)
+        return _views(_with_bookings(cages, fields), CageView, as_pymongo)
+
+    def available_cages_page(self, checkin, checkout, snake, after, page_size,
+                             fields=None, as_pymongo=False) -> Page:
+        if fields:
+            fields = list(fields) + ['price', 'square_meters']
+
+        # The page is cut from the candidates in-process; the server only re-checks
+        # the free block of as many cages as the page still needs, in order.
+        keys = _search_keys(_candidate_cage_ids(checkin, checkout), snake, after)
+        cages = []
+        start = 0
+        while len(cages) <= page_size and start < len(keys):
+            end = start + page_size + 1 - len(cages)
+            chunk = [k[2] for k in keys[start:end]]
+            start = end
+
+            query = _available_cages_query(checkin, checkout, snake, chunk)
+            if query is not None:
+                cages.extend(_find_cages(query, AVAILABLE_CAGES_ORDER, fields, as_pymongo,
+                                         alias=mongo_setup.search_alias))
+
+        page = _page(cages, page_size, lambda c: (c['price'], c['square_meters'], c['_id']))
+        if mongo_setup.use_bookings_collection and _wants_bookings(fields):
+            _attach_bookings(page.items, fields)
+
+        page.items = list(_views(page.items, CageView, as_pymongo))
+        return page
+
+    def claim(self, account, snake, cage, checkin, checkout) -> bool:
+        # One timestamp for the booking and the owner summaries, so they agree.
+        booked_date = datetime.datetime.now()
+        if mongo_setup.use_bookings_collection:
+            claimed = _claim_block_record(account, snake, cage, checkin, checkout, booked_date)
+        else:
+            claimed = _claim_embedded_block(account, snake, cage, checkin, checkout, booked_date)
+
+        # Either we claimed the block or the index was stale; drop it in both cases.
+        availability.index.remove(cage.id, checkin, checkout)
+
+        if not claimed:
+            return False
+
+        for check_in, check_out in availability.split(claimed[0], claimed[1], checkin, checkout):
+            availability.index.add(cage.id, check_in, check_out)
+
+        if mongo_setup.use_day_calendar:
+            day_calendar.refresh(cage.id)
+        if mongo_setup.use_owner_summaries:
+            owner_summary.write(owner_summary.cage_booked(
+                account.id, snake, cage, checkin, checkout, booked_date))
+        return True
+
+    def iter_guest_bookings(self, guest_id) -> Iterator[BookingView]:
+        rows = _aggregate_bookings(guest_bookings_pipeline(guest_id))
+        return (booking_from_row(r) for r in rows)
+
+    def write_summary(self, ops: list):
+        owner_summary.write(ops)
+
+    def stored_summary(self, owner_id) -> Optional[OwnerSummary]:
+        return OwnerSummary.objects(id=owner_id).first()
+
+    def insert_documents(self, model, batch):
+        """
+            Unordered insert_many; the server's write errors are mapped back to their rows.
+        """
+        docs = []
+        for _, doc in batch:
+            son = doc.to_mongo()
+            son.setdefault('_id', bson.ObjectId())
+            docs.append(son)
+
+        failed = {}
+        try:
+            model._get_collection().insert_many(docs, ordered=False)
+        except pymongo.errors.BulkWriteError as x:
+            failed = {e['index']: e['errmsg'] for e in x.details.get('writeErrors', [])}
+
+        ids, errors = [], []
+        for idx, ((row_number, doc), son) in enumerate(zip(batch, docs)):
+            if idx in failed:
+                errors.append((row_number, failed[idx]))
+            else:
+                doc.id = son['_id']
+                ids.append(son['_id'])
+
+        return ids, errors
+
+    def add_blocks(self, batch):
+        cage_ids = {b.cage_id for _, b in batch}
+        known = set(Cage.objects(id__in=list(cage_ids)).distinct('_id'))
+
+        errors = []
+        by_cage = collections.defaultdict(list)
+        row_numbers = collections.defaultdict(list)
+        for row_number, b in batch:
+            if b.cage_id in known:
+                by_cage[b.cage_id].append((b.check_in_date, b.check_out_date))
+                row_numbers[b.cage_id].append(row_number)
+            else:
+                errors.append((row_number, 'Unknown cage: {}'.format(b.cage_id)))
+
+        # Each cage's new blocks are merged with each other and its free blocks,
+        # the same as add_block would, in one merge per cage. A write the server
+        # rejects fails the rows of that cage only.
+        merges, failed = {}, {}
+        for cage_id, blocks in by_cage.items():
+            try:
+                if mongo_setup.use_bookings_collection:
+                    merges[cage_id] = _merge_block_records(cage_id, blocks)
+                    continue
+
+                result = _merge_embedded_blocks(cage_id, blocks)
+                if result is None:
+                    failed[cage_id] = 'Unknown cage: {}'.format(cage_id)
+                else:
+                    merges[cage_id] = result[:2]
+            except (pymongo.errors.BulkWriteError, pymongo.errors.WriteError) as x:
+                failed[cage_id] = _write_error(x)
+        if mongo_setup.use_bookings_collection:
+            Cage._get_collection().update_many({'_id': {'$in': list(merges)}}, availability.STAMP)
+
+        for cage_id, message in failed.items():
+            errors.extend((row_number, message) for row_number in row_numbers[cage_id])
+
+        ops = []
+        for cage_id, (merged, absorbed) in merges.items():
+            ops.extend(_merged(cage_id, merged, absorbed))
+        owner_summary.write(ops)
+        if mongo_setup.use_day_calendar:
+            day_calendar.refresh_many(list(merges))
+
+        return sum(len(by_cage[cage_id]) for cage_id in merges), errors
+
+
+_mongo_repository = MongoRepository()
+
+
+def _repository() -> Repository:
+    return memory_backend.repository if mongo_setup.use_memory_backend else _mongo_repository
+
+
+command_stats.track_calls(globals())
@@ -0,0 +1,400 @@
+"""
+Optional per-day availability calendar (MongoConfig.day_calendar).
+
+Each cage stores a bitmap of its free days next to its bookings: Cage.free_days
+holds HORIZON_DAYS bits starting at Cage.calendar_start, bit i set when day
+calendar_start + i lies inside an unbooked block. add_available_date,
+book_cage and bulk_add_available_dates recompute it from the cage's bookings;
+new cages start with an empty one.
+
+In memory the bitmaps of all cages are aligned on today and kept as one
+matrix, so "which cages are free every day of [checkin, checkout)" is a single
+AND over the matrix columns. That runs vectorized over a packed uint8 matrix
+with numpy (in requirements.txt); without it each row is a Python int bitset
+and every search walks all of them.
+
+Every search first re-reads the calendars of the cages other processes changed
+(see availability.ChangeTracker). While any cage has no stored calendar yet,
+e.g. cages from before the option was turned on, searches use the interval
+index instead; tools.rebuild_calendars fills them in. A stored calendar only
+knows the HORIZON_DAYS from its calendar_start, so stays reaching past the
+earliest of those horizons use the interval index too.
+
+A day bitmap cannot tell two back-to-back blocks from one long block, so the
+cages it returns are candidates that the caller re-checks against the bookings.
+"""
+import collections
+import datetime
+import threading
+from typing import Iterable, List, Optional, Set, Tuple
+
+import bson
+import pymongo
+
+from data.cages import Cage
+from services import availability
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+HORIZON_DAYS = 400
+
+
+def today() -> datetime.date:
+    return datetime.datetime.now().date()
+
+
+def day_range(start: datetime.datetime, end: datetime.datetime) -> Tuple[datetime.date, datetime.date]:
+    """
+        Days touched by [start, end): from start's day up to, not including, the
+        day after end unless end is exactly midnight.
+    """
+    last = end.date()
+    if end != datetime.datetime(last.year, last.month, last.day):
+        last += datetime.timedelta(days=1)
+    return start.date(), last
+
+
+def bitmap_from_blocks(blocks: Iterable[Tuple[datetime.datetime, datetime.datetime]],
+                       start: datetime.date, days: int = HORIZON_DAYS) -> int:
+    bits = 0
+    for check_in, check_out in blocks:
+        first, last = day_range(check_in, check_out)
+        lo = max(0, (first - start).days)
+        hi = min(days, (last - start).days)
+        if lo < hi:
+            bits |= ((1 << (hi - lo)) - 1) << lo
+
+    return bits
+
+
+def shift(bits: int, from_start: datetime.date, to_start: datetime.date, days: int = HORIZON_DAYS) -> int:
+    """
+        Re-base a bitmap on another start day, dropping days outside the horizon.
+    """
+    delta = (to_start - from_start).days
+    bits = bits >> delta if delta >= 0 else bits << -delta
+    return bits & ((1 << days) - 1)
+
+
+def to_bytes(bits: int, days: int = HORIZON_DAYS) -> bytes:
+    return bits.to_bytes((days + 7) // 8, 'little')
+
+
+def from_bytes(data: bytes) -> int:
+    return int.from_bytes(data, 'little')
+
+
+class DayCalendar:
+    """
+        Free-day bitmaps of every cage, aligned on a common start day. Each row
+        also remembers the days its stored calendar covers, from its
+        calendar_start for HORIZON_DAYS: days past that are unknown, not booked.
+    """
+
+    def __init__(self, days: int = HORIZON_DAYS):
+        self.days = days
+        self.start: Optional[datetime.date] = None
+        self._rows = {}
+        self._spans = {}
+        self._span_starts = collections.Counter()
+        self._span_ends = collections.Counter()
+        self._missing: Set[bson.ObjectId] = set()
+        self._ids: List[bson.ObjectId] = []
+        self._positions = {}
+        self._matrix = None
+        self._dirty = True
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, calendars: Iterable[Tuple[bson.ObjectId, Optional[datetime.date], Optional[int]]],
+             start: datetime.date):
+        """
+            calendars are (cage id, calendar start, bits); a None start marks a
+            cage without a stored calendar.
+        """
+        with self._lock:
+            self._reset()
+            self.start = start
+            self._loaded = True
+            self.update(calendars)
+
+    def update(self, calendars: Iterable[Tuple[bson.ObjectId, Optional[datetime.date], Optional[int]]]):
+        with self._lock:
+            for cage_id, cage_start, bits in calendars:
+                if cage_start is None:
+                    self._drop(cage_id)
+                    self._missing.add(cage_id)
+                else:
+                    self.set(cage_id, cage_start, bits)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def set(self, cage_id: bson.ObjectId, cage_start: datetime.date, bits: int):
+        with self._lock:
+            if self.start is None:
+                return
+            self._set_span(cage_id, (cage_start, cage_start + datetime.timedelta(days=self.days)))
+            self._set_row(cage_id, shift(bits, cage_start, self.start, self.days))
+            self._missing.discard(cage_id)
+
+    def find_cage_ids(self, checkin: datetime.datetime, checkout: datetime.datetime) -> Optional[Set[bson.ObjectId]]:
+        """
+            Cages free on every day of the stay, or None if the stay is outside the
+            horizon, past the days some cage's stored calendar covers, or some cage
+            has no calendar (the caller then falls back to the interval index).
+        """
+        with self._lock:
+            if self.start is None or self._missing:
+                return None
+            if self.start != today():
+                self._realign(today())
+
+            first, last = day_range(checkin, checkout)
+            if self._spans and (first < max(self._span_starts) or last > min(self._span_ends)):
+                return None
+
+            lo = (first - self.start).days
+            hi = (last - self.start).days
+            if lo < 0 or hi > self.days or lo >= hi:
+                return None
+
+            if numpy is not None:
+                return self._find_vectorized(lo, hi)
+
+            mask = ((1 << (hi - lo)) - 1) << lo
+            return {cage_id for cage_id, bits in self._rows.items() if bits & mask == mask}
+
+    def _find_vectorized(self, lo: int, hi: int) -> Set[bson.ObjectId]:
+        if self._dirty:
+            self._rebuild()
+        if not self._ids:
+            return set()
+
+        wanted = numpy.zeros(self._matrix.shape[1] * 8, dtype=bool)
+        wanted[lo:hi] = True
+        mask = numpy.packbits(wanted, bitorder='little')
+
+        cols = slice(lo // 8, (hi - 1) // 8 + 1)
+        rows = self._matrix[:len(self._ids), cols]
+        free = ((rows & mask[cols]) == mask[cols]).all(axis=1)
+
+        return {self._ids[i] for i in numpy.flatnonzero(free)}
+
+    def _reset(self):
+        self.start = None
+        self._rows = {}
+        self._spans = {}
+        self._span_starts.clear()
+        self._span_ends.clear()
+        self._missing = set()
+        self._ids = []
+        self._positions = {}
+        self._matrix = None
+        self._dirty = True
+        self._loaded = False
+
+    def _set_span(self, cage_id: bson.ObjectId, span: Optional[Tuple[datetime.date, datetime.date]]):
+        old = self._spans.pop(cage_id, None)
+        if old:
+            for counter, day in ((self._span_starts, old[0]), (self._span_ends, old[1])):
+                counter[day] -= 1
+                if not counter[day]:
+                    del counter[day]
+        if span:
+            self._spans[cage_id] = span
+            self._span_starts[span[0]] += 1
+            self._span_ends[span[1]] += 1
+
+    def _set_row(self, cage_id: bson.ObjectId, bits: int):
+        # Once built, the matrix is updated one row at a time rather than rebuilt.
+        self._rows[cage_id] = bits
+        if self._dirty:
+            return
+
+        pos = self._positions.get(cage_id)
+        if pos is None:
+            pos = len(self._ids)
+            if pos == len(self._matrix):
+                grown = numpy.zeros((max(16, pos * 2), self._matrix.shape[1]), dtype=numpy.uint8)
+                grown[:pos] = self._matrix[:pos]
+                self._matrix = grown
+            self._ids.append(cage_id)
+            self._positions[cage_id] = pos
+        self._matrix[pos] = numpy.frombuffer(to_bytes(bits, self.days), dtype=numpy.uint8)
+
+    def _drop(self, cage_id: bson.ObjectId):
+        self._set_span(cage_id, None)
+        self._rows.pop(cage_id, None)
+        pos = self._positions.pop(cage_id, None)
+        if self._dirty or pos is None:
+            return
+
+        # Move the last row into the gap.
+        last = len(self._ids) - 1
+        if pos != last:
+            moved = self._ids[last]
+            self._ids[pos] = moved
+            self._positions[moved] = pos
+            self._matrix[pos] = self._matrix[last]
+        self._ids.pop()
+
+    def _rebuild(self):
+        width = (self.days + 7) // 8
+        self._ids = list(self._rows)
+        self._positions = {cage_id: pos for pos, cage_id in enumerate(self._ids)}
+        self._matrix = numpy.zeros((max(16, len(self._ids)), width), dtype=numpy.uint8)
+        if self._ids:
+            self._matrix[:len(self._ids)] = numpy.frombuffer(
+                b''.join(to_bytes(self._rows[i], self.days) for i in self._ids), dtype=numpy.uint8
+            ).reshape(len(self._ids), width)
+        self._dirty = False
+
+    def _realign(self, start: datetime.date):
+        self._rows = {cage_id: shift(bits, self.start, start, self.days) for cage_id, bits in self._rows.items()}
+        self.start = start
+        self._dirty = True
+
+
+calendars = DayCalendar()
+tracker = availability.ChangeTracker()
+_sync_lock = threading.Lock()
+
+
+def ensure_loaded():
+    """
+        Load the calendars on first use: one read of every cage's bitmap.
+    """
+    with _sync_lock:
+        if not calendars.loaded:
+            _load()
+
+
+def sync():
+    """
+        Load the calendars on first use, then re-read the ones whose cage changed
+        since the last call, whichever process changed it.
+    """
+    with _sync_lock:
+        if not calendars.loaded:
+            _load()
+            return
+
+        stamps = Cage.objects(__raw__=tracker.window()) \
+            .only('id', 'availability_updated', 'availability_version') \
+            .as_pymongo()
+        changed = tracker.changed(stamps)
+        if changed:
+            cages = Cage.objects(id__in=changed).only('id', 'calendar_start', 'free_days').as_pymongo()
+            calendars.update(stored(cages))
+
+
+def stored(cages: Iterable[dict]) -> Iterable[Tuple[bson.ObjectId, Optional[datetime.date], Optional[int]]]:
+    """
+        (cage id, calendar start, bits) of raw cage documents, for DayCalendar.load / update.
+    """
+    for c in cages:
+        if c.get('free_days') is None:
+            yield c['_id'], None, None
+        else:
+            yield c['_id'], c['calendar_start'].date(), from_bytes(c['free_days'])
+
+
+def start_empty(cage: Cage):
+    """
+        Give a new cage an empty calendar, so searches need not treat it as one
+        without a calendar.
+    """
+    fill(cage, ())
+
+
+def fill(cage: Cage, blocks: Iterable[Tuple[datetime.datetime, datetime.datetime]]):
+    """
+        Set an unsaved cage's calendar from its free blocks (e.g. tools.generate_dataset).
+    """
+    start = today()
+    cage.calendar_start = datetime.datetime(start.year, start.month, start.day)
+    cage.free_days = to_bytes(bitmap_from_blocks(blocks, start))
+
+
+def stored_update(start: datetime.date, bits: int) -> dict:
+    """
+        The update storing a calendar on its cage, stamped so other processes re-read it.
+    """
+    return dict({'$set': {
+        'calendar_start': datetime.datetime(start.year, start.month, start.day),
+        'free_days': bson.Binary(to_bytes(bits))
+    }}, **availability.STAMP)
+
+
+def refresh(cage_id: bson.ObjectId, bookings: Optional[Iterable] = None):
+    """
+        Recompute and store the cage's calendar from its free blocks. bookings may
+        pass the embedded bookings when the caller already has them loaded.
+    """
+    if bookings is None:
+        refresh_many([cage_id])
+        return
+
+    blocks = [(b.check_in_date, b.check_out_date) for b in bookings if b.guest_snake_id is None]
+    start = today()
+    bits = bitmap_from_blocks(blocks, start)
+    Cage._get_collection().update_one({'_id': cage_id}, stored_update(start, bits))
+    calendars.set(cage_id, start, bits)
+
+
+def refresh_many(cage_ids: List[bson.ObjectId]):
+    """
+        refresh for many cages: one read of their free blocks, one bulk write.
+    """
+    if not cage_ids:
+        return
+
+    blocks = {cage_id: [] for cage_id in cage_ids}
+    for check_in, check_out, cage_id in availability.free_blocks_of(cage_ids):
+        blocks[cage_id].append((check_in, check_out))
+
+    start = today()
+    bits = {cage_id: bitmap_from_blocks(cage_blocks, start) for cage_id, cage_blocks in blocks.items()}
+    Cage._get_collection().bulk_write([
+        pymongo.UpdateOne({'_id': cage_id}, stored_update(start, b)) for cage_id, b in bits.items()
+    ], ordered=False)
+    calendars.update((cage_id, start, b) for cage_id, b in bits.items())
+
+
+def rebuild_all(batch_size: int = 1000) -> int:
+    """
+        Recompute the stored calendar of every cage, e.g. after turning the option
+        on for existing data. Returns the number of cages updated.
+    """
+    count = 0
+    batch = []
+    for cage in Cage.objects().only('id').as_pymongo().batch_size(batch_size):
+        batch.append(cage['_id'])
+        if len(batch) >= batch_size:
+            refresh_many(batch)
+            count += len(batch)
+            batch = []
+
+    refresh_many(batch)
+    count += len(batch)
+
+    calendars.clear()
+    return count
+
+
+def _load():
+    query, projection, sort = availability.newest_stamp_query()
+    newest = Cage._get_collection().find_one(query, projection, sort=sort)
+    tracker.reset(newest['availability_updated'] if newest else None)
+
+    cages = Cage.objects().only('id', 'calendar_start', 'free_days').as_pymongo()
+    calendars.load(stored(cages), today())
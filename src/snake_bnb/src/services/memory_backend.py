@@ -0,0 +1,423 @@
+"""
+In-process storage engine for services.data_service (MongoConfig.backend = 'memory'),
+served to it through MemoryRepository.
+
+Holds the Owner / Cage / Snake / Booking documents, indexed in plain Python
+structures: owners hashed by id and by email, cages in a list sorted by
+(price, -square_meters, id) that availability pages walk in order, and an
+availability.AvailabilityIndex over the free blocks. Each cage's blocks are kept sorted by check-in date, so block scans stop as
+soon as they pass the stay. Nothing is persisted.
+
+Writes store copies of the documents, with their values coerced as MongoDB
+would store them (a price of 1 as 1.0). Reads hand out the same data.views as
+the MongoDB backend, built from the raw dicts MongoDB would return, with fields=
+applied the same way. Neither callers nor the views share state with the store.
+"""
+import bisect
+import collections
+import datetime
+import threading
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import bson
+import mongoengine
+
+from data.bookings import Booking
+from data.cages import Cage
+from data.owners import Owner
+from data.snakes import Snake
+from data.views import BookingView, CageView, OwnerView, SnakeView
+from services import availability
+from services.repository import Page
+
+
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.owners = {}
+            self.owners_by_email = {}
+            self.snakes = {}
+            self.cages = {}
+            self._cage_order: List[tuple] = []
+            self._order_dirty = False
+            self._guest_bookings = collections.defaultdict(list)
+            self.index = availability.AvailabilityIndex()
+            self._reindex = True
+
+    # -- owners ---------------------------------------------------------------
+
+    def add_owner(self, owner: Owner) -> Owner:
+        with self._lock:
+            owner.validate()
+            if owner.email in self.owners_by_email:
+                raise mongoengine.NotUniqueError('An account with email {} already exists.'.format(owner.email))
+
+            owner.id = owner.id or bson.ObjectId()
+            stored = _copy(owner)
+            self.owners[owner.id] = stored
+            self.owners_by_email[owner.email] = stored
+            return owner
+
+    def owner_by_email(self, email: str) -> Optional[Owner]:
+        return self.owners_by_email.get(email)
+
+    def owner_by_id(self, owner_id: bson.ObjectId) -> Optional[Owner]:
+        return self.owners.get(owner_id)
+
+    def add_to_owner(self, owner_id: bson.ObjectId, **update) -> Optional[Owner]:
+        """
+            Same add_to_set__<field> keywords as data_service._add_to_owner; a list adds each item.
+        """
+        with self._lock:
+            owner = self.owners.get(owner_id)
+            if not owner:
+                return None
+
+            for key, value in update.items():
+                field = key[len('add_to_set__'):]
+                items = getattr(owner, field)
+                for v in value if isinstance(value, list) else [value]:
+                    if v not in items:
+                        items.append(v)
+            return _copy(owner)
+
+    # -- snakes and cages -----------------------------------------------------
+
+    def add_snake(self, snake: Snake) -> Snake:
+        with self._lock:
+            snake.validate()
+            snake.id = snake.id or bson.ObjectId()
+            self.snakes[snake.id] = _copy(snake)
+            return snake
+
+    def snakes_by_ids(self, ids: Iterable[bson.ObjectId]) -> List[Snake]:
+        return [self.snakes[i] for i in ids if i in self.snakes]
+
+    def add_cage(self, cage: Cage) -> Cage:
+        with self._lock:
+            cage.validate()
+            cage.id = cage.id or bson.ObjectId()
+            stored = _copy(cage)
+            self.cages[cage.id] = stored
+            bisect.insort(self._cage_order, _order_key(stored))
+            return cage
+
+    def cages_by_ids(self, ids: Iterable[bson.ObjectId]) -> List[Cage]:
+        return [self.cages[i] for i in sorted(ids) if i in self.cages]
+
+    # -- availability and bookings ---------------------------------------------
+
+    def add_block(self, cage_id: bson.ObjectId, check_in: datetime.datetime, check_out: datetime.datetime) -> Cage:
+        """
+            Add a free block, merged with the free blocks it overlaps or touches.
+        """
+        with self._lock:
+            cage = self.cages[cage_id]
+            free = [b for b in cage.bookings if b.guest_snake_id is None]
+            check_in, check_out, absorbed = availability.coalesce(free, check_in, check_out)
+
+            cage.bookings = [b for b in cage.bookings if not any(b is a for a in absorbed)]
+            self._insert_block(cage, Booking(check_in_date=check_in, check_out_date=check_out))
+
+            for b in absorbed:
+                self.index.remove(cage.id, b.check_in_date, b.check_out_date)
+            self.index.add(cage.id, check_in, check_out)
+
+            return _copy(cage)
+
+    def claim_block(self, cage_id: bson.ObjectId, guest_id: bson.ObjectId, snake_id: bson.ObjectId,
+                    checkin: datetime.datetime, checkout: datetime.datetime) -> Optional[Tuple[datetime.datetime,
+                                                                                         datetime.datetime]]:
+        """
+            Book the first free block covering [checkin, checkout]; the free days
+            around the stay stay available. Returns the block's original dates, or None.
+        """
+        with self._lock:
+            cage = self.cages.get(cage_id)
+            block = _free_block(cage, checkin, checkout) if cage else None
+            if not block:
+                return None
+
+            original = (block.check_in_date, block.check_out_date)
+
+            # Stored bookings are replaced, never changed: views handed out earlier
+            # may not have decoded the free block yet.
+            booked = _copy(block)
+            booked.guest_owner_id = guest_id
+            booked.guest_snake_id = snake_id
+            booked.check_in_date = checkin
+            booked.check_out_date = checkout
+            booked.booked_date = datetime.datetime.now()
+            cage.bookings = [booked if b is block else b for b in cage.bookings]
+            self._guest_bookings[guest_id].append((cage_id, booked))
+
+            self.index.remove(cage_id, *original)
+            for check_in, check_out in availability.split(original[0], original[1], checkin, checkout):
+                self._insert_block(cage, Booking(check_in_date=check_in, check_out_date=check_out))
+                self.index.add(cage_id, check_in, check_out)
+
+            cage.bookings.sort(key=lambda b: b.check_in_date)
+            return original
+
+    def available_cages(self, checkin: datetime.datetime, checkout: datetime.datetime,
+                        min_size: float, venomous: bool,
+                        after: Optional[tuple] = None, limit: Optional[int] = None) -> List[Cage]:
+        """
+            Cages with a free block covering the stay, cheapest then largest first,
+            resuming after the (price, square_meters, id) key when given.
+        """
+        with self._lock:
+            if self._reindex:
+                self.index.load(availability.blocks_from_cages(
+                    c.to_mongo() for c in self.cages.values()))
+                self._reindex = False
+            if self._order_dirty:
+                self._cage_order.sort()
+                self._order_dirty = False
+
+            candidates = self.index.find_cage_ids(checkin, checkout)
+            start = (after[0], -after[1], after[2]) if after else None
+
+            # Few candidates: sort just those. Many: walk the price-ordered list.
+            if len(candidates) * 8 < len(self._cage_order):
+                keys = sorted(_order_key(self.cages[i]) for i in candidates if i in self.cages)
+            else:
+                lo = bisect.bisect_right(self._cage_order, start) if start else 0
+                keys = (k for k in self._cage_order[lo:] if k[2] in candidates)
+
+            cages = []
+            for key in keys:
+                if start and key <= start:
+                    continue
+
+                cage = self.cages[key[2]]
+                if cage.square_meters < min_size or (venomous and not cage.allow_dangerous_snakes):
+                    continue
+                if not _free_block(cage, checkin, checkout):
+                    continue
+
+                cages.append(cage)
+                if limit and len(cages) >= limit:
+                    break
+
+            return cages
+
+    def guest_bookings(self, guest_id: bson.ObjectId) -> List[BookingView]:
+        """
+            The guest's bookings, each with .cage and .snake like data_service.booking_from_row.
+        """
+        with self._lock:
+            bookings = []
+            for cage_id, block in self._guest_bookings.get(guest_id, []):
+                if block.guest_owner_id != guest_id:
+                    continue
+
+                booking = BookingView(_raw(block))
+                booking.cage = CageView({'_id': cage_id, 'name': self.cages[cage_id].name})
+                snake = self.snakes.get(block.guest_snake_id)
+                if snake:
+                    booking.snake = SnakeView({'_id': snake.id, 'name': snake.name})
+                bookings.append(booking)
+
+            return bookings
+
+    # -- bulk loading ---------------------------------------------------------
+
+    def load_documents(self, collection: str, docs: Iterable[dict]):
+        """
+            Load raw documents as stored in MongoDB (e.g. from tools.generate_dataset).
+            Records of the 'bookings' collection are embedded into their cages.
+        """
+        with self._lock:
+            for doc in docs:
+                if collection == 'owners':
+                    self.add_owner(Owner._from_son(doc))
+                elif collection == 'snakes':
+                    self.add_snake(Snake._from_son(doc))
+                elif collection == 'cages':
+                    cage = Cage._from_son(doc)
+                    cage.bookings.sort(key=lambda b: b.check_in_date)
+                    self.cages[cage.id] = cage
+                    self._cage_order.append(_order_key(cage))
+                    self._order_dirty = True
+                    for b in cage.bookings:
+                        if b.guest_owner_id:
+                            self._guest_bookings[b.guest_owner_id].append((cage.id, b))
+                elif collection == 'bookings':
+                    record = {k: v for k, v in doc.items() if k not in ('_id', 'cage_id')}
+                    block = Booking._from_son(record)
+                    self._insert_block(self.cages[doc['cage_id']], block)
+                    if block.guest_owner_id:
+                        self._guest_bookings[block.guest_owner_id].append((doc['cage_id'], block))
+                else:
+                    raise ValueError('Unknown collection: {}'.format(collection))
+
+            self._reindex = True
+
+    def _insert_block(self, cage: Cage, block: Booking):
+        starts = [b.check_in_date for b in cage.bookings]
+        cage.bookings.insert(bisect.bisect_right(starts, block.check_in_date), block)
+
+
+def _order_key(cage: Cage) -> tuple:
+    return cage.price, -cage.square_meters, cage.id
+
+
+def _free_block(cage: Cage, checkin: datetime.datetime, checkout: datetime.datetime) -> Optional[Booking]:
+    for b in cage.bookings:
+        if b.check_in_date > checkin:
+            # Blocks are sorted by check-in; none of the rest can cover the stay.
+            return None
+        if b.guest_snake_id is None and b.check_out_date >= checkout:
+            return b
+    return None
+
+
+class MemoryRepository:
+    """
+        services.repository.Repository over a MemoryStore. Owner summaries are
+        always computed on read.
+    """
+
+    def __init__(self, store: MemoryStore):
+        self.store = store
+
+    def add_owner(self, owner: Owner) -> Owner:
+        return self.store.add_owner(owner)
+
+    def owner_by_email(self, email: str) -> Optional[OwnerView]:
+        owner = self.store.owner_by_email(email)
+        return OwnerView(_raw(owner)) if owner else None
+
+    def owner_by_id(self, owner_id: bson.ObjectId) -> Optional[OwnerView]:
+        owner = self.store.owner_by_id(owner_id)
+        return OwnerView(_raw(owner)) if owner else None
+
+    def add_to_owner(self, owner_id: bson.ObjectId, **update) -> Optional[Owner]:
+        return self.store.add_to_owner(owner_id, **update)
+
+    def add_snake(self, snake: Snake) -> Snake:
+        return self.store.add_snake(snake)
+
+    def add_cage(self, cage: Cage) -> Cage:
+        return self.store.add_cage(cage)
+
+    def snakes(self, snake_ids, fields=None, as_pymongo=False) -> List[SnakeView]:
+        return _views(self.store.snakes_by_ids(snake_ids), SnakeView, fields, as_pymongo)
+
+    def iter_cages(self, cage_ids, fields=None, as_pymongo=False) -> Iterator[CageView]:
+        return iter(_views(self.store.cages_by_ids(cage_ids), CageView, fields, as_pymongo))
+
+    def add_block(self, cage_id, check_in, check_out) -> Cage:
+        return self.store.add_block(cage_id, check_in, check_out)
+
+    def iter_available_cages(self, checkin, checkout, snake, fields=None, as_pymongo=False) -> Iterator[CageView]:
+        cages = self.store.available_cages(checkin, checkout, snake.length / 4, snake.is_venomous)
+        return iter(_views(cages, CageView, fields, as_pymongo))
+
+    def available_cages_page(self, checkin, checkout, snake, after, page_size,
+                             fields=None, as_pymongo=False) -> Page:
+        cages = self.store.available_cages(checkin, checkout, snake.length / 4, snake.is_venomous,
+                                           after, page_size + 1)
+        if fields:
+            fields = list(fields) + ['price', 'square_meters']
+        return _page(cages, page_size, fields, as_pymongo, lambda c: (c.price, c.square_meters, c.id))
+
+    def claim(self, account, snake, cage, checkin, checkout) -> bool:
+        return self.store.claim_block(cage.id, account.id, snake.id, checkin, checkout) is not None
+
+    def iter_guest_bookings(self, guest_id) -> Iterator[BookingView]:
+        return iter(self.store.guest_bookings(guest_id))
+
+    def write_summary(self, ops: list):
+        pass
+
+    def stored_summary(self, owner_id):
+        return None
+
+    def insert_documents(self, model, batch):
+        add = self.store.add_cage if model is Cage else self.store.add_snake
+        return [add(doc).id for _, doc in batch], []
+
+    def add_blocks(self, batch):
+        inserted, errors = 0, []
+        for row_number, b in batch:
+            if b.cage_id in self.store.cages:
+                self.store.add_block(b.cage_id, b.check_in_date, b.check_out_date)
+                inserted += 1
+            else:
+                errors.append((row_number, 'Unknown cage: {}'.format(b.cage_id)))
+        return inserted, errors
+
+
+def _raw(doc, lazy: bool = False) -> dict:
+    """
+        A stored document as MongoDB would return it. Its values were coerced when it
+        was stored, so this skips to_mongo()'s per-field conversion, the bulk of the
+        cost of a search. lazy leaves embedded documents to be converted as they are
+        iterated, once: CageView only reads its bookings when asked for them.
+    """
+    raw = {}
+    for name, value in doc._data.items():
+        if value is None:
+            continue
+        if isinstance(value, list):
+            if lazy and value and isinstance(value[0], mongoengine.EmbeddedDocument):
+                value = map(_raw, list(value))
+            else:
+                value = [_raw(v) if isinstance(v, mongoengine.EmbeddedDocument) else v for v in value]
+        raw['_id' if name == 'id' else name] = value
+    return raw
+
+
+def _copy(doc):
+    return type(doc)._from_son(_raw(doc))
+
+
+def _views(docs, view, fields, as_pymongo: bool) -> list:
+    # The raw dicts MongoRepository reads, as data.views unless the caller asked for the dicts.
+    if not (as_pymongo or fields):
+        return [view(_raw(d, lazy=True)) for d in docs]
+
+    rows = [_project(_raw(d), fields) for d in docs]
+    return rows if as_pymongo else [view(r) for r in rows]
+
+
+def _project(doc: dict, fields) -> dict:
+    """
+        doc limited to fields, as QuerySet.only() would load it ('bookings.<field>' keeps
+        just that field of each booking).
+    """
+    if not fields:
+        return doc
+
+    out = {'_id': doc['_id']}
+    for f in fields:
+        name, _, sub = f.partition('.')
+        if name not in doc:
+            continue
+        if not sub:
+            out[name] = doc[name]
+            continue
+
+        items = out.setdefault(name, [{} for _ in doc[name]])
+        for item, source in zip(items, doc[name]):
+            if sub in source:
+                item[sub] = source[sub]
+    return out
+
+
+def _page(docs: list, page_size: int, fields, as_pymongo: bool, key) -> Page:
+    if len(docs) <= page_size:
+        return Page(_views(docs, CageView, fields, as_pymongo))
+
+    docs = docs[:page_size]
+    return Page(_views(docs, CageView, fields, as_pymongo), key(docs[-1]))
+
+
+store = MemoryStore()
+repository = MemoryRepository(store)
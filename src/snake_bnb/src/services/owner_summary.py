@@ -0,0 +1,137 @@
+"""
+Optional per-owner dashboard summary (MongoConfig.owner_summaries).
+
+One owner_summaries document per owner (data.owner_summaries.OwnerSummary)
+holds what the host and guest dashboards show: cage and snake counts, free,
+hosted and booked nights, and the latest bookings. register_cage, add_snake,
+add_available_date and book_cage follow their own write with an atomic
+$inc / $push on it, so a dashboard is one point read instead of a walk over
+every cage and booking.
+
+The updates below are pymongo operations so the sync and async services send
+the same ones. Summaries written before the option was on, or data changed
+around data_service, drift; tools.rebuild_summaries recomputes them.
+"""
+import datetime
+from typing import Iterable, List, Optional
+
+import bson
+from pymongo import ReplaceOne, UpdateOne
+
+from data.owner_summaries import OwnerSummary, SummaryBooking
+
+# Bookings kept per list; the oldest check-ins are dropped first.
+UPCOMING_LIMIT = 50
+
+
+def nights(check_in: datetime.datetime, check_out: datetime.datetime) -> int:
+    return (check_out - check_in).days
+
+
+def cage_registered(owner_id: bson.ObjectId, cage_ids: List[bson.ObjectId]) -> List[UpdateOne]:
+    return [UpdateOne(
+        {'_id': owner_id},
+        {'$inc': {'cage_count': len(cage_ids)}, '$addToSet': {'cage_ids': {'$each': cage_ids}}},
+        upsert=True
+    )]
+
+
+def snake_added(owner_id: bson.ObjectId, count: int = 1) -> List[UpdateOne]:
+    return [UpdateOne({'_id': owner_id}, {'$inc': {'snake_count': count}}, upsert=True)]
+
+
+def availability_added(cage_id: bson.ObjectId, added_nights: int) -> List[UpdateOne]:
+    """
+        added_nights is the merged block's nights less those of the blocks it absorbed.
+    """
+    if not added_nights:
+        return []
+    return [UpdateOne({'cage_ids': cage_id}, {'$inc': {'nights_available': added_nights}})]
+
+
+def cage_booked(guest_id: bson.ObjectId, snake, cage,
+                checkin: datetime.datetime, checkout: datetime.datetime,
+                booked_date: datetime.datetime) -> List[UpdateOne]:
+    """
+        The stay moves from the host's free nights to their hosted nights and the
+        guest's booked nights, and is pushed onto both booking lists.
+    """
+    n = nights(checkin, checkout)
+    booking = dict(cage_id=cage.id, cage_name=cage.name, guest_owner_id=guest_id, snake_id=snake.id,
+                   booked_date=booked_date, check_in_date=checkin, check_out_date=checkout)
+    hosted = SummaryBooking(**booking).to_mongo().to_dict()
+    guest = SummaryBooking(snake_name=snake.name, **booking).to_mongo().to_dict()
+
+    return [
+        UpdateOne({'cage_ids': cage.id}, {
+            '$inc': {'nights_available': -n, 'nights_hosted': n},
+            '$push': {'hosted_bookings': _latest(hosted)}
+        }),
+        UpdateOne({'_id': guest_id}, {
+            '$inc': {'nights_booked': n},
+            '$push': {'guest_bookings': _latest(guest)}
+        }, upsert=True),
+    ]
+
+
+def _latest(entry: dict) -> dict:
+    return {'$each': [entry], '$sort': {'check_in_date': 1}, '$slice': -UPCOMING_LIMIT}
+
+
+def write(ops: List[UpdateOne]):
+    """
+        Send the updates in one round trip.
+    """
+    if ops:
+        OwnerSummary._get_collection().bulk_write(ops, ordered=False)
+
+
+def summarize(owner_id: bson.ObjectId, snake_count: int, cages: list, guest_bookings: Iterable) -> OwnerSummary:
+    """
+        The summary as the incremental updates would have built it, from the
+        owner's cages (with .bookings) and their bookings as a guest (with .cage
+        and .snake, as data_service.get_bookings_for_user returns them).
+    """
+    summary = OwnerSummary(id=owner_id, cage_ids=[c.id for c in cages],
+                           cage_count=len(cages), snake_count=snake_count)
+
+    hosted = []
+    for c in cages:
+        for b in c.bookings:
+            if b.guest_snake_id is None:
+                summary.nights_available += nights(b.check_in_date, b.check_out_date)
+                continue
+
+            summary.nights_hosted += nights(b.check_in_date, b.check_out_date)
+            hosted.append(SummaryBooking(
+                cage_id=c.id, cage_name=c.name, guest_owner_id=b.guest_owner_id, snake_id=b.guest_snake_id,
+                booked_date=b.booked_date, check_in_date=b.check_in_date, check_out_date=b.check_out_date))
+
+    booked = []
+    for b in guest_bookings:
+        summary.nights_booked += nights(b.check_in_date, b.check_out_date)
+        booked.append(SummaryBooking(
+            cage_id=b.cage.id, cage_name=b.cage.name, guest_owner_id=owner_id, snake_id=b.guest_snake_id,
+            snake_name=b.snake.name if b.snake else None,
+            booked_date=b.booked_date, check_in_date=b.check_in_date, check_out_date=b.check_out_date))
+
+    summary.hosted_bookings = _keep_latest(hosted)
+    summary.guest_bookings = _keep_latest(booked)
+    return summary
+
+
+def _keep_latest(bookings: List[SummaryBooking]) -> List[SummaryBooking]:
+    bookings.sort(key=lambda b: b.check_in_date)
+    return bookings[-UPCOMING_LIMIT:]
+
+
+def replace(summary: OwnerSummary) -> ReplaceOne:
+    return ReplaceOne({'_id': summary.id}, summary.to_mongo().to_dict(), upsert=True)
+
+
+def upcoming(bookings: List[SummaryBooking], now: Optional[datetime.datetime] = None) -> List[SummaryBooking]:
+    """
+        The bookings not yet checked out, soonest first.
+    """
+    now = now or datetime.datetime.now()
+    return [b for b in bookings if b.check_out_date >= now]
@@ -0,0 +1,118 @@
+"""
+The storage interface behind services.data_service.
+
+data_service keeps the API (accounts, cages, snakes, availability, bookings,
+bulk imports) and hands every read and write to a Repository:
+data_service.MongoRepository over the models in data/, or
+memory_backend.MemoryRepository with MongoConfig.backend = 'memory'.
+"""
+import dataclasses
+import datetime
+from typing import Iterator, List, Optional, Protocol, Sequence, Tuple
+
+import bson
+
+from data.cages import Cage
+from data.owner_summaries import OwnerSummary
+from data.owners import Owner
+from data.snakes import Snake
+
+
+@dataclasses.dataclass
+class Page:
+    """
+        One page of a keyset-paginated listing. Pass next_key back as after= to get
+        the following page; it is None on the last page.
+    """
+    items: list
+    next_key: Optional[tuple] = None
+
+
+class Repository(Protocol):
+    # -- owners ---------------------------------------------------------------
+
+    def add_owner(self, owner: Owner) -> Owner:
+        """
+            Store a new owner; raises mongoengine.NotUniqueError for a taken email.
+        """
+
+    def owner_by_email(self, email: str) -> Optional[Owner]:
+        ...
+
+    def owner_by_id(self, owner_id: bson.ObjectId) -> Optional[Owner]:
+        ...
+
+    def add_to_owner(self, owner_id: bson.ObjectId, **update) -> Optional[Owner]:
+        """
+            add_to_set__<field> keywords (a list value adds each item); returns the updated owner.
+        """
+
+    # -- snakes and cages -----------------------------------------------------
+
+    def add_snake(self, snake: Snake) -> Snake:
+        ...
+
+    def add_cage(self, cage: Cage) -> Cage:
+        ...
+
+    def snakes(self, snake_ids: Sequence[bson.ObjectId], fields: Sequence[str] = None,
+               as_pymongo: bool = False) -> list:
+        ...
+
+    def iter_cages(self, cage_ids: Sequence[bson.ObjectId], fields: Sequence[str] = None,
+                   as_pymongo: bool = False) -> Iterator:
+        """
+            The cages in id order. fields and as_pymongo as in data_service.find_cages_for_user.
+        """
+
+    # -- availability and bookings ---------------------------------------------
+
+    def add_block(self, cage_id: bson.ObjectId, check_in: datetime.datetime,
+                  check_out: datetime.datetime) -> Cage:
+        """
+            Add a free block, merged with the free blocks it overlaps or touches.
+        """
+
+    def iter_available_cages(self, checkin: datetime.datetime, checkout: datetime.datetime, snake: Snake,
+                             fields: Sequence[str] = None, as_pymongo: bool = False) -> Iterator:
+        """
+            Cages with a free block covering the stay that suit the snake, cheapest then largest first.
+        """
+
+    def available_cages_page(self, checkin: datetime.datetime, checkout: datetime.datetime, snake: Snake,
+                             after: Optional[tuple], page_size: int,
+                             fields: Sequence[str] = None, as_pymongo: bool = False) -> Page:
+        ...
+
+    def claim(self, account: Owner, snake: Snake, cage: Cage,
+              checkin: datetime.datetime, checkout: datetime.datetime) -> bool:
+        """
+            Book a free block covering the stay; False if none is left.
+        """
+
+    def iter_guest_bookings(self, guest_id: bson.ObjectId) -> Iterator:
+        ...
+
+    # -- owner summaries ------------------------------------------------------
+
+    def write_summary(self, ops: list):
+        """
+            Apply owner_summary updates; a no-op where summaries are computed on read.
+        """
+
+    def stored_summary(self, owner_id: bson.ObjectId) -> Optional[OwnerSummary]:
+        ...
+
+    # -- bulk import ----------------------------------------------------------
+
+    def insert_documents(self, model, batch: List[tuple]) -> Tuple[List[bson.ObjectId], List[Tuple[int, str]]]:
+        """
+            Insert validated (row number, document) pairs of Cage or Snake.
+        :return: the ids written, and (row number, message) for each rejected row.
+        """
+
+    def add_blocks(self, batch: List[tuple]) -> Tuple[int, List[Tuple[int, str]]]:
+        """
+            Add (row number, CageBooking) free blocks, as add_block would.
+        :return: the number of rows added, and (row number, message) for each rejected row.
+        """
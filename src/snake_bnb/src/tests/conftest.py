@@ -0,0 +1,52 @@
+import dataclasses
+
+import mongoengine
+import pymongo.errors
+import pytest
+
+import data.mongo_setup as mongo_setup
+from services import availability, data_service as svc, memory_backend
+
+FLAGS = ('use_bookings_collection', 'use_day_calendar', 'use_lazy_bookings', 'use_owner_summaries',
+         'use_memory_backend', 'search_alias')
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """
+        backends('memory'), backends('mongo'), backends('mongo-separate') or
+        backends('mongo-lazy') switches data_service to an empty store. The MongoDB ones use a snake_bnb_test database
+        on the server configured by the SNAKE_BNB_* environment variables (see
+        data.mongo_setup.MongoConfig) and skip the test when it can't be reached.
+    """
+    for flag in FLAGS:
+        monkeypatch.setattr(mongo_setup, flag, getattr(mongo_setup, flag))
+
+    def use(backend: str):
+        availability.index.clear()
+        svc.owner_cache.clear()
+        svc.cage_search_fields.clear()
+        memory_backend.store.clear()
+        if backend == 'memory':
+            mongo_setup.global_init(mongo_setup.MongoConfig(backend='memory'))
+            return
+
+        config = dataclasses.replace(
+            mongo_setup.MongoConfig.from_env(), backend='mongo', name='snake_bnb_test',
+            separate_bookings=backend == 'mongo-separate', lazy_bookings=backend == 'mongo-lazy',
+            create_indexes=False)
+        config.server_selection_timeout_ms = config.server_selection_timeout_ms or 500
+        mongoengine.disconnect(mongo_setup.CORE_ALIAS)
+        mongo_setup.global_init(config)
+        try:
+            mongoengine.get_connection(mongo_setup.CORE_ALIAS).drop_database(config.name)
+        except pymongo.errors.ConnectionFailure:
+            mongoengine.disconnect(mongo_setup.CORE_ALIAS)
+            pytest.skip('No MongoDB server at {}:{}'.format(config.host, config.port))
+        connected.append(config.name)
+
+    connected = []
+    yield use
+    for name in connected:
+        mongoengine.get_connection(mongo_setup.CORE_ALIAS).drop_database(name)
+        mongoengine.disconnect(mongo_setup.CORE_ALIAS)
@@ -0,0 +1,204 @@
+import datetime
+import random
+
+import bson
+
+from services import availability
+
+START = datetime.datetime(2030, 1, 1)
+
+
+def day(n: int) -> datetime.datetime:
+    return START + datetime.timedelta(days=n)
+
+
+def brute_force(blocks, checkin, checkout):
+    return {cage_id for check_in, check_out, cage_id in blocks if check_in <= checkin and check_out >= checkout}
+
+
+def random_blocks(rng: random.Random, cage_ids, count: int):
+    blocks = []
+    for _ in range(count):
+        check_in = rng.randrange(0, 300)
+        blocks.append((day(check_in), day(check_in + rng.randrange(1, 30)), rng.choice(cage_ids)))
+    return blocks
+
+
+def test_find_cage_ids_matches_brute_force():
+    rng = random.Random(7)
+    cage_ids = [bson.ObjectId() for _ in range(40)]
+    blocks = random_blocks(rng, cage_ids, 2000)
+
+    index = availability.AvailabilityIndex()
+    index.load(blocks)
+
+    assert len(index) == len(blocks)
+    for _ in range(300):
+        checkin = day(rng.randrange(0, 320))
+        checkout = checkin + datetime.timedelta(days=rng.randrange(1, 20))
+        assert index.find_cage_ids(checkin, checkout) == brute_force(blocks, checkin, checkout)
+
+
+def test_add_and_remove_keep_matching_brute_force():
+    rng = random.Random(11)
+    cage_ids = [bson.ObjectId() for _ in range(10)]
+    blocks = random_blocks(rng, cage_ids, 200)
+
+    index = availability.AvailabilityIndex()
+    index.load(blocks)
+    for _ in range(500):
+        if blocks and rng.random() < 0.5:
+            check_in, check_out, cage_id = rng.choice(blocks)
+            # The index drops the cage's earliest block covering the dates.
+            covering = [b for b in blocks if b[2] == cage_id and b[0] <= check_in and b[1] >= check_out]
+            earliest = min(b[0] for b in covering)
+            if sum(b[0] == earliest for b in covering) > 1:
+                continue
+            blocks.remove(next(b for b in covering if b[0] == earliest))
+            assert index.remove(cage_id, check_in, check_out)
+        else:
+            block = random_blocks(rng, cage_ids, 1)[0]
+            blocks.append(block)
+            index.add(block[2], block[0], block[1])
+
+        checkin = day(rng.randrange(0, 320))
+        checkout = checkin + datetime.timedelta(days=rng.randrange(1, 20))
+        assert index.find_cage_ids(checkin, checkout) == brute_force(blocks, checkin, checkout)
+
+
+def test_remove_without_covering_block():
+    cage_id = bson.ObjectId()
+    index = availability.AvailabilityIndex()
+    index.load([(day(0), day(5), cage_id)])
+
+    assert not index.remove(cage_id, day(3), day(8))
+    assert not index.remove(bson.ObjectId(), day(1), day(2))
+    assert index.find_cage_ids(day(1), day(2)) == {cage_id}
+
+
+def test_replace_cage():
+    a, b = bson.ObjectId(), bson.ObjectId()
+    index = availability.AvailabilityIndex()
+    index.load([(day(0), day(5), a), (day(10), day(20), a), (day(0), day(30), b)])
+
+    index.replace_cage(a, [(day(40), day(50))])
+
+    assert index.blocks(a) == [(day(40), day(50))]
+    assert index.find_cage_ids(day(1), day(3)) == {b}
+    assert index.find_cage_ids(day(41), day(45)) == {a}
+
+    index.replace_cage(b, [])
+    assert index.blocks(b) == []
+    assert len(index) == 1
+
+
+def test_clear():
+    index = availability.AvailabilityIndex()
+    index.load([(day(0), day(5), bson.ObjectId())])
+    index.clear()
+
+    assert not index.loaded
+    assert index.find_cage_ids(day(1), day(2)) == set()
+
+
+def block(check_in: int, check_out: int) -> dict:
+    return {'check_in_date': day(check_in), 'check_out_date': day(check_out)}
+
+
+def test_coalesce_merges_touching_and_overlapping_blocks():
+    blocks = [block(0, 3), block(5, 8), block(20, 25)]
+
+    check_in, check_out, absorbed = availability.coalesce(blocks, day(3), day(5))
+
+    assert (check_in, check_out) == (day(0), day(8))
+    assert sorted(b['check_in_date'] for b in absorbed) == [day(0), day(5)]
+
+
+def test_coalesce_merges_through_other_blocks():
+    # The new block reaches the first one only through the merged second one.
+    blocks = [block(0, 4), block(4, 6)]
+
+    check_in, check_out, absorbed = availability.coalesce(blocks, day(6), day(9))
+
+    assert (check_in, check_out) == (day(0), day(9))
+    assert len(absorbed) == 2
+
+
+def test_coalesce_inside_existing_block():
+    check_in, check_out, absorbed = availability.coalesce([block(0, 10)], day(2), day(4))
+
+    assert (check_in, check_out) == (day(0), day(10))
+    assert len(absorbed) == 1
+
+
+def test_coalesce_leaves_separate_blocks():
+    check_in, check_out, absorbed = availability.coalesce([block(0, 2), block(9, 12)], day(4), day(6))
+
+    assert (check_in, check_out) == (day(4), day(6))
+    assert absorbed == []
+
+
+def test_split():
+    assert availability.split(day(0), day(10), day(3), day(5)) == [(day(0), day(3)), (day(5), day(10))]
+    assert availability.split(day(0), day(10), day(0), day(5)) == [(day(5), day(10))]
+    assert availability.split(day(0), day(10), day(5), day(10)) == [(day(0), day(5))]
+    assert availability.split(day(0), day(10), day(0), day(10)) == []
+
+
+def stamp(cage_id, version: int, seconds: int) -> dict:
+    return {'_id': cage_id, 'availability_version': version,
+            'availability_updated': START + datetime.timedelta(seconds=seconds)}
+
+
+def test_change_tracker_reports_each_version_once():
+    a, b = bson.ObjectId(), bson.ObjectId()
+    tracker = availability.ChangeTracker()
+    tracker.reset(None)
+    assert tracker.window() == {'availability_updated': {'$exists': True}}
+
+    assert tracker.changed([stamp(a, 1, 0), stamp(b, 1, 1)]) == [a, b]
+    assert tracker.since == START + datetime.timedelta(seconds=1)
+
+    # The next poll looks back over the overlap and sees the same stamps again.
+    assert tracker.window() == {'availability_updated': {'$gte': tracker.since - availability.SYNC_OVERLAP}}
+    assert tracker.changed([stamp(a, 1, 0), stamp(b, 1, 1)]) == []
+    assert tracker.changed([stamp(a, 2, 1), stamp(b, 1, 1)]) == [a]
+
+
+def test_change_tracker_forgets_stamps_behind_the_window():
+    a, b = bson.ObjectId(), bson.ObjectId()
+    tracker = availability.ChangeTracker()
+    tracker.reset(START)
+
+    tracker.changed([stamp(a, 1, 0)])
+    tracker.changed([stamp(b, 1, 60)])
+
+    assert tracker.since == START + datetime.timedelta(seconds=60)
+    assert set(tracker._seen) == {b}
+
+
+def test_coalesce_all_merges_new_blocks_with_each_other():
+    free = [block(0, 3), block(20, 25)]
+
+    merged, absorbed = availability.coalesce_all(free, [(day(5), day(8)), (day(3), day(5)), (day(30), day(31))])
+
+    assert merged == [(day(0), day(8)), (day(30), day(31))]
+    assert absorbed == [free[0]]
+
+
+def test_coalesce_all_block_inside_existing_one():
+    free = [block(0, 10)]
+
+    merged, absorbed = availability.coalesce_all(free, [(day(2), day(4))])
+
+    assert merged == [(day(0), day(10))]
+    assert absorbed == free
+
+
+def test_subtract():
+    blocks = [(day(0), day(10)), (day(20), day(30))]
+
+    assert availability.subtract(blocks, [(day(3), day(5))]) == [(day(0), day(3)), (day(5), day(10)), (day(20), day(30))]
+    assert availability.subtract(blocks, [(day(8), day(22))]) == [(day(0), day(8)), (day(22), day(30))]
+    assert availability.subtract(blocks, [(day(10), day(20))]) == blocks
+    assert availability.subtract(blocks, [(day(0), day(10)), (day(19), day(31))]) == []
@@ -0,0 +1,81 @@
+import datetime
+
+import bson
+import mongoengine
+import pytest
+
+from data.cage_bookings import CageBooking
+from data.cages import Cage
+from data.snakes import Snake
+from services import data_service as svc
+
+
+def cage_row(**values):
+    row = {'name': 'Rock', 'price': '12.5', 'square_meters': '3', 'is_carpeted': 'true', 'has_toys': 'no'}
+    row.update(values)
+    return row
+
+
+def test_cage_row_is_coerced():
+    cage = svc._build_document(Cage, cage_row(allow_dangerous_snakes=''))
+
+    assert (cage.name, cage.price, cage.square_meters) == ('Rock', 12.5, 3.0)
+    assert (cage.is_carpeted, cage.has_toys, cage.allow_dangerous_snakes) == (True, False, False)
+
+
+@pytest.mark.parametrize('text, value', [('1', True), ('TRUE', True), (' yes ', True), ('y', True),
+                                         ('0', False), ('False', False), ('no', False), ('N', False)])
+def test_booleans_accept_explicit_values(text, value):
+    assert svc._build_document(Snake, {'name': 's', 'species': 'py', 'length': '2',
+                                       'is_venomous': text}).is_venomous is value
+
+
+@pytest.mark.parametrize('text', ['maybe', 'ture', '2', '-'])
+def test_unrecognized_booleans_are_rejected(text):
+    with pytest.raises(ValueError, match='is_carpeted'):
+        svc._build_document(Cage, cage_row(is_carpeted=text))
+
+
+@pytest.mark.parametrize('field', ['name', 'price', 'is_carpeted'])
+@pytest.mark.parametrize('blank', ['', '   '])
+def test_blank_required_fields_are_rejected(field, blank):
+    with pytest.raises(mongoengine.ValidationError, match=field):
+        svc._build_document(Cage, cage_row(**{field: blank}))
+
+
+def test_unknown_and_extra_columns_are_rejected():
+    with pytest.raises(ValueError, match='Unknown field'):
+        svc._build_document(Cage, cage_row(colour='red'))
+    with pytest.raises(ValueError, match='more values'):
+        svc._build_document(Cage, {**cage_row(), None: ['x']})
+
+
+def test_block_row_with_days():
+    cage_id = str(bson.ObjectId())
+    row = svc._block_row({'cage_id': cage_id, 'check_in_date': '2030-01-05', 'days': '3'})
+    block = svc._build_document(CageBooking, row)
+
+    assert block.check_in_date == datetime.datetime(2030, 1, 5)
+    assert block.check_out_date == datetime.datetime(2030, 1, 8)
+
+
+@pytest.mark.parametrize('row', [
+    {'check_in_date': '2030-01-05', 'check_out_date': '2030-01-05'},
+    {'check_in_date': '2030-01-05', 'check_out_date': '2030-01-04'},
+    {'check_in_date': '2030-01-05', 'days': '0'},
+    {'check_in_date': '2030-01-05', 'days': '-2'},
+])
+def test_empty_or_reversed_blocks_are_rejected(row):
+    with pytest.raises(ValueError, match='after check_in_date'):
+        svc._block_row(dict(row, cage_id=str(bson.ObjectId())))
+
+
+def test_bad_rows_are_reported_and_the_rest_written():
+    written = []
+    result = svc.BulkResult()
+    rows = [cage_row(), cage_row(name=''), cage_row(has_toys='sometimes'), cage_row(name='Log')]
+
+    svc._run_batches(Cage, rows, 10, False, result, written.extend)
+
+    assert [row for row, _ in result.errors] == [2, 3]
+    assert [(row, cage.name) for row, cage in written] == [(1, 'Rock'), (4, 'Log')]
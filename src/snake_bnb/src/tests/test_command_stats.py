@@ -0,0 +1,89 @@
+import asyncio
+import itertools
+import types
+
+import pytest
+
+from infrastructure import command_stats
+
+SERVICE = '''
+import asyncio
+
+def find_cage():
+    issue('find')
+    issue('find')
+
+def book_cage():
+    find_cage()
+    issue('update')
+
+def iter_cages():
+    return (issue('getMore') for _ in range(3))
+
+async def find_cage_async():
+    issue('find')
+    await asyncio.sleep(0)
+    issue('find')
+
+def _private():
+    issue('find')
+'''
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    stats = command_stats.CommandStats()
+    monkeypatch.setattr(command_stats, 'stats', stats)
+    return stats
+
+
+@pytest.fixture
+def service():
+    request_ids = itertools.count()
+
+    def issue(command_name):
+        event = types.SimpleNamespace(command={command_name: 'cages'}, command_name=command_name,
+                                      connection_id=('localhost', 27017), request_id=next(request_ids),
+                                      duration_micros=1500, reply={'n': 1})
+        command_stats.stats.started(event)
+        command_stats.stats.succeeded(event)
+
+    module = types.ModuleType('tests.fake_service')
+    module.issue = issue
+    exec(SERVICE, module.__dict__)
+    command_stats.track_calls(module.__dict__)
+    return module
+
+
+def counts(stats):
+    return {name: (s.calls, s.commands) for name, s in stats.functions.items()}
+
+
+def test_commands_go_to_the_outermost_call(stats, service):
+    service.find_cage()
+    service.book_cage()
+    service.find_cage()
+
+    assert counts(stats) == {'find_cage': (2, 4), 'book_cage': (1, 3)}
+
+
+def test_lazy_results_are_attributed_while_iterated(stats, service):
+    items = service.iter_cages()
+    assert counts(stats) == {}
+
+    list(items)
+    assert counts(stats) == {'iter_cages': (1, 3)}
+
+
+def test_coroutines(stats, service):
+    async def main():
+        await asyncio.gather(service.find_cage_async(), service.find_cage_async())
+
+    asyncio.run(main())
+    assert counts(stats) == {'find_cage_async': (2, 4)}
+
+
+def test_private_functions_are_not_tracked(stats, service):
+    service._private()
+    assert counts(stats) == {'<other>': (0, 1)}
+
@@ -0,0 +1,50 @@
+import datetime
+
+import pytest
+from dateutil import parser
+
+from infrastructure import dates
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2026-10-18', datetime.datetime(2026, 10, 18)),
+    ('  2026-10-18\n', datetime.datetime(2026, 10, 18)),
+    ('2024-02-29', datetime.datetime(2024, 2, 29)),
+    ('0001-01-01', datetime.datetime(1, 1, 1)),
+    ('9999-12-31', datetime.datetime(9999, 12, 31)),
+    ('2026-10-18T09:30:00', datetime.datetime(2026, 10, 18, 9, 30)),
+    ('2026-10-18 09:30', datetime.datetime(2026, 10, 18, 9, 30)),
+    ('2026-1-5', datetime.datetime(2026, 1, 5)),
+    ('10/18/2026', datetime.datetime(2026, 10, 18)),
+    ('Oct 18 2026', datetime.datetime(2026, 10, 18)),
+    ('18 October 2026', datetime.datetime(2026, 10, 18)),
+])
+def test_accepted_formats(text, expected):
+    assert dates.parse_date(text) == expected
+
+
+def test_dates_and_datetimes():
+    assert dates.parse_date(datetime.date(2026, 10, 18)) == datetime.datetime(2026, 10, 18)
+    moment = datetime.datetime(2026, 10, 18, 9, 30)
+    assert dates.parse_date(moment) is moment
+
+
+@pytest.mark.parametrize('text', ['', '   ', 'not a date', '2026-13-01', '2026-02-30', '2023-02-29',
+                                  '2026-10-32', '2026-1x-18'])
+def test_invalid_text(text):
+    with pytest.raises(ValueError):
+        dates.parse_date(text)
+
+
+@pytest.mark.parametrize('value', [None, 20261018, 2026.5, ['2026-10-18']])
+def test_values_that_are_not_dates(value):
+    with pytest.raises(TypeError):
+        dates.parse_date(value)
+
+
+def test_fast_path_agrees_with_dateutil_over_a_range():
+    day = datetime.date(2023, 1, 1)
+    while day < datetime.date(2025, 1, 1):
+        text = day.isoformat()
+        assert dates.parse_date(text) == parser.parse(text), text
+        day += datetime.timedelta(days=1)
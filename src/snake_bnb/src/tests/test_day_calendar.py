@@ -0,0 +1,93 @@
+import datetime
+import random
+
+import bson
+import pytest
+
+from services import day_calendar
+
+TODAY = datetime.date(2026, 10, 18)
+
+
+def at(year: int, month: int, day: int) -> datetime.datetime:
+    return datetime.datetime(year, month, day)
+
+
+@pytest.fixture(autouse=True)
+def fixed_today(monkeypatch):
+    monkeypatch.setattr(day_calendar, 'today', lambda: TODAY)
+
+
+@pytest.fixture(params=['numpy', 'int'])
+def vectorized(request, monkeypatch):
+    if request.param == 'int':
+        monkeypatch.setattr(day_calendar, 'numpy', None)
+    elif day_calendar.numpy is None:
+        pytest.skip('numpy is not installed')
+    return request.param
+
+
+def calendar_of(cage_start: datetime.date, blocks) -> int:
+    return day_calendar.bitmap_from_blocks(blocks, cage_start)
+
+
+def test_stays_past_a_stored_horizon_fall_back(vectorized):
+    cage_id = bson.ObjectId()
+    built = datetime.date(2026, 1, 1)
+    calendars = day_calendar.DayCalendar()
+    calendars.load([(cage_id, built, calendar_of(built, [(at(2026, 1, 1), at(2028, 1, 1))]))], TODAY)
+
+    assert calendars.find_cage_ids(at(2026, 11, 1), at(2026, 11, 5)) == {cage_id}
+    # Built on 2026-01-01, the calendar knows nothing after 2027-02-05.
+    assert calendars.find_cage_ids(at(2027, 3, 1), at(2027, 3, 5)) is None
+
+    calendars.set(cage_id, TODAY, calendar_of(TODAY, [(at(2026, 1, 1), at(2028, 1, 1))]))
+    assert calendars.find_cage_ids(at(2027, 3, 1), at(2027, 3, 5)) == {cage_id}
+
+
+def test_missing_calendar_falls_back(vectorized):
+    a, b = bson.ObjectId(), bson.ObjectId()
+    calendars = day_calendar.DayCalendar()
+    calendars.load([(a, TODAY, calendar_of(TODAY, [(at(2026, 11, 1), at(2026, 11, 9))])), (b, None, None)], TODAY)
+
+    assert calendars.find_cage_ids(at(2026, 11, 2), at(2026, 11, 4)) is None
+
+    calendars.set(b, TODAY, 0)
+    assert calendars.find_cage_ids(at(2026, 11, 2), at(2026, 11, 4)) == {a}
+
+
+def test_updates_match_brute_force(vectorized):
+    rng = random.Random(5)
+    cage_ids = [bson.ObjectId() for _ in range(60)]
+    blocks = {}
+
+    def random_blocks():
+        found = []
+        for _ in range(rng.randrange(0, 4)):
+            start = at(2026, 10, 18) + datetime.timedelta(days=rng.randrange(0, 380))
+            found.append((start, start + datetime.timedelta(days=rng.randrange(1, 30))))
+        return found
+
+    calendars = day_calendar.DayCalendar()
+    initial = []
+    for cage_id in cage_ids:
+        blocks[cage_id] = random_blocks()
+        initial.append((cage_id, TODAY, calendar_of(TODAY, blocks[cage_id])))
+    calendars.load(initial, TODAY)
+
+    for _ in range(300):
+        cage_id = rng.choice(cage_ids)
+        if rng.random() < 0.1:
+            calendars.update([(cage_id, None, None)])
+            calendars.update([(cage_id, TODAY, 0)])
+            blocks[cage_id] = []
+        else:
+            blocks[cage_id] = random_blocks()
+            calendars.set(cage_id, TODAY, calendar_of(TODAY, blocks[cage_id]))
+
+        checkin = at(2026, 10, 18) + datetime.timedelta(days=rng.randrange(0, 390))
+        checkout = checkin + datetime.timedelta(days=rng.randrange(1, 10))
+        expected = {c for c, bs in blocks.items()
+                    if any(i <= checkin and o >= checkout for i, o in bs)}
+        # Back-to-back blocks read as one, so the calendar may return extra candidates only.
+        assert expected <= calendars.find_cage_ids(checkin, checkout)
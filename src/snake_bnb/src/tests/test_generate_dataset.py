@@ -0,0 +1,98 @@
+import collections
+import datetime
+
+import pytest
+
+from data.views import BookingView, CageView, SnakeView
+from services import day_calendar, owner_summary
+from tools.generate_dataset import DatasetGenerator
+
+
+class ListWriter:
+    def __init__(self):
+        self.docs = collections.defaultdict(list)
+
+    def write(self, collection: str, doc):
+        self.docs[collection].append(doc)
+
+
+def generate(separate_bookings=False, **options) -> dict:
+    generator = DatasetGenerator(
+        seed=3, owners=60, host_ratio=0.25, cages_per_host=3, snakes_per_guest=2, blocks_per_cage=25,
+        booking_density=0.5, venomous_ratio=0.2, start=datetime.datetime(2026, 9, 1),
+        separate_bookings=separate_bookings, **options)
+    writer = ListWriter()
+    generator.generate(writer)
+    return writer.docs
+
+
+def bookings_by_cage(docs: dict) -> dict:
+    if not docs['bookings']:
+        return {c['_id']: c['bookings'] for c in docs['cages']}
+
+    by_cage = collections.defaultdict(list)
+    for b in docs['bookings']:
+        by_cage[b['cage_id']].append(b)
+    return by_cage
+
+
+@pytest.mark.parametrize('separate_bookings', [False, True])
+def test_blocks_look_like_the_services_left_them(separate_bookings):
+    docs = generate(separate_bookings)
+    by_cage = bookings_by_cage(docs)
+    assert len(by_cage) == len(docs['cages'])
+
+    booked = free = 0
+    for bookings in by_cage.values():
+        assert [b['check_in_date'] for b in bookings] == sorted(b['check_in_date'] for b in bookings)
+        for before, after in zip(bookings, bookings[1:]):
+            assert before['check_out_date'] <= after['check_in_date']
+            if 'guest_snake_id' not in before and 'guest_snake_id' not in after:
+                # add_available_date would have merged them.
+                assert before['check_out_date'] < after['check_in_date']
+        for b in bookings:
+            assert b['check_in_date'] < b['check_out_date']
+            if 'guest_snake_id' in b:
+                booked += 1
+            else:
+                free += 1
+                assert set(b) - {'_id', 'cage_id'} == {'check_in_date', 'check_out_date', 'rating'}
+
+    assert booked and free
+
+
+def test_calendars_hold_the_free_blocks(monkeypatch):
+    monkeypatch.setattr(day_calendar, 'today', lambda: datetime.date(2026, 10, 18))
+    docs = generate(day_calendars=True)
+
+    for cage in docs['cages']:
+        free = [(b['check_in_date'], b['check_out_date']) for b in cage['bookings'] if 'guest_snake_id' not in b]
+        assert cage['calendar_start'] == datetime.datetime(2026, 10, 18)
+        assert day_calendar.from_bytes(cage['free_days']) == day_calendar.bitmap_from_blocks(
+            free, datetime.date(2026, 10, 18))
+    assert all(c.get('free_days') is None for c in generate()['cages'])
+
+
+def test_summaries_match_a_recompute():
+    docs = generate(owner_summaries=True)
+    cages = {c['_id']: CageView(c) for c in docs['cages']}
+    snakes = {s['_id']: SnakeView(s) for s in docs['snakes']}
+
+    guest_bookings = collections.defaultdict(list)
+    for cage in cages.values():
+        for b in cage.bookings:
+            if b.guest_owner_id:
+                booking = BookingView({'guest_snake_id': b.guest_snake_id, 'booked_date': b.booked_date,
+                                       'check_in_date': b.check_in_date, 'check_out_date': b.check_out_date})
+                booking.cage, booking.snake = cage, snakes[b.guest_snake_id]
+                guest_bookings[b.guest_owner_id].append(booking)
+
+    summaries = {s['_id']: s for s in docs['owner_summaries']}
+    assert set(summaries) == {o['_id'] for o in docs['owners']}
+    for owner in docs['owners']:
+        expected = owner_summary.summarize(owner['_id'], len(owner.get('snake_ids', [])),
+                                           [cages[i] for i in owner.get('cage_ids', [])],
+                                           guest_bookings[owner['_id']])
+        assert summaries[owner['_id']] == expected.to_mongo()
+    assert any(s.get('guest_bookings') for s in summaries.values())
+    assert 'owner_summaries' not in generate()
@@ -0,0 +1,84 @@
+import bson
+
+from infrastructure.lru_cache import LruTtlCache
+from services import data_service as svc
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_least_recently_used_is_evicted_first():
+    cache = LruTtlCache(max_size=3, ttl_seconds=60, clock=Clock())
+    for key in 'abc':
+        cache.put(key, key.upper())
+
+    assert cache.get('a') == 'A'
+    cache.put('d', 'D')
+    assert cache.get('b') is None
+    assert [cache.get(k) for k in 'acd'] == ['A', 'C', 'D']
+
+    cache.put('c', 'C2')
+    cache.put('e', 'E')
+    assert cache.get('a') is None
+    assert [cache.get(k) for k in 'cde'] == ['C2', 'D', 'E']
+    assert cache.stats()['evictions'] == 2
+    assert cache.stats()['size'] == 3
+
+
+def test_entries_expire_ttl_seconds_after_they_were_stored():
+    clock = Clock()
+    cache = LruTtlCache(max_size=10, ttl_seconds=10, clock=clock)
+    cache.put('a', 1)
+    clock.now = 5
+    cache.put('b', 2)
+
+    clock.now = 9.5
+    assert cache.get('a') == 1
+    clock.now = 10
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+
+    cache.put('a', 3)
+    clock.now = 19.5
+    assert cache.get('a') == 3
+    assert cache.get('b') is None
+    assert cache.stats() == {'size': 1, 'max_size': 10, 'hits': 3, 'misses': 2, 'hit_rate': 0.6,
+                             'evictions': 0, 'expirations': 2}
+
+
+def test_invalidate_and_clear():
+    cache = LruTtlCache(max_size=10, ttl_seconds=10, clock=Clock())
+    cache.put('a', 1)
+    cache.put('b', 2)
+
+    cache.invalidate('a')
+    cache.invalidate('missing')
+    assert cache.get('a') is None and cache.get('b') == 2
+
+    cache.clear()
+    assert cache.get('b') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_owner_writes_refresh_the_cached_account(backends):
+    backends('mongo')
+    hits = svc.owner_cache.hits
+    host = svc.create_account('Host', 'host@example.com')
+    assert svc.find_account_by_email('host@example.com').cage_ids == []
+
+    cage = svc.register_cage(host, 'Rock', False, True, True, 4, 1)
+    snake = svc.add_snake(host, 'Monty', 2, 'python', False)
+
+    # Served from the cache from here on: the account only exists there now.
+    host.delete()
+    for account in (svc.find_account_by_email('host@example.com'), svc.find_account_by_id(host.id)):
+        assert (account.cage_ids, account.snake_ids) == ([cage.id], [snake.id])
+
+    assert svc.find_account_by_id(bson.ObjectId()) is None
+    assert svc.owner_cache.hits - hits == 3
+    assert svc.owner_cache.stats()['size'] == 2
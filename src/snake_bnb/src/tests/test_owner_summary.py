@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+
+import data.mongo_setup as mongo_setup
+from data.owner_summaries import OwnerSummary
+from services import data_service as svc
+
+START = datetime.datetime(2030, 1, 1)
+
+
+def day(n: int) -> datetime.datetime:
+    return START + datetime.timedelta(days=n)
+
+
+@pytest.mark.parametrize('backend', ['mongo', 'mongo-separate'])
+def test_kept_summaries_match_a_recompute(backends, backend, monkeypatch):
+    backends(backend)
+    monkeypatch.setattr(mongo_setup, 'use_owner_summaries', True)
+
+    host = svc.create_account('Host', 'host@example.com')
+    both = svc.create_account('Both', 'both@example.com')
+    guest = svc.create_account('Guest', 'guest@example.com')
+
+    rock = svc.register_cage(host, 'Rock', True, True, True, 4, 10)
+    log = svc.register_cage(host, 'Log', False, False, True, 6, 12)
+    den = svc.register_cage(both, 'Den', True, True, False, 5, 8)
+    monty = svc.add_snake(guest, 'Monty', 2, 'python', False)
+    viper = svc.add_snake(guest, 'Viper', 3, 'viper', True)
+    sid = svc.add_snake(both, 'Sid', 1, 'boa', False)
+
+    # Overlapping, touching and nested blocks merge; bookings split them.
+    svc.add_available_date(rock, day(0), 5)
+    svc.add_available_date(rock, day(3), 6)
+    svc.add_available_date(rock, day(9), 3)
+    svc.add_available_date(log, day(2), 4)
+    svc.add_available_date(den, day(0), 20)
+    svc.add_available_date(den, day(5), 2)
+
+    svc.book_cage(guest, monty, rock, day(1), day(3))
+    svc.book_cage(guest, viper, den, day(0), day(4))
+    svc.book_cage(both, sid, log, day(2), day(6))
+    svc.book_cage(both, sid, rock, day(8), day(12))
+
+    # Free days next to the stays come back and merge with what is left.
+    svc.add_available_date(rock, day(0), 2)
+    svc.add_available_date(rock, day(12), 3)
+    svc.add_available_date(log, day(6), 4)
+    svc.add_available_date(log, day(0), 2)
+    svc.book_cage(guest, monty, rock, day(12), day(14))
+    svc.book_cage(guest, monty, log, day(7), day(9))
+    svc.add_available_date(den, day(18), 10)
+
+    for account in (host, both, guest):
+        account = svc.find_account_by_id(account.id)
+        stored = OwnerSummary.objects(id=account.id).first()
+        assert stored.to_mongo().to_dict() == svc.compute_owner_summary(account).to_mongo().to_dict()
@@ -0,0 +1,140 @@
+import random
+
+import pytest
+
+import program_guests as guests
+import program_hosts as hosts
+from infrastructure.switchlang import Dispatcher, switch
+
+HOST_COMMANDS = {
+    'c': hosts.create_account,
+    'a': hosts.create_account,
+    'l': hosts.log_into_account,
+    'y': hosts.list_cages,
+    'r': hosts.register_cage,
+    'u': hosts.update_availability,
+    'v': hosts.view_bookings,
+    'd': hosts.dashboard,
+    'x': hosts.exit_app,
+    'bye': hosts.exit_app,
+    'exit': hosts.exit_app,
+    'exit()': hosts.exit_app,
+    '?': hosts.show_commands,
+}
+
+GUEST_COMMANDS = {
+    'c': hosts.create_account,
+    'l': hosts.log_into_account,
+    'a': guests.add_a_snake,
+    'y': guests.view_your_snakes,
+    'b': guests.book_a_cage,
+    'v': guests.view_bookings,
+    'd': guests.dashboard,
+    'x': hosts.exit_app,
+    'bye': hosts.exit_app,
+    'exit': hosts.exit_app,
+    'exit()': hosts.exit_app,
+    '?': guests.show_commands,
+}
+
+
+@pytest.mark.parametrize('actions, commands, unknown', [
+    (hosts.actions, HOST_COMMANDS, hosts.unknown_command),
+    (guests.actions, GUEST_COMMANDS, hosts.unknown_command),
+], ids=['host', 'guest'])
+def test_every_command_runs_its_handler(actions, commands, unknown):
+    assert actions.keys() == set(commands) | {'m', ''}
+    for key, handler in commands.items():
+        assert actions.handlers(key) == (handler,), key
+
+    assert actions('m') == 'change_mode'
+    assert actions('') is None
+    assert actions.handlers('q') == actions.handlers('C') == (unknown,)
+
+
+def random_cases(rng: random.Random):
+    """
+        (key, fallthrough) registrations over the values 0-29: single values, lists and ranges.
+    """
+    free = list(range(30))
+    rng.shuffle(free)
+
+    cases = []
+    while free and rng.random() < 0.9:
+        kind = rng.choice(['value', 'list', 'range'])
+        if kind == 'value':
+            key = free.pop()
+        elif kind == 'list':
+            key = [free.pop() for _ in range(min(len(free), rng.randint(1, 3)))]
+        else:
+            start = free.pop()
+            rest = range(start + 1, start + rng.randint(1, 3))
+            key = start
+            if all(k in free for k in rest):
+                key = range(start, rest.stop)
+                for k in rest:
+                    free.remove(k)
+        cases.append((key, rng.random() < 0.3))
+    return cases
+
+
+def run_switch(value, cases, default: bool, calls: list):
+    with switch(value) as s:
+        for idx, (key, fallthrough) in enumerate(cases):
+            s.case(key, lambda idx=idx: calls.append(idx) or idx, fallthrough=fallthrough)
+        if default:
+            s.default(lambda: calls.append('default') or 'default')
+    return s.result
+
+
+def build_dispatcher(cases, default: bool, calls: list) -> Dispatcher:
+    d = Dispatcher()
+    for idx, (key, fallthrough) in enumerate(cases):
+        d.case(key, lambda idx=idx: calls.append(idx) or idx, fallthrough=fallthrough)
+    if default:
+        d.default(lambda: calls.append('default') or 'default')
+    return d.freeze()
+
+
+def outcome(run):
+    calls = []
+    try:
+        return run(calls), calls
+    except Exception as x:
+        return type(x), calls
+
+
+def test_dispatcher_matches_switch():
+    rng = random.Random(11)
+    for _ in range(300):
+        cases = random_cases(rng)
+        default = rng.random() < 0.7
+        for value in range(-1, 31):
+            expected = outcome(lambda calls: run_switch(value, cases, default, calls))
+            actual = outcome(lambda calls: build_dispatcher(cases, default, calls)(value))
+            assert actual == expected, (cases, default, value)
+
+
+def test_fallthrough_runs_the_following_cases():
+    calls = []
+    d = (Dispatcher()
+         .case('a', lambda: calls.append('a'), fallthrough=True)
+         .case('b', lambda: calls.append('b'), fallthrough=True)
+         .case('c', lambda: calls.append('c') or 'c')
+         .default(lambda: calls.append('default')))
+
+    assert d('a') == 'c' and calls == ['a', 'b', 'c']
+    assert len(d.handlers('b')) == 2 and len(d.handlers('zzz')) == 1
+
+
+def test_invalid_cases_are_rejected():
+    with pytest.raises(ValueError, match='Duplicate case'):
+        Dispatcher().case(['a', 'b'], print).case('b', print)
+    with pytest.raises(ValueError, match='Duplicate default'):
+        Dispatcher().default(print).default(print)
+    with pytest.raises(ValueError, match='callable'):
+        Dispatcher().case('a', 'print')
+    with pytest.raises(ValueError, match='frozen'):
+        Dispatcher().case('a', print).freeze().case('b', print)
+    with pytest.raises(Exception, match='no default case'):
+        Dispatcher().case('a', print)('b')
@@ -0,0 +1,91 @@
+import datetime
+
+import bson
+from bson.raw_bson import RawBSONDocument
+import pytest
+
+from data.cages import Booking, Cage
+from data.owners import Owner
+from data.snakes import Snake
+from data.views import BookingView, CageView, OwnerView, SnakeView
+
+START = datetime.datetime(2030, 1, 1)
+
+
+def day(n: int) -> datetime.datetime:
+    return START + datetime.timedelta(days=n)
+
+
+def cage_doc() -> dict:
+    cage = Cage(id=bson.ObjectId(), name='Rock', price=12.5, square_meters=4, is_carpeted=True, has_toys=False,
+                registered_date=START)
+    cage.bookings = [
+        Booking(check_in_date=day(0), check_out_date=day(3)),
+        Booking(guest_owner_id=bson.ObjectId(), guest_snake_id=bson.ObjectId(), booked_date=START,
+                check_in_date=day(3), check_out_date=day(5), review='Warm', rating=4),
+    ]
+    return cage.to_mongo().to_dict()
+
+
+@pytest.mark.parametrize('model, view, doc', [
+    (Cage, CageView, lambda: cage_doc()),
+    (Snake, SnakeView, lambda: Snake(id=bson.ObjectId(), name='Monty', species='python', length=2,
+                                     is_venomous=False).to_mongo().to_dict()),
+    (Owner, OwnerView, lambda: Owner(id=bson.ObjectId(), name='Host', email='host@example.com',
+                                     cage_ids=[bson.ObjectId()]).to_mongo().to_dict()),
+], ids=['cage', 'snake', 'owner'])
+def test_views_read_like_the_documents(model, view, doc):
+    doc = doc()
+    document = model._from_son(doc)
+    v = view(doc)
+
+    for name in (s for s in view.__slots__ if not s.startswith('_')):
+        assert getattr(v, name) == getattr(document, name), name
+    assert not hasattr(v, '__dict__')
+
+
+def test_booking_views_read_like_the_embedded_documents():
+    doc = cage_doc()
+    cage = Cage._from_son(doc)
+    bookings = CageView(doc).bookings
+
+    assert all(isinstance(b, BookingView) for b in bookings)
+    for view, booking in zip(bookings, cage.bookings):
+        for name in ('guest_owner_id', 'guest_snake_id', 'booked_date', 'check_in_date', 'check_out_date',
+                     'review', 'rating', 'duration_in_days'):
+            assert getattr(view, name) == getattr(booking, name), name
+        assert view.cage is None and view.snake is None
+
+
+def test_missing_fields_read_as_the_model_defaults_or_none():
+    cage = CageView({'_id': bson.ObjectId(), 'name': 'Rock'})
+    assert (cage.price, cage.bookings, cage.allow_dangerous_snakes, cage.free_days) == (None, [], False, None)
+
+    owner = OwnerView({'email': 'host@example.com'})
+    assert (owner.id, owner.snake_ids, owner.cage_ids) == (None, [], [])
+    assert BookingView({'check_in_date': day(0), 'check_out_date': day(2)}).rating == 0
+
+
+def test_bookings_are_decoded_on_first_access():
+    cage = CageView(cage_doc())
+    assert cage._bookings is None
+
+    first = cage.bookings
+    assert cage.bookings is first and len(first) == 2
+    assert cage._raw_bookings == ()
+
+    cage.bookings = [first[1]]
+    assert [b.duration_in_days for b in cage.bookings] == [2]
+
+
+def test_views_over_raw_bson_decode_bookings_when_read():
+    doc = cage_doc()
+    cage = CageView(RawBSONDocument(bson.encode(doc)))
+    assert (cage.id, cage.name, cage.price, cage.free_days) == (doc['_id'], 'Rock', 12.5, None)
+    assert cage._bookings is None
+
+    def fields(booking: BookingView) -> dict:
+        return {s: getattr(booking, s) for s in BookingView.__slots__}
+
+    assert all(isinstance(b, BookingView) for b in cage.bookings)
+    assert [fields(b) for b in cage.bookings] == [fields(b) for b in CageView(doc).bookings]
@@ -0,0 +1,339 @@
+"""
+Benchmark the services.data_service operations at several dataset sizes.
+
+Run from the src folder:
+
+    python -m tools.benchmark --backend mock --sizes 100,1000 --save-baseline bench.json
+    python -m tools.benchmark --backend mongo --sizes 1000,10000 --baseline bench.json
+
+--backend mongo uses a scratch database on the configured server (see
+data.mongo_setup), dropped afterwards; --backend mock runs in-process on
+mongomock (pip install mongomock) so it works offline, and --backend memory runs
+on services.memory_backend with no database at all. Each size is seeded with
+tools.generate_dataset, then every operation runs --iterations times. The report
+lists p50/p95/p99 latency, throughput and round trips (database commands) per
+call. With --baseline, the run fails if an operation's p95 grew by more than
+--tolerance or it needs more round trips than the baseline recorded.
+"""
+import argparse
+import dataclasses
+import datetime
+import json
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+
+import mongoengine
+from pymongo import monitoring
+
+from data.cages import Cage
+import data.mongo_setup as mongo_setup
+from data.owners import Owner
+from data.snakes import Snake
+from services import availability, memory_backend
+import services.data_service as svc
+from tools.generate_dataset import DatasetGenerator, MemoryWriter, MongoWriter
+
+OPERATIONS = ('create_account', 'register_cage', 'add_available_date', 'add_snake',
+              'get_available_cages', 'book_cage', 'get_bookings_for_user')
+
+DATASET_START = datetime.datetime(2024, 1, 1)
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """
+        Counts the commands sent to the server, getMore included.
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def started(self, event):
+        self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class MockRoundTripCounter:
+    """
+        mongomock never talks to a server, so count the outermost call of each
+        collection method that would be one command against a real mongod.
+    """
+    methods = ('insert_one', 'insert_many', 'find', 'find_one', 'find_one_and_update',
+               'update_one', 'update_many', 'replace_one', 'delete_one', 'delete_many',
+               'aggregate', 'distinct', 'count_documents', 'bulk_write')
+
+    def __init__(self):
+        import mongomock.collection
+
+        self.count = 0
+        self._depth = 0
+        for name in self.methods:
+            self._wrap(mongomock.collection.Collection, name)
+
+    def _wrap(self, cls, name):
+        original = getattr(cls, name)
+
+        def counted(collection, *args, **kwargs):
+            if not self._depth:
+                self.count += 1
+            self._depth += 1
+            try:
+                return original(collection, *args, **kwargs)
+            finally:
+                self._depth -= 1
+
+        setattr(cls, name, counted)
+
+
+@dataclasses.dataclass
+class OperationResult:
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    ops_per_sec: float
+    round_trips: float
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the data_service operations.')
+    parser.add_argument('--backend', choices=['mongo', 'mock', 'memory'], default='mongo')
+    parser.add_argument('--db', default='snake_bnb_benchmark', help='Scratch database (dropped afterwards).')
+    parser.add_argument('--sizes', default='100,1000', help='Comma separated owner counts to seed.')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', help='Compare against this JSON report.')
+    parser.add_argument('--save-baseline', help='Write this run as a JSON report.')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 growth, 0.25 = 25%%.')
+    args = parser.parse_args()
+
+    config = dataclasses.replace(mongo_setup.MongoConfig.from_env(), name=args.db, create_indexes=False,
+                                 backend='memory' if args.backend == 'memory' else 'mongo')
+    counter = connect(args.backend, config)
+
+    report = {'backend': args.backend, 'iterations': args.iterations, 'sizes': {}}
+    try:
+        for size in [int(s) for s in args.sizes.split(',')]:
+            reset(config)
+            seed_dataset(size, args.seed, config)
+            results = run_size(size, args.iterations, args.seed, counter)
+            report['sizes'][str(size)] = {op: dataclasses.asdict(r) for op, r in results.items()}
+            print_results(size, results)
+    finally:
+        if not mongo_setup.use_memory_backend:
+            mongoengine.get_connection(mongo_setup.CORE_ALIAS).drop_database(config.name)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as fout:
+            json.dump(report, fout, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fin:
+            regressions = compare(json.load(fin), report, args.tolerance)
+        if regressions:
+            for r in regressions:
+                print('REGRESSION: ' + r)
+            sys.exit(1)
+        print('No regressions against {}.'.format(args.baseline))
+
+
+def connect(backend: str, config: mongo_setup.MongoConfig):
+    if backend == 'memory':
+        # Never registered: the memory backend sends no commands, so it counts zero.
+        mongo_setup.global_init(config)
+        return RoundTripCounter()
+
+    if backend == 'mongo':
+        counter = RoundTripCounter()
+        monitoring.register(counter)
+        mongo_setup.global_init(config)
+        return counter
+
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit('--backend mock needs mongomock: pip install mongomock')
+
+    mongo_setup.use_bookings_collection = config.separate_bookings
+    mongo_setup.search_alias = mongo_setup.CORE_ALIAS
+    mongoengine.register_connection(alias=mongo_setup.CORE_ALIAS, name=config.name,
+                                    mongo_client_class=mongomock.MongoClient)
+    return MockRoundTripCounter()
+
+
+def reset(config: mongo_setup.MongoConfig):
+    if mongo_setup.use_memory_backend:
+        memory_backend.store.clear()
+    else:
+        mongoengine.get_connection(mongo_setup.CORE_ALIAS).drop_database(config.name)
+    availability.index.clear()
+    svc.owner_cache.clear()
+    svc.cage_search_fields.clear()
+
+
+def seed_dataset(size: int, seed: int, config: mongo_setup.MongoConfig):
+    generator = DatasetGenerator(
+        seed=seed, owners=size, host_ratio=0.2, cages_per_host=5, snakes_per_guest=2,
+        blocks_per_cage=10, booking_density=0.5, venomous_ratio=0.2,
+        start=DATASET_START, separate_bookings=config.separate_bookings,
+        day_calendars=config.day_calendar, owner_summaries=config.owner_summaries)
+
+    writer = MemoryWriter() if mongo_setup.use_memory_backend else MongoWriter(batch_size=5000)
+    try:
+        generator.generate(writer)
+    finally:
+        writer.close()
+
+    if mongo_setup.use_memory_backend:
+        return
+
+    mongo_setup.ensure_indexes()
+    availability.ensure_loaded()
+
+
+def run_size(size: int, iterations: int, seed: int, counter) -> Dict[str, OperationResult]:
+    rng = random.Random(seed)
+
+    hosts, guests, cages, snakes = _sample(1000)
+    hosts = [svc.find_account_by_id(h.id) for h in hosts]
+    guests = [svc.find_account_by_id(g.id) for g in guests]
+
+    def create_account(i):
+        svc.create_account('Benchmark {}'.format(i), 'bench.{}.{}@example.com'.format(size, i))
+
+    def register_cage(i):
+        svc.register_cage(rng.choice(hosts), 'Benchmark cage', True, True, True, 2.0, 10.0)
+
+    def add_available_date(i):
+        svc.add_available_date(rng.choice(cages), _random_day(rng), rng.randint(3, 14))
+
+    def add_snake(i):
+        svc.add_snake(rng.choice(guests), 'Benchmark snake', 1.0, 'Python', False)
+
+    def get_available_cages(i):
+        checkin = _random_day(rng)
+        svc.get_available_cages(checkin, checkin + datetime.timedelta(days=2), rng.choice(snakes))
+
+    # Every booking gets its own far-future block so the bookings never run out.
+    targets = []
+
+    def prepare_booking(i):
+        cage = rng.choice(cages)
+        checkin = datetime.datetime(2100, 1, 1) + datetime.timedelta(days=10 * i)
+        svc.add_available_date(cage, checkin, 5)
+        targets.append((cage, checkin))
+
+    def book_cage(i):
+        cage, checkin = targets[i]
+        svc.book_cage(rng.choice(guests), rng.choice(snakes), cage,
+                      checkin + datetime.timedelta(days=1), checkin + datetime.timedelta(days=3))
+
+    def get_bookings_for_user(i):
+        svc.get_bookings_for_user(rng.choice(guests).email)
+
+    steps = {
+        'create_account': create_account,
+        'register_cage': register_cage,
+        'add_available_date': add_available_date,
+        'add_snake': add_snake,
+        'get_available_cages': get_available_cages,
+        'book_cage': book_cage,
+        'get_bookings_for_user': get_bookings_for_user,
+    }
+
+    for i in range(iterations):
+        prepare_booking(i)
+
+    return {op: measure(steps[op], iterations, counter) for op in OPERATIONS}
+
+
+def _sample(limit: int):
+    """
+        Up to limit hosts, guests, cages and snakes from the seeded dataset.
+    """
+    if mongo_setup.use_memory_backend:
+        store = memory_backend.store
+        return ([o for o in store.owners.values() if o.cage_ids][:limit],
+                [o for o in store.owners.values() if o.snake_ids][:limit],
+                list(store.cages.values())[:limit],
+                list(store.snakes.values())[:limit])
+
+    return (list(Owner.objects(__raw__={'cage_ids.0': {'$exists': True}}).only('id').limit(limit)),
+            list(Owner.objects(__raw__={'snake_ids.0': {'$exists': True}}).only('id', 'email').limit(limit)),
+            list(Cage.objects().only('id', 'name').limit(limit)),
+            list(Snake.objects().limit(limit)))
+
+
+def measure(step: Callable[[int], None], iterations: int, counter) -> OperationResult:
+    latencies: List[float] = []
+    trips = 0
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        before = counter.count
+        t0 = time.perf_counter()
+        step(i)
+        latencies.append(time.perf_counter() - t0)
+        trips += counter.count - before
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return OperationResult(
+        p50_ms=_percentile(latencies, 50) * 1000,
+        p95_ms=_percentile(latencies, 95) * 1000,
+        p99_ms=_percentile(latencies, 99) * 1000,
+        ops_per_sec=iterations / elapsed if elapsed else 0.0,
+        round_trips=trips / iterations,
+    )
+
+
+def compare(baseline: dict, report: dict, tolerance: float) -> List[str]:
+    """
+        Slower p95 beyond the tolerance, or any extra round trips, is a regression.
+        Sizes or operations missing from the baseline are skipped.
+    """
+    regressions = []
+    for size, ops in report['sizes'].items():
+        for op, result in ops.items():
+            base = baseline.get('sizes', {}).get(size, {}).get(op)
+            if not base:
+                continue
+
+            if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append('{} @ {} owners: p95 {:.2f} ms, baseline {:.2f} ms'.format(
+                    op, size, result['p95_ms'], base['p95_ms']))
+            if result['round_trips'] > base['round_trips'] + 0.01:
+                regressions.append('{} @ {} owners: {:.2f} round trips, baseline {:.2f}'.format(
+                    op, size, result['round_trips'], base['round_trips']))
+
+    return regressions
+
+
+def print_results(size: int, results: Dict[str, OperationResult]):
+    print()
+    print('{:,} owners'.format(size))
+    print('  {:<24}{:>10}{:>10}{:>10}{:>12}{:>13}'.format(
+        'operation', 'p50 ms', 'p95 ms', 'p99 ms', 'ops/sec', 'round trips'))
+    for op, r in results.items():
+        print('  {:<24}{:>10.2f}{:>10.2f}{:>10.2f}{:>12,.0f}{:>13.2f}'.format(
+            op, r.p50_ms, r.p95_ms, r.p99_ms, r.ops_per_sec, r.round_trips))
+
+
+def _percentile(values: List[float], pct: int) -> float:
+    if not values:
+        return 0.0
+    rank = max(0, -(-len(values) * pct // 100) - 1)
+    return values[rank]
+
+
+def _random_day(rng: random.Random) -> datetime.datetime:
+    return DATASET_START + datetime.timedelta(days=rng.randint(0, 180))
+
+
+if __name__ == '__main__':
+    main()
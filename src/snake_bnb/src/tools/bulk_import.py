@@ -0,0 +1,60 @@
+"""
+Bulk-load cages, snakes or availability blocks from a CSV or JSON-lines file.
+
+Run from the src folder:
+
+    python -m tools.bulk_import cages --email host@example.com cages.csv
+    python -m tools.bulk_import snakes --email guest@example.com snakes.jsonl
+    python -m tools.bulk_import availability blocks.csv
+
+Columns are the model field names; availability rows take cage_id, check_in_date
+and either check_out_date or days. Rejected rows are listed at the end.
+"""
+import argparse
+import sys
+
+import data.mongo_setup as mongo_setup
+import services.data_service as svc
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import Snake BnB data.')
+    parser.add_argument('kind', choices=['cages', 'snakes', 'availability'])
+    parser.add_argument('file', help='CSV (with header) or JSON-lines file.')
+    parser.add_argument('--email', help='Owner of the cages or snakes.')
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help='Defaults to the file extension.')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.file.endswith(('.jsonl', '.json')) else 'csv')
+
+    mongo_setup.global_init()
+
+    account = None
+    if args.kind != 'availability':
+        account = svc.find_account_by_email(args.email or '')
+        if not account:
+            print('No account with email {}.'.format(args.email))
+            sys.exit(1)
+
+    with open(args.file, newline='', encoding='utf-8') as fin:
+        rows = svc.read_rows(fin, fmt)
+        if args.kind == 'cages':
+            result = svc.bulk_register_cages(account, rows, args.batch_size)
+        elif args.kind == 'snakes':
+            result = svc.bulk_add_snakes(account, rows, args.batch_size)
+        else:
+            result = svc.bulk_add_available_dates(rows, args.batch_size)
+
+    print('Imported {:,} rows in {:.1f}s ({:,.0f} rows/sec), {:,} rejected.'.format(
+        result.inserted, result.seconds, result.rows_per_second, len(result.errors)))
+    for row_number, message in result.errors:
+        print('  row {}: {}'.format(row_number, message))
+
+    if result.errors:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Fail if any query issued by services.data_service would need a collection scan.
+
+Run from the src folder, and only against a dedicated mongod (a throwaway local
+or CI instance), never a shared or production one:
+
+    python -m tools.check_indexes [--db snake_bnb_index_check]
+
+The tool creates a scratch database, builds the declared indexes, turns on the
+server's notablescan parameter (which makes any unindexed query an error) and then
+drives every data_service function in both booking storage modes. notablescan is
+server-wide: while the tool runs, every other database and client on that server
+gets errors for its unindexed queries too. It is set back to its previous value
+and the scratch database dropped afterwards.
+"""
+import argparse
+import dataclasses
+import datetime
+import sys
+from typing import List
+
+import mongoengine
+import pymongo.errors
+
+import data.mongo_setup as mongo_setup
+from services import availability
+import services.data_service as svc
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that every data_service query is served by an index.')
+    parser.add_argument('--db', default='snake_bnb_index_check', help='Scratch database (dropped afterwards).')
+    args = parser.parse_args()
+
+    mongo_setup.global_init(dataclasses.replace(mongo_setup.MongoConfig.from_env(), name=args.db))
+    client = mongoengine.get_connection('core')
+
+    failures = []
+    previous = client.admin.command('getParameter', 1, notablescan=1)['notablescan']
+    try:
+        for separate_bookings in (False, True):
+            client.drop_database(args.db)
+            mongo_setup.use_bookings_collection = separate_bookings
+            mongo_setup.ensure_indexes()
+            availability.index.clear()
+
+            failures.extend(run_workflow(client, separate_bookings))
+    finally:
+        client.admin.command('setParameter', 1, notablescan=previous)
+        client.drop_database(args.db)
+
+    if failures:
+        for f in failures:
+            print('UNINDEXED: ' + f)
+        sys.exit(1)
+
+    print('All data_service queries are served by an index.')
+
+
+def run_workflow(client, separate_bookings: bool) -> List[str]:
+    """
+        Drive data_service with notablescan on. Stops at the first unindexed query
+        since the later steps depend on the data the earlier ones create.
+    """
+    mode = 'collection' if separate_bookings else 'embedded'
+    checkin = datetime.datetime(2030, 1, 5)
+    checkout = datetime.datetime(2030, 1, 8)
+
+    host = svc.create_account('Index Check Host', 'host@index.check')
+    guest = svc.create_account('Index Check Guest', 'guest@index.check')
+
+    # Loading the availability index is a deliberate one-time full read.
+    availability.ensure_loaded()
+
+    previous = client.admin.command('setParameter', 1, notablescan=1)['was']
+    step = None
+
+    def begin(name: str):
+        # Owners cached by an earlier step would hide the step's own owner lookups.
+        nonlocal step
+        step = name
+        svc.owner_cache.clear()
+
+    try:
+        begin('find_account_by_email')
+        svc.find_account_by_email(host.email)
+        begin('register_cage')
+        cage = svc.register_cage(host, 'Check cage', True, True, True, 2.0, 10.0)
+        begin('add_available_date')
+        svc.add_available_date(cage, datetime.datetime(2030, 1, 1), 14)
+        begin('find_cages_for_user')
+        svc.find_cages_for_user(svc.find_account_by_email(host.email))
+        begin('add_snake')
+        snake = svc.add_snake(guest, 'Check snake', 1.0, 'Python', False)
+        begin('get_snakes_for_user')
+        svc.get_snakes_for_user(guest.id)
+        begin('get_available_cages')
+        svc.get_available_cages(checkin, checkout, snake)
+        begin('book_cage')
+        svc.book_cage(guest, snake, cage, checkin, checkout)
+        begin('get_bookings_for_user')
+        svc.get_bookings_for_user(guest.email)
+    except pymongo.errors.OperationFailure as x:
+        return ['{} [{} bookings]: {}'.format(step, mode, x)]
+    finally:
+        client.admin.command('setParameter', 1, notablescan=previous)
+
+    return []
+
+
+if __name__ == '__main__':
+    main()
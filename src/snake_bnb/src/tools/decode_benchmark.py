@@ -0,0 +1,95 @@
+"""
+Compare decoding query results into mongoengine documents versus data.views.
+
+Run from the src folder (no database needed):
+
+    python -m tools.decode_benchmark --cages 5000 --blocks-per-cage 20
+
+Cage and snake documents are built with tools.generate_dataset and encoded to
+BSON, as the server would send them. Each is decoded into documents, into
+views, and for cages into views over RawBSONDocument (MongoConfig.lazy_bookings)
+reading just the fields a search listing shows. The report lists the best time
+of --repeat runs and the memory held by the decoded results (tracemalloc).
+"""
+import argparse
+import datetime
+import time
+import tracemalloc
+from typing import Callable, List
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from data.cages import Cage
+from data.snakes import Snake
+from data.views import CageView, SnakeView
+from tools.generate_dataset import DatasetGenerator
+
+
+class ListWriter:
+    def __init__(self):
+        self.docs = {'owners': [], 'snakes': [], 'cages': [], 'bookings': []}
+
+    def write(self, collection: str, doc):
+        self.docs[collection].append(doc.to_dict() if hasattr(doc, 'to_dict') else doc)
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time documents versus read-only views.')
+    parser.add_argument('--cages', type=int, default=5000)
+    parser.add_argument('--blocks-per-cage', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    cages_per_host = 10
+    generator = DatasetGenerator(
+        seed=args.seed, owners=max(1, args.cages // cages_per_host) * 5, host_ratio=0.2,
+        cages_per_host=cages_per_host, snakes_per_guest=2, blocks_per_cage=args.blocks_per_cage,
+        booking_density=0.5, venomous_ratio=0.2, start=datetime.datetime(2024, 1, 1), separate_bookings=False)
+    writer = ListWriter()
+    generator.generate(writer)
+
+    cages = [bson.encode(d) for d in writer.docs['cages']]
+    snakes = [bson.encode(d) for d in writer.docs['snakes']]
+
+    decoders = (
+        ('Cage document', cages, lambda b: Cage._from_son(bson.decode(b))),
+        ('Cage view', cages, lambda b: CageView(bson.decode(b))),
+        ('Cage lazy view', cages, lambda b: CageView(RawBSONDocument(b))),
+        ('Snake document', snakes, lambda b: Snake._from_son(bson.decode(b))),
+        ('Snake view', snakes, lambda b: SnakeView(bson.decode(b))),
+    )
+
+    print()
+    print('{:<18}{:>8}{:>12}{:>12}'.format('decoded as', 'docs', 'ms', 'KiB'))
+    for name, docs, decode in decoders:
+        ms, kib = measure(decode, docs, args.repeat)
+        print('{:<18}{:>8,}{:>12.1f}{:>12,.0f}'.format(name, len(docs), ms, kib))
+
+
+def measure(decode: Callable[[bytes], object], docs: List[bytes], repeat: int):
+    """
+        Best decode time in ms, and KiB allocated for the decoded list.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        decoded = [decode(d) for d in docs]
+        best = min(best, time.perf_counter() - t0)
+        del decoded
+
+    tracemalloc.start()
+    decoded = [decode(d) for d in docs]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del decoded
+
+    return best * 1000, size / 1024
+
+
+if __name__ == '__main__':
+    main()
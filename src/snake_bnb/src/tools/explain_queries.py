@@ -0,0 +1,197 @@
+"""
+Explain every query shape services.data_service issues and flag the wasteful ones.
+
+Run from the src folder against a database with representative data (e.g. one
+loaded by tools.generate_dataset):
+
+    python -m tools.explain_queries [--max-ratio 10]
+
+Sample owners, cages and dates are picked from the database, then each query is
+explained with executionStats. The report lists the winning plan, the indexes
+used, keys and documents examined versus returned, and whether the sort ran in
+memory. The command exits with 1 if any query examines more than --max-ratio
+times what it returns. Nothing is written to the database.
+"""
+import argparse
+import datetime
+import sys
+from typing import Iterator, List, Optional
+
+import mongoengine
+
+from data.cage_bookings import CageBooking
+from data.cages import Cage
+import data.mongo_setup as mongo_setup
+from data.owners import Owner
+from data.snakes import Snake
+import services.data_service as svc
+
+# Keys under which explain output nests the child stages of a plan stage.
+_CHILD_KEYS = ('inputStage', 'inputStages', 'thenStage', 'elseStage', 'outerStage', 'innerStage')
+
+
+class Sample:
+    """
+        Real ids and dates to plug into the query shapes.
+    """
+
+    def __init__(self):
+        self.host = Owner.objects(__raw__={'cage_ids.0': {'$exists': True}}).first()
+        self.guest = self._guest_with_bookings() or \
+            Owner.objects(__raw__={'snake_ids.0': {'$exists': True}}).first()
+        if not self.host or not self.guest:
+            raise ValueError('The database needs at least one host with cages and one guest with snakes.')
+
+        self.snake = Snake.objects(id__in=self.guest.snake_ids).first()
+        self.cage, self.checkin = self._free_block()
+        self.checkout = self.checkin + datetime.timedelta(days=1)
+
+    def _guest_with_bookings(self) -> Optional[Owner]:
+        if mongo_setup.use_bookings_collection:
+            booking = CageBooking.objects(guest_owner_id__ne=None).only('guest_owner_id').first()
+            guest_id = booking.guest_owner_id if booking else None
+        else:
+            cage = Cage.objects(bookings__guest_owner_id__ne=None).only('bookings').first()
+            guest_id = next((b.guest_owner_id for b in cage.bookings if b.guest_owner_id), None) if cage else None
+
+        return Owner.objects(id=guest_id).first() if guest_id else None
+
+    def _free_block(self):
+        if mongo_setup.use_bookings_collection:
+            block = CageBooking.objects(guest_snake_id=None).first()
+            if block:
+                return Cage.objects(id=block.cage_id).first(), block.check_in_date
+        else:
+            cage = Cage.objects(bookings__guest_snake_id=None).first()
+            if cage:
+                return cage, next(b.check_in_date for b in cage.bookings if not b.guest_snake_id)
+
+        return Cage.objects(id__in=self.host.cage_ids).first(), datetime.datetime.now()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Explain the data_service queries.')
+    parser.add_argument('--max-ratio', type=float, default=10.0,
+                        help='Fail if a query examines more than this many keys or documents per result.')
+    args = parser.parse_args()
+
+    config = mongo_setup.MongoConfig.from_env()
+    config.create_indexes = False
+    mongo_setup.global_init(config)
+
+    try:
+        sample = Sample()
+    except ValueError as x:
+        print(x)
+        sys.exit(2)
+
+    plans = [summarize(name, explain) for name, explain in explain_all(sample)]
+    print_plans(plans)
+
+    failures = [p for p in plans if p['ratio'] > args.max_ratio]
+    if failures:
+        print()
+        for p in failures:
+            print('TOO MANY EXAMINED: {} examines {:.1f}x what it returns.'.format(p['name'], p['ratio']))
+        sys.exit(1)
+
+
+def explain_all(sample: Sample) -> Iterator[tuple]:
+    """
+        (name, explain output) for each query shape, mirroring data_service.
+        The one-time full read that loads the availability index is left out.
+    """
+    yield 'find_account_by_email', Owner.objects(email=sample.guest.email).explain()
+    yield 'find_account_by_id', Owner.objects(id=sample.guest.id).explain()
+    yield 'find_cages_for_user', Cage.objects(id__in=sample.host.cage_ids).order_by('id').explain()
+    if mongo_setup.use_bookings_collection:
+        yield 'find_cages_for_user [bookings]', \
+            CageBooking.objects(cage_id__in=sample.host.cage_ids).order_by('check_in_date').explain()
+    yield 'add_available_date', Cage.objects(id=sample.cage.id).explain()
+    yield 'get_snakes_for_user', Snake.objects(id__in=sample.guest.snake_ids).explain()
+
+    query = svc._available_cages_query(sample.checkin, sample.checkout, sample.snake)
+    if query is not None:
+        yield 'get_available_cages', Cage._get_collection().find(query, sort=svc.AVAILABLE_CAGES_ORDER).explain()
+
+    if mongo_setup.use_bookings_collection:
+        yield 'book_cage', CageBooking.objects(
+            cage_id=sample.cage.id,
+            check_in_date__lte=sample.checkin,
+            check_out_date__gte=sample.checkout,
+            guest_snake_id=None
+        ).explain()
+    else:
+        yield 'book_cage', Cage.objects(id=sample.cage.id, bookings__match={
+            'check_in_date__lte': sample.checkin,
+            'check_out_date__gte': sample.checkout,
+            'guest_snake_id': None
+        }).explain()
+
+    model = CageBooking if mongo_setup.use_bookings_collection else Cage
+    db = mongoengine.get_db(mongo_setup.CORE_ALIAS)
+    yield 'get_bookings_for_user', db.command(
+        'explain',
+        {'aggregate': model._get_collection_name(),
+         'pipeline': svc.guest_bookings_pipeline(sample.guest.id),
+         'cursor': {}},
+        verbosity='executionStats')
+
+
+def summarize(name: str, explain: dict) -> dict:
+    """
+        Plan, indexes, counters and sort from find or aggregate explain output, with
+        or without a $cursor stage, for both the classic and the slot-based engine.
+    """
+    stages = explain.get('stages') or []
+    cursor = stages[0]['$cursor'] if stages and '$cursor' in stages[0] else explain
+
+    winning = cursor.get('queryPlanner', {}).get('winningPlan', {})
+    winning = winning.get('queryPlan', winning)
+    nodes = list(_plan_nodes(winning))
+    stats = cursor.get('executionStats', {})
+
+    keys = stats.get('totalKeysExamined', 0)
+    docs = stats.get('totalDocsExamined', 0)
+    returned = stats.get('nReturned', 0)
+    for stage in stages[1:]:
+        docs += stage.get('totalDocsExamined', 0)
+        keys += stage.get('totalKeysExamined', 0)
+
+    in_memory_sort = any(n['stage'] == 'SORT' for n in nodes) or any('$sort' in s for s in stages[1:])
+
+    return {
+        'name': name,
+        'plan': ' > '.join(n['stage'] for n in nodes),
+        'indexes': sorted({n['indexName'] for n in nodes if 'indexName' in n}),
+        'keys_examined': keys,
+        'docs_examined': docs,
+        'returned': returned,
+        'ratio': max(keys, docs) / max(returned, 1),
+        'in_memory_sort': in_memory_sort,
+    }
+
+
+def print_plans(plans: List[dict]):
+    print('{:<32}{:>8}{:>8}{:>10}{:>8}  {:<8}{}'.format(
+        'query', 'keys', 'docs', 'returned', 'ratio', 'sort', 'plan [indexes]'))
+    for p in plans:
+        print('{:<32}{:>8}{:>8}{:>10}{:>8.1f}  {:<8}{} [{}]'.format(
+            p['name'], p['keys_examined'], p['docs_examined'], p['returned'], p['ratio'],
+            'memory' if p['in_memory_sort'] else '-', p['plan'], ', '.join(p['indexes'])))
+
+
+def _plan_nodes(node: dict) -> Iterator[dict]:
+    if not node or 'stage' not in node:
+        return
+
+    yield node
+    for key in _CHILD_KEYS:
+        child = node.get(key)
+        for c in child if isinstance(child, list) else [child]:
+            if c:
+                yield from _plan_nodes(c)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,382 @@
+"""
+Generate a reproducible synthetic Snake BnB dataset for scale testing.
+
+Run from the src folder:
+
+    python -m tools.generate_dataset --owners 100000 --cages-per-host 20 \
+        --blocks-per-cage 50 --booking-density 0.6 --seed 42 --out mongo
+    python -m tools.generate_dataset --owners 1000 --out jsonl --dir ./dataset
+
+Owners, cages and snakes are built through the data.* models so they match what
+the app writes. The same seed always produces the same documents, ids included.
+--out mongo bulk-inserts into the configured database (see data.mongo_setup);
+jsonl and bson write one file per collection for mongoimport / mongorestore.
+Bookings follow the configured storage mode (embedded or the bookings collection)
+and come out as add_available_date and book_cage would leave them. With
+day calendars or owner summaries on, cages get their calendars and every owner
+their summary too.
+Running app processes pick up --out mongo data on their next search; after a
+mongoimport / mongorestore, restart them (see services.availability.ChangeTracker).
+"""
+import argparse
+import collections
+import datetime
+import os
+import random
+import struct
+from typing import Dict, List, Tuple
+
+import bson
+from bson import json_util
+from tqdm import tqdm
+
+from data.cage_bookings import CageBooking
+from data.cages import Cage
+import data.mongo_setup as mongo_setup
+from data.owner_summaries import OwnerSummary
+from data.owners import Owner
+from data.snakes import Snake
+from data.views import BookingView, CageView, SnakeView
+from services import availability, day_calendar, owner_summary
+
+FIRST_NAMES = ['Ada', 'Ben', 'Chloe', 'Dev', 'Elena', 'Femi', 'Grace', 'Hiro', 'Ines', 'Jonas',
+               'Kara', 'Liam', 'Maya', 'Nikhil', 'Olga', 'Pablo', 'Quinn', 'Rosa', 'Sami', 'Tara']
+LAST_NAMES = ['Adams', 'Berg', 'Chen', 'Diaz', 'Evans', 'Fischer', 'Garcia', 'Haddad', 'Ito', 'Jones',
+              'Kim', 'Lopez', 'Moreau', 'Novak', 'Okafor', 'Patel', 'Rossi', 'Silva', 'Tanaka', 'Weber']
+CAGE_WORDS = ['Sunny', 'Cozy', 'Royal', 'Jungle', 'Desert', 'Tropical', 'Quiet', 'Deluxe', 'Rocky', 'Mossy']
+CAGE_KINDS = ['Den', 'Loft', 'Terrarium', 'Suite', 'Hideaway', 'Burrow', 'Retreat', 'Lodge']
+SPECIES = [('Ball python', False), ('Corn snake', False), ('Boa constrictor', False),
+           ('King snake', False), ('Milk snake', False), ('Green tree python', False),
+           ('Rattlesnake', True), ('Cobra', True), ('Black mamba', True), ('Copperhead', True)]
+SNAKE_NAMES = ['Monty', 'Sir Hiss', 'Kaa', 'Noodle', 'Slinky', 'Nagini', 'Ziggy', 'Pretzel', 'Mango', 'Basil']
+
+COLLECTIONS = ('owners', 'snakes', 'cages', 'bookings', 'owner_summaries')
+
+
+class DatasetGenerator:
+    def __init__(self, seed: int, owners: int, host_ratio: float, cages_per_host: int,
+                 snakes_per_guest: int, blocks_per_cage: int, booking_density: float,
+                 venomous_ratio: float, start: datetime.datetime, separate_bookings: bool,
+                 day_calendars: bool = False, owner_summaries: bool = False):
+        self.rng = random.Random(seed)
+        self.owners = owners
+        self.host_ratio = host_ratio
+        self.cages_per_host = cages_per_host
+        self.snakes_per_guest = snakes_per_guest
+        self.blocks_per_cage = blocks_per_cage
+        self.booking_density = booking_density
+        self.venomous_ratio = venomous_ratio
+        self.start = start
+        self.separate_bookings = separate_bookings
+        self.day_calendars = day_calendars
+        self.owner_summaries = owner_summaries
+
+        self._counter = 0
+        self._id_time = int(start.replace(tzinfo=datetime.timezone.utc).timestamp())
+        self.guests: List[Tuple[bson.ObjectId, List[Tuple[bson.ObjectId, bool]]]] = []
+
+        # With owner_summaries, what the guests' summaries need once every host is written.
+        self._snake_views: Dict[bson.ObjectId, SnakeView] = {}
+        self._guest_bookings: Dict[bson.ObjectId, List[BookingView]] = collections.defaultdict(list)
+
+    def generate(self, writer):
+        host_count = int(self.owners * self.host_ratio)
+        guest_count = self.owners - host_count
+
+        for idx in tqdm(range(guest_count), unit='guest'):
+            self._write_guest(writer, idx)
+
+        for idx in tqdm(range(host_count), unit='host'):
+            self._write_host(writer, guest_count + idx)
+
+        if self.owner_summaries:
+            for owner_id, snakes in self.guests:
+                summary = owner_summary.summarize(owner_id, len(snakes), [], self._guest_bookings.pop(owner_id, []))
+                writer.write('owner_summaries', summary.to_mongo())
+
+    def _write_guest(self, writer, idx: int):
+        owner_id = self._next_id()
+        snakes = []
+        for _ in range(self.rng.randint(1, max(1, self.snakes_per_guest))):
+            snake = self._snake()
+            writer.write('snakes', snake.to_mongo())
+            snakes.append((snake.id, snake.is_venomous))
+            if self.owner_summaries:
+                self._snake_views[snake.id] = SnakeView({'_id': snake.id, 'name': snake.name})
+
+        owner = self._owner(owner_id, idx)
+        owner.snake_ids = [s[0] for s in snakes]
+        writer.write('owners', owner.to_mongo())
+
+        self.guests.append((owner_id, snakes))
+
+    def _write_host(self, writer, idx: int):
+        owner_id = self._next_id()
+        cage_ids = []
+        cages = []
+        for _ in range(self.cages_per_host):
+            cage = self._cage()
+            bookings = self._bookings()
+            if self.day_calendars:
+                day_calendar.fill(cage, [(b['check_in_date'], b['check_out_date'])
+                                         for b in bookings if 'guest_snake_id' not in b])
+            doc = cage.to_mongo()
+            if self.owner_summaries:
+                cages.append(self._summarized(doc, bookings))
+
+            if self.separate_bookings:
+                for b in bookings:
+                    b['_id'] = self._next_id()
+                    b['cage_id'] = cage.id
+                    writer.write('bookings', b)
+            else:
+                doc['bookings'] = bookings
+
+            writer.write('cages', doc)
+            cage_ids.append(cage.id)
+
+        owner = self._owner(owner_id, idx)
+        owner.cage_ids = cage_ids
+        writer.write('owners', owner.to_mongo())
+        if self.owner_summaries:
+            writer.write('owner_summaries', owner_summary.summarize(owner_id, 0, cages, []).to_mongo())
+
+    def _summarized(self, doc: dict, bookings: List[dict]) -> CageView:
+        """
+            The cage as its host's summary reads it; its stays are kept for the guests' summaries.
+        """
+        cage = CageView(dict(doc, bookings=bookings))
+        named = CageView({'_id': cage.id, 'name': cage.name})
+        for b in cage.bookings:
+            if b.guest_owner_id:
+                b.cage = named
+                b.snake = self._snake_views.get(b.guest_snake_id)
+                self._guest_bookings[b.guest_owner_id].append(b)
+        return cage
+
+    def _owner(self, owner_id: bson.ObjectId, idx: int) -> Owner:
+        first = self.rng.choice(FIRST_NAMES)
+        last = self.rng.choice(LAST_NAMES)
+
+        owner = Owner(id=owner_id, name='{} {}'.format(first, last),
+                      email='{}.{}.{}@example.com'.format(first, last, idx).lower(),
+                      registered_date=self._registered_date())
+        owner.validate()
+        return owner
+
+    def _snake(self) -> Snake:
+        venomous = self.rng.random() < self.venomous_ratio
+        species = self.rng.choice([s for s, v in SPECIES if v == venomous])
+
+        snake = Snake(id=self._next_id(), name=self.rng.choice(SNAKE_NAMES), species=species,
+                      length=round(self.rng.uniform(0.3, 6.0), 2), is_venomous=venomous,
+                      registered_date=self._registered_date())
+        snake.validate()
+        return snake
+
+    def _cage(self) -> Cage:
+        cage = Cage(id=self._next_id(),
+                    name='{} {}'.format(self.rng.choice(CAGE_WORDS), self.rng.choice(CAGE_KINDS)),
+                    price=round(self.rng.uniform(5, 100), 2),
+                    square_meters=round(self.rng.uniform(0.5, 10), 1),
+                    is_carpeted=self.rng.random() < 0.5,
+                    has_toys=self.rng.random() < 0.5,
+                    allow_dangerous_snakes=self.rng.random() < 0.3,
+                    registered_date=self._registered_date())
+        cage.validate()
+        return cage
+
+    def _bookings(self) -> List[dict]:
+        """
+            Back-to-back availability blocks with random gaps, a booking_density share
+            of them booked by a random guest. Built with the same merge and split as
+            add_available_date and book_cage: blocks that touch are one free block, and
+            the days of a block around its stay are left free.
+        """
+        # Bookings are plain dicts in data.bookings.Booking's field layout: building
+        # millions of EmbeddedDocuments would dominate the run time.
+        blocks = []
+        stays = []
+        day = self.start + datetime.timedelta(days=self.rng.randint(0, 30))
+        for _ in range(self.blocks_per_cage):
+            check_in = day
+            check_out = check_in + datetime.timedelta(days=self.rng.randint(3, 30))
+            blocks.append((check_in, check_out))
+
+            if self.guests and self.rng.random() < self.booking_density:
+                guest_id, snakes = self.rng.choice(self.guests)
+                snake_id, _ = self.rng.choice(snakes)
+                stay_in = check_in + datetime.timedelta(days=self.rng.randint(0, 2))
+                stays.append({
+                    'guest_owner_id': guest_id,
+                    'guest_snake_id': snake_id,
+                    'booked_date': stay_in - datetime.timedelta(days=self.rng.randint(1, 60)),
+                    'check_in_date': stay_in,
+                    'check_out_date': max(stay_in + datetime.timedelta(days=1),
+                                          check_out - datetime.timedelta(days=self.rng.randint(0, 2))),
+                    'rating': self.rng.randint(0, 5),
+                })
+
+            day = check_out + datetime.timedelta(days=self.rng.randint(0, 10))
+
+        free, _ = availability.coalesce_all([], blocks)
+        taken = [(b['check_in_date'], b['check_out_date']) for b in stays]
+        bookings = [{'check_in_date': check_in, 'check_out_date': check_out, 'rating': 0}
+                    for check_in, check_out in availability.subtract(free, taken)]
+
+        bookings.extend(stays)
+        bookings.sort(key=lambda b: b['check_in_date'])
+        return bookings
+
+    def _registered_date(self) -> datetime.datetime:
+        return self.start - datetime.timedelta(seconds=self.rng.randint(0, 3 * 365 * 24 * 3600))
+
+    def _next_id(self) -> bson.ObjectId:
+        self._counter += 1
+        return bson.ObjectId(struct.pack('>IQ', self._id_time, self._counter))
+
+
+class MongoWriter:
+    """
+        Buffers documents per collection and flushes them with unordered insert_many.
+        Once everything is written, the new cages get the availability stamp so
+        running processes add them to their availability indexes.
+    """
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.collections = {
+            'owners': Owner._get_collection(),
+            'snakes': Snake._get_collection(),
+            'cages': Cage._get_collection(),
+            'bookings': CageBooking._get_collection(),
+            'owner_summaries': OwnerSummary._get_collection(),
+        }
+        self.buffers = {name: [] for name in COLLECTIONS}
+        self.cage_ids = []
+
+    def write(self, collection: str, doc):
+        buffer = self.buffers[collection]
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            self._flush(collection)
+
+    def close(self):
+        for name in COLLECTIONS:
+            self._flush(name)
+
+        for i in range(0, len(self.cage_ids), self.batch_size):
+            ids = self.cage_ids[i:i + self.batch_size]
+            self.collections['cages'].update_many({'_id': {'$in': ids}}, availability.STAMP)
+        self.cage_ids = []
+
+    def _flush(self, collection: str):
+        if self.buffers[collection]:
+            if collection == 'cages':
+                self.cage_ids.extend(doc['_id'] for doc in self.buffers[collection])
+            self.collections[collection].insert_many(self.buffers[collection], ordered=False)
+            self.buffers[collection] = []
+
+
+class MemoryWriter:
+    """
+        Loads the documents into services.memory_backend.store (MongoConfig.backend = 'memory').
+        Cages are loaded before the bookings collection records that refer to them.
+    """
+
+    def __init__(self):
+        self.buffers = {name: [] for name in COLLECTIONS}
+
+    def write(self, collection: str, doc):
+        self.buffers[collection].append(doc)
+
+    def close(self):
+        from services import memory_backend
+
+        # The memory backend computes owner summaries on read.
+        for name in COLLECTIONS[:-1]:
+            memory_backend.store.load_documents(name, self.buffers[name])
+        self.buffers = {name: [] for name in COLLECTIONS}
+
+
+class FileWriter:
+    """
+        One file per collection: Extended JSON lines (mongoimport) or concatenated
+        BSON (mongorestore).
+    """
+
+    def __init__(self, folder: str, fmt: str):
+        os.makedirs(folder, exist_ok=True)
+        self.fmt = fmt
+        mode = 'wb' if fmt == 'bson' else 'w'
+        self.files = {
+            name: open(os.path.join(folder, '{}.{}'.format(name, fmt)), mode)
+            for name in COLLECTIONS
+        }
+
+    def write(self, collection: str, doc):
+        if self.fmt == 'bson':
+            self.files[collection].write(bson.encode(doc))
+        else:
+            self.files[collection].write(json_util.dumps(doc) + '\n')
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Snake BnB dataset.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--owners', type=int, default=1000)
+    parser.add_argument('--host-ratio', type=float, default=0.2, help='Share of owners who host cages.')
+    parser.add_argument('--cages-per-host', type=int, default=5)
+    parser.add_argument('--snakes-per-guest', type=int, default=2, help='Up to this many snakes each.')
+    parser.add_argument('--blocks-per-cage', type=int, default=20)
+    parser.add_argument('--booking-density', type=float, default=0.5, help='Share of blocks that are booked.')
+    parser.add_argument('--venomous-ratio', type=float, default=0.2)
+    parser.add_argument('--start', default='2024-01-01', help='First availability date [yyyy-mm-dd].')
+    parser.add_argument('--out', choices=['mongo', 'jsonl', 'bson'], default='mongo')
+    parser.add_argument('--dir', default='dataset', help='Output folder for jsonl / bson.')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--drop', action='store_true', help='Drop the existing collections first (mongo only).')
+    args = parser.parse_args()
+
+    config = mongo_setup.MongoConfig.from_env()
+    if args.out == 'mongo':
+        config.create_indexes = False
+        mongo_setup.global_init(config)
+        writer = MongoWriter(args.batch_size)
+        if args.drop:
+            for collection in writer.collections.values():
+                collection.drop()
+    else:
+        writer = FileWriter(args.dir, args.out)
+
+    generator = DatasetGenerator(
+        seed=args.seed,
+        owners=args.owners,
+        host_ratio=args.host_ratio,
+        cages_per_host=args.cages_per_host,
+        snakes_per_guest=args.snakes_per_guest,
+        blocks_per_cage=args.blocks_per_cage,
+        booking_density=args.booking_density,
+        venomous_ratio=args.venomous_ratio,
+        start=datetime.datetime.strptime(args.start, '%Y-%m-%d'),
+        separate_bookings=config.separate_bookings,
+        day_calendars=config.day_calendar,
+        owner_summaries=config.owner_summaries,
+    )
+
+    try:
+        generator.generate(writer)
+    finally:
+        writer.close()
+
+    if args.out == 'mongo':
+        # Building indexes once after the load is much faster than maintaining them during it.
+        mongo_setup.ensure_indexes()
+
+
+if __name__ == '__main__':
+    main()
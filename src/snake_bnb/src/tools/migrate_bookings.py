@@ -0,0 +1,106 @@
+"""
+Move bookings embedded in cage documents into the top-level 'bookings' collection.
+
+Run from the src folder:
+
+    python -m tools.migrate_bookings [--batch-size 500] [--keep-embedded]
+
+Cages are processed in batches: their bookings are upserted with one unordered
+bulk write and then removed from the cages with another. Each record's _id is
+derived from its cage and check-in date, so re-running the tool after a partial
+failure, or with --keep-embedded, rewrites the same records instead of adding
+copies; records of a re-run cage that no longer match its embedded bookings are
+removed. A cage's array is only cleared if it still holds the bookings that were
+copied; cages changed in the meantime keep theirs for the next run.
+
+Switch the app to the bookings collection only once the migration is complete.
+"""
+import argparse
+import collections
+import dataclasses
+import hashlib
+
+import bson
+from pymongo import ReplaceOne, UpdateOne
+from tqdm import tqdm
+
+from data.cage_bookings import CageBooking
+from data.cages import Cage
+import data.mongo_setup as mongo_setup
+from services import availability
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Move embedded cage bookings into the bookings collection.')
+    parser.add_argument('--batch-size', type=int, default=500, help='Cages per bulk write.')
+    parser.add_argument('--keep-embedded', action='store_true',
+                        help='Copy the bookings but leave them in the cage documents.')
+    args = parser.parse_args()
+
+    mongo_setup.global_init(dataclasses.replace(mongo_setup.MongoConfig.from_env(), separate_bookings=True))
+    migrated = migrate(args.batch_size, args.keep_embedded)
+    print(f'Migrated {migrated:,} bookings.')
+
+
+def migrate(batch_size: int = 500, keep_embedded: bool = False) -> int:
+    CageBooking.ensure_indexes()
+
+    query = Cage.objects(bookings__0__exists=True).only('id', 'bookings').as_pymongo()
+    total = query.count()
+
+    migrated = 0
+    batch = []
+    with tqdm(total=total, unit='cage') as progress:
+        for cage in query.no_cache():
+            batch.append(cage)
+            if len(batch) >= batch_size:
+                migrated += _migrate_batch(batch, keep_embedded)
+                progress.update(len(batch))
+                batch = []
+
+        if batch:
+            migrated += _migrate_batch(batch, keep_embedded)
+            progress.update(len(batch))
+
+    return migrated
+
+
+def _migrate_batch(cages, keep_embedded: bool) -> int:
+    collection = CageBooking._get_collection()
+
+    ops, record_ids = [], []
+    for cage in cages:
+        occurrences = collections.Counter()
+        for booking in cage['bookings']:
+            check_in = booking['check_in_date']
+            record_id = _record_id(cage['_id'], check_in, occurrences[check_in])
+            occurrences[check_in] += 1
+            record_ids.append(record_id)
+            ops.append(ReplaceOne({'_id': record_id}, dict(booking, _id=record_id, cage_id=cage['_id']), upsert=True))
+
+    cage_ids = [c['_id'] for c in cages]
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    # Left by an earlier run from bookings that have changed since.
+    collection.delete_many({'cage_id': {'$in': cage_ids}, '_id': {'$nin': record_ids}})
+
+    if not keep_embedded:
+        Cage._get_collection().bulk_write([
+            UpdateOne({'_id': c['_id'], 'bookings': c['bookings']},
+                      dict({'$set': {'bookings': []}}, **availability.STAMP))
+            for c in cages
+        ], ordered=False)
+
+    return len(ops)
+
+
+def _record_id(cage_id: bson.ObjectId, check_in, occurrence: int) -> bson.ObjectId:
+    """
+        The same _id for the same embedded booking on every run.
+    """
+    key = '{}:{}:{}'.format(cage_id, check_in.isoformat(), occurrence).encode()
+    return bson.ObjectId(hashlib.sha1(key).digest()[:12])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""
+Recompute the per-day free calendar of every cage (see services.day_calendar).
+
+Run from the src folder after turning on SNAKE_BNB_DAY_CALENDAR for existing data:
+
+    python -m tools.rebuild_calendars
+"""
+import argparse
+
+import data.mongo_setup as mongo_setup
+from services import day_calendar
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the cages\' free-day calendars.')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    mongo_setup.global_init()
+
+    count = day_calendar.rebuild_all(args.batch_size)
+    print('Rebuilt the calendars of {:,} cages.'.format(count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""
+Recompute every owner's dashboard summary (see services.owner_summary).
+
+Run from the src folder after turning on SNAKE_BNB_OWNER_SUMMARIES for existing
+data, or to repair summaries that drifted:
+
+    python -m tools.rebuild_summaries
+"""
+import argparse
+
+import data.mongo_setup as mongo_setup
+import services.data_service as svc
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rebuild the owners\' dashboard summaries.')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    mongo_setup.global_init()
+    if mongo_setup.use_memory_backend:
+        parser.error('the memory backend computes summaries on read; there is nothing to rebuild')
+
+    count = svc.rebuild_owner_summaries(args.batch_size)
+    print('Rebuilt the summaries of {:,} owners.'.format(count))
+
+
+if __name__ == '__main__':
+    main()